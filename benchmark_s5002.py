@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Benchmark do parse de XMLs S-5002
+
+Mede S5002Parser.parse() (parse completo) e, separadamente, só a extração
+(_parse_trabalhador sobre árvores já carregadas) em três corpora, com cada
+backend de parse disponível (xml.etree e, quando instalado, lxml):
+- exemplos_2025: os 30 XMLs de exemplo (um trabalhador por arquivo)
+- lotes: arquivos sintéticos com vários trabalhadores cada (gerador_xml_s5002_v6)
+- complemento: um trabalhador com infoIRComplem grande (ideDep, planSaude, infoIRCR)
+
+Em seguida mede a memória retida (tracemalloc) por comprovante parseado em
+um corpus por nível de complexidade do gerador (simples ... muito_complexo).
+
+Uso:
+    python benchmark_s5002.py
+    python benchmark_s5002.py --repeticoes 5 --trabalhadores 2000 --grupos 500
+    python benchmark_s5002.py --backend etree
+"""
+
+import argparse
+import gc
+import logging
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import gerador_xml_s5002_v6 as gerador
+import s5002_to_pdf
+from s5002_to_pdf import LEIAUTES, S5002Parser, lxml_etree
+
+RAIZ = Path(__file__).resolve().parent
+
+
+def _evento(xml: str) -> str:
+    """Trecho <evtIrrfBenef>...</evtIrrfBenef> de um XML gerado"""
+    inicio = xml.index('<evtIrrfBenef')
+    fim = xml.index('</evtIrrfBenef>') + len('</evtIrrfBenef>')
+    return xml[inicio:fim]
+
+
+def _namespace(xml: str) -> str:
+    """Namespace padrão declarado no elemento raiz de um XML gerado"""
+    return xml.split('xmlns="', 1)[1].split('"', 1)[0]
+
+
+def gerar_corpus(destino: Path, trabalhadores: int, por_lote: int, grupos: int) -> Dict[str, List[Path]]:
+    """Gera os corpora em `destino` e retorna os arquivos de cada um"""
+    random.seed(gerador.ANO)
+    corpora: Dict[str, List[Path]] = {}
+
+    # exemplos_2025 (usados no lugar)
+    corpora['exemplos_2025'] = sorted((RAIZ / 'exemplos_2025').glob('*.xml'))
+
+    # Lotes com vários trabalhadores por arquivo
+    pasta = destino / 'lotes'
+    pasta.mkdir()
+    niveis = list(gerador.COMPLEXIDADES)
+    eventos = []
+    ns = None
+    for i in range(trabalhadores):
+        cpf = gerador.gerar_cpf(20000000000 + i * 10)
+        xml = gerador.gerar_xml_trabalhador(cpf, f"Funcionário {i}", gerador.EMPRESAS[i % len(gerador.EMPRESAS)],
+                                            niveis[i % len(niveis)], i)
+        ns = ns or _namespace(xml)
+        eventos.append(_evento(xml))
+    for n, inicio in enumerate(range(0, len(eventos), por_lote)):
+        conteudo = (f'<?xml version="1.0" encoding="UTF-8"?>\n'
+                    f'<eSocial xmlns="{ns}">\n<loteEventos>\n'
+                    + '\n'.join(eventos[inicio:inicio + por_lote])
+                    + '\n</loteEventos>\n</eSocial>\n')
+        (pasta / f'lote_{n:03d}.xml').write_text(conteudo, encoding='utf-8')
+    corpora['lotes'] = sorted(pasta.glob('*.xml'))
+
+    # Um trabalhador com infoIRComplem grande
+    pasta = destino / 'complemento'
+    pasta.mkdir()
+    xml = gerador.gerar_xml_trabalhador(
+        '30000000000', 'Funcionário Complexo', gerador.EMPRESAS[0], 'muito_complexo', 0)
+    abre = xml.index('<infoIRComplem>') + len('<infoIRComplem>')
+    fecha = xml.index('</infoIRComplem>')
+    xml = xml[:abre] + xml[abre:fecha] * grupos + xml[fecha:]
+    (pasta / 'complemento.xml').write_text(xml, encoding='utf-8')
+    corpora['complemento'] = [pasta / 'complemento.xml']
+
+    return corpora
+
+
+def gerar_corpus_memoria(destino: Path, trabalhadores: int) -> Dict[str, List[Path]]:
+    """Um corpus por nível de complexidade do gerador, um trabalhador por arquivo"""
+    random.seed(gerador.ANO)
+    corpora: Dict[str, List[Path]] = {}
+    for nivel in gerador.COMPLEXIDADES:
+        pasta = destino / f'memoria_{nivel}'
+        pasta.mkdir()
+        for i in range(trabalhadores):
+            cpf = gerador.gerar_cpf(40000000000 + i * 10)
+            xml = gerador.gerar_xml_trabalhador(cpf, f"Funcionário {i}", gerador.EMPRESAS[i % len(gerador.EMPRESAS)],
+                                                nivel, i)
+            (pasta / f'{cpf}.xml').write_text(xml, encoding='utf-8')
+        corpora[nivel] = sorted(pasta.glob('*.xml'))
+    return corpora
+
+
+def medir_memoria(arquivos: List[Path]) -> Tuple[int, int]:
+    """Bytes retidos pelos comprovantes do corpus (mantidos em memória, como na consolidação)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        antes = tracemalloc.get_traced_memory()[0]
+        comprovantes = [c for arquivo in arquivos for c in S5002Parser(str(arquivo)).parse()]
+        gc.collect()
+        retidos = tracemalloc.get_traced_memory()[0] - antes
+    finally:
+        tracemalloc.stop()
+    return retidos, len(comprovantes)
+
+
+def medir_parse(arquivos: List[Path], repeticoes: int, backend: str) -> Tuple[float, int]:
+    """Melhor tempo de parse do corpus inteiro e o número de comprovantes"""
+    melhor = float('inf')
+    comprovantes = 0
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        comprovantes = sum(len(S5002Parser(str(arquivo), backend).parse()) for arquivo in arquivos)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, comprovantes
+
+
+def medir_extracao(arquivos: List[Path], repeticoes: int, backend: str) -> float:
+    """Melhor tempo de _parse_trabalhador sobre árvores já parseadas (sem I/O nem tokenização)"""
+    modulo = lxml_etree if backend == 'lxml' else ET
+    parser = S5002Parser('', backend)
+    parser._per_apur = f"{gerador.ANO}-12"
+    trabalhadores = []
+    for arquivo in arquivos:
+        raiz = modulo.parse(str(arquivo)).getroot()
+        for tags in LEIAUTES.values():
+            trabalhadores.extend((tags, elem) for elem in raiz.iter(tags.ide_trabalhador))
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        for tags, elem in trabalhadores:
+            parser._tags = tags
+            parser._parse_trabalhador(elem)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do parse de XMLs S-5002')
+    parser.add_argument('--repeticoes', type=int, default=5,
+                        help='Repetições por corpus; vale o melhor tempo (padrão: 5)')
+    parser.add_argument('--trabalhadores', type=int, default=2000,
+                        help='Trabalhadores no corpus de lotes (padrão: 2000)')
+    parser.add_argument('--por-lote', type=int, default=500,
+                        help='Trabalhadores por arquivo de lote (padrão: 500)')
+    parser.add_argument('--grupos', type=int, default=500,
+                        help='Repetições do conteúdo de infoIRComplem no corpus complemento (padrão: 500)')
+    parser.add_argument('--memoria-trabalhadores', type=int, default=200,
+                        help='Trabalhadores por nível de complexidade no teste de memória (padrão: 200)')
+    parser.add_argument('--backend', choices=('todos', 'lxml', 'etree'), default='todos',
+                        help='Backend de parse medido (padrão: todos os disponíveis)')
+    args = parser.parse_args()
+
+    backends = ['etree', 'lxml'] if args.backend == 'todos' else [args.backend]
+    if lxml_etree is None and 'lxml' in backends:
+        print("lxml não está instalado; medindo só xml.etree")
+        backends = ['etree']
+
+    # Avisos de alias/valores inválidos não interessam aqui
+    s5002_to_pdf.logger.setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory(prefix='bench_s5002_') as tmp:
+        corpora = gerar_corpus(Path(tmp), args.trabalhadores, args.por_lote, args.grupos)
+
+        print(f"s5002_to_pdf {s5002_to_pdf.__version__} | Python {sys.version.split()[0]} | "
+              f"melhor de {args.repeticoes}")
+        print(f"{'corpus':<15} {'backend':<7} {'arquivos':>8} {'MB':>8} {'comprov.':>9} "
+              f"{'parse (s)':>10} {'MB/s':>8} {'extração (s)':>13}")
+        for nome, arquivos in corpora.items():
+            tamanho = sum(arquivo.stat().st_size for arquivo in arquivos) / (1024 * 1024)
+            for backend in backends:
+                tempo, comprovantes = medir_parse(arquivos, args.repeticoes, backend)
+                extracao = medir_extracao(arquivos, args.repeticoes, backend)
+                print(f"{nome:<15} {backend:<7} {len(arquivos):>8} {tamanho:>8.2f} {comprovantes:>9} "
+                      f"{tempo:>10.3f} {tamanho / tempo:>8.1f} {extracao:>13.3f}")
+
+        print()
+        print(f"{'complexidade':<15} {'comprov.':>9} {'KB retidos':>11} {'bytes/comprov.':>15}")
+        for nivel, arquivos in gerar_corpus_memoria(Path(tmp), args.memoria_trabalhadores).items():
+            retidos, comprovantes = medir_memoria(arquivos)
+            print(f"{nivel:<15} {comprovantes:>9} {retidos / 1024:>11.1f} {retidos // max(comprovantes, 1):>15}")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,27 +7,50 @@ com TODOS os 33 grupos/subgrupos do e-Social S-1.3
 
 Versão: 6.2.1
 Data: 31/10/2025
-Correções: Sistema de convergência para paginação 100% correta
-Hotfix: Bug "Página 3 de 2" corrigido com loop de convergência
+Paginação: passagem única; o comprovante é medido em memória (LayoutPaginado)
+e emitido já com "Página X de Y" exato, ou, com --paginacao xobject, o total
+é um form XObject preenchido no save()
 Licença: MIT
 """
 
+__version__ = '6.2.1'
+
 import xml.etree.ElementTree as ET
 import argparse
 import logging
 import os
+import shutil
 import sys
 import csv
+import gzip
+import hashlib
+import io
+import mmap
+import sqlite3
+import struct
+import tarfile
+import tempfile
+import time
+import zipfile
+from array import array
 from datetime import datetime
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass, field
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from dataclasses import dataclass, field, fields, replace
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import simpleSplit
-from decimal import Decimal
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from decimal import ROUND_HALF_EVEN, Decimal
+from xml.parsers import expat
+from xml.sax.saxutils import quoteattr
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml é opcional: sem ele o parse usa xml.etree
+    lxml_etree = None
 
 # Configuração de logging
 logging.basicConfig(
@@ -37,6 +60,23 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def _com_slots(cls):
+    """Recria uma dataclass com __slots__ (o slots=True do dataclass só existe no Python 3.10+)
+
+    Sem __dict__ por instância, cada objeto ocupa só os ponteiros dos campos.
+    Os valores padrão já estão no __init__ gerado, então saem da classe para
+    não conflitar com os slots.
+    """
+    nomes = tuple(f.name for f in fields(cls))
+    atributos = {nome: valor for nome, valor in cls.__dict__.items()
+                 if nome not in nomes and nome not in ('__dict__', '__weakref__')}
+    atributos['__slots__'] = nomes
+    novo = type(cls)(cls.__name__, cls.__bases__, atributos)
+    novo.__qualname__ = cls.__qualname__
+    return novo
+
+
+@_com_slots
 @dataclass
 class FontePagadora:
     """Dados da fonte pagadora"""
@@ -44,6 +84,7 @@ class FontePagadora:
     cnpj: str = ""
 
 
+@_com_slots
 @dataclass
 class Beneficiario:
     """Dados do beneficiário"""
@@ -51,6 +92,7 @@ class Beneficiario:
     nome: str = ""
 
 
+@_com_slots
 @dataclass
 class Dependente:
     """Dados de um dependente"""
@@ -61,6 +103,7 @@ class Dependente:
     descr_dep: str = ""
 
 
+@_com_slots
 @dataclass
 class PensaoAlimenticia:
     """Dados de pensão alimentícia"""
@@ -71,6 +114,7 @@ class PensaoAlimenticia:
     valor_plr: float = 0.0
 
 
+@_com_slots
 @dataclass
 class PrevidenciaComplementar:
     """Dados de previdência complementar"""
@@ -80,6 +124,7 @@ class PrevidenciaComplementar:
     valor: float = 0.0
 
 
+@_com_slots
 @dataclass
 class InfoDepSau:
     """Dependente de plano de saúde - REESTRUTURADO V5.2.0"""
@@ -89,6 +134,7 @@ class InfoDepSau:
     vlr_plano: Decimal = Decimal('0.00')
 
 
+@_com_slots
 @dataclass
 class PlanoSaude:
     """Dados de plano de saúde"""
@@ -100,6 +146,7 @@ class PlanoSaude:
     info_dep_sau: List[InfoDepSau] = field(default_factory=list)  # NOVO V5.2.0
 
 
+@_com_slots
 @dataclass
 class DetReembTit:
     """Detalhamento de reembolso do titular - NOVO V5.2.0"""
@@ -109,6 +156,7 @@ class DetReembTit:
     vlr_deducao: Decimal = Decimal('0.00')
 
 
+@_com_slots
 @dataclass
 class InfoReembDep:
     """Reembolso de dependente - NOVO V5.2.0"""
@@ -117,6 +165,7 @@ class InfoReembDep:
     vlr_deducao: Decimal = Decimal('0.00')
 
 
+@_com_slots
 @dataclass
 class ReembolsoMedico:
     """Dados de reembolso médico"""
@@ -131,6 +180,7 @@ class ReembolsoMedico:
     info_reemb_dep: List[InfoReembDep] = field(default_factory=list)
 
 
+@_com_slots
 @dataclass
 class IdeAdv:
     """Identificação de advogado - NOVO V5.2.0"""
@@ -140,6 +190,7 @@ class IdeAdv:
     nm_adv: str = ""  # NOVO V5.2.2
 
 
+@_com_slots
 @dataclass
 class DespProc:
     """Despesas com processo judicial - NOVO V5.2.0"""
@@ -148,6 +199,7 @@ class DespProc:
     ide_adv: List[IdeAdv] = field(default_factory=list)
 
 
+@_com_slots
 @dataclass
 class InfoRRA:
     """Rendimentos Recebidos Acumuladamente"""
@@ -159,6 +211,7 @@ class InfoRRA:
     desp_proc: Optional[DespProc] = None
 
 
+@_com_slots
 @dataclass
 class EndExt:
     """Endereço no exterior - NOVO V5.2.0"""
@@ -170,6 +223,7 @@ class EndExt:
     end_codpostal: str = ""
 
 
+@_com_slots
 @dataclass
 class PagamentoExterior:
     """Pagamento no Exterior"""
@@ -188,6 +242,7 @@ class PagamentoExterior:
 # NOVOS GRUPOS DA V5.1.0 E V5.2.0
 # ============================================================================
 
+@_com_slots
 @dataclass
 class TotInfoDmDev:
     """Totalização dos demonstrativos - NOVO V5.2.0"""
@@ -202,6 +257,7 @@ class TotInfoDmDev:
     vlr_tot_rend_trib_susp: Decimal = Decimal('0.00')
     vlr_tot_rend_trib_susp_13: Decimal = Decimal('0.00')
 
+@_com_slots
 @dataclass
 class BenefPen:
     """Beneficiário de dedução suspensa"""
@@ -209,6 +265,7 @@ class BenefPen:
     vlr_depen_susp: Decimal
 
 
+@_com_slots
 @dataclass
 class DedSusp:
     """Dedução com exigibilidade suspensa"""
@@ -220,6 +277,7 @@ class DedSusp:
     benef_pen: List[BenefPen] = field(default_factory=list)
 
 
+@_com_slots
 @dataclass
 class InfoValores:
     """Valores relacionados a processos"""
@@ -232,6 +290,7 @@ class InfoValores:
     ded_susp: List[DedSusp] = field(default_factory=list)
 
 
+@_com_slots
 @dataclass
 class ProcessoJudicial:
     """Processo Judicial de Não Retenção"""
@@ -249,6 +308,7 @@ class ProcessoJudicial:
     rendimento_suspenso: float = 0.0
 
 
+@_com_slots
 @dataclass
 class DedDepen:
     """Dedução por dependente"""
@@ -257,6 +317,7 @@ class DedDepen:
     vlr_ded_dep: Decimal
 
 
+@_com_slots
 @dataclass
 class InfoIRCR:
     """Informações de IR por Código de Receita"""
@@ -268,12 +329,14 @@ class InfoIRCR:
     info_proc_ret: List[ProcessoJudicial] = field(default_factory=list)
 
 
+@_com_slots
 @dataclass
 class PerAnt:
     """Informações de períodos anteriores"""
     info: str = "Ajustes de períodos anteriores"
 
 
+@_com_slots
 @dataclass
 class InfoProcJudRub:
     """Processo judicial aplicável a rubrica"""
@@ -283,6 +346,7 @@ class InfoProcJudRub:
     id_vara: str
 
 
+@_com_slots
 @dataclass
 class TotApurDia:
     """Totalizador diário"""
@@ -294,6 +358,7 @@ class TotApurDia:
     vlr_irrf: Decimal = Decimal('0.00')
 
 
+@_com_slots
 @dataclass
 class ConsolidApurMen:
     """Consolidação mensal"""
@@ -304,6 +369,7 @@ class ConsolidApurMen:
     vlr_irrf13: Decimal = Decimal('0.00')
 
 
+@_com_slots
 @dataclass
 class RendimentoTributavel:
     """Rendimentos tributáveis e deduções"""
@@ -314,6 +380,7 @@ class RendimentoTributavel:
     imposto_retido: float = 0.0
 
 
+@_com_slots
 @dataclass
 class RendimentoIsento:
     """Rendimentos isentos e não tributáveis"""
@@ -326,6 +393,7 @@ class RendimentoIsento:
     outros: float = 0.0
 
 
+@_com_slots
 @dataclass
 class RendimentoExclusivo:
     """Rendimentos com tributação exclusiva"""
@@ -335,6 +403,7 @@ class RendimentoExclusivo:
     outros: float = 0.0
 
 
+@_com_slots
 @dataclass
 class ComprovanteRendimentos:
     """Comprovante completo de rendimentos"""
@@ -361,13 +430,752 @@ class ComprovanteRendimentos:
     consolid_apur_men: List[ConsolidApurMen] = field(default_factory=list)
     # NOVO GRUPO V5.2.0
     tot_info_dm_dev: Optional[TotInfoDmDev] = None
+    # Totais de infoIR em centavos, um slot por tpInfoIR (S5002Parser.SLOTS_TP_INFO_IR);
+    # origem dos quadros 3 a 5 e somados de forma exata na consolidação
+    centavos_tp_info_ir: Optional[array] = None
+
+
+# ============================================================================
+# PLANOS DE EXTRAÇÃO (tag -> campo -> conversor)
+# ============================================================================
+
+# Padrão de campos sem valor padrão: a chave fica fora do dicionário de valores
+_AUSENTE = object()
+
+
+@dataclass(frozen=True)
+class Campo:
+    """Texto do primeiro filho com a tag, convertido quando presente
+
+    Sem conversor o texto é repassado cru (pode ser None em elementos vazios).
+    `aliases` são tags não oficiais aceitas, com aviso, quando a oficial falta.
+    """
+    tag: str
+    nome: str
+    conversor: Optional[Callable[[Optional[str]], Any]] = None
+    padrao: Any = _AUSENTE
+    aliases: Tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class Grupo:
+    """Filho(s) com a tag extraídos por outro plano (lista, ou só o primeiro)"""
+    tag: str
+    nome: str
+    plano: str
+    lista: bool = True
+
+
+@dataclass(frozen=True)
+class PlanoExtracao:
+    """Regras de um elemento e o construtor que recebe o dicionário de valores
+
+    Com `erro` definido, exceções viram um aviso "Erro ao parse {erro}" e o
+    resultado é None; sem ele, sobem para o plano pai.
+    """
+    regras: Tuple[Union[Campo, Grupo], ...]
+    construtor: Callable[[Dict[str, Any]], Any]
+    erro: Optional[str] = None
+
+
+class PlanoCompilado:
+    """Plano com as tags já qualificadas para um namespace: um dict de despacho
+
+    Os filhos de cada elemento são percorridos uma única vez e roteados pela
+    tag; aliases são resolvidos, depois os grupos, e por fim as conversões
+    (na ordem das regras).
+    """
+
+    def __init__(self, plano: PlanoExtracao, ns: str, compilados: Dict[str, 'PlanoCompilado']):
+        self.plano = plano
+        self.campos = [r for r in plano.regras if isinstance(r, Campo)]
+        self.grupos = [r for r in plano.regras if isinstance(r, Grupo)]
+        self.compilados = compilados
+        # tag qualificada -> (destino, nome, alias); destino 0 = campo, 1 = lista, 2 = grupo único
+        self.despacho: Dict[str, Tuple[int, str, Optional[str]]] = {}
+        for regra in plano.regras:
+            if isinstance(regra, Grupo):
+                self.despacho['{%s}%s' % (ns, regra.tag)] = (1 if regra.lista else 2, regra.nome, None)
+            else:
+                self.despacho['{%s}%s' % (ns, regra.tag)] = (0, regra.nome, None)
+                for alias in regra.aliases:
+                    self.despacho['{%s}%s' % (ns, alias)] = (0, regra.nome, alias)
+
+    def extrair(self, elem) -> Any:
+        if self.plano.erro is None:
+            return self._extrair(elem)
+        try:
+            return self._extrair(elem)
+        except Exception as e:
+            logger.warning(f"Erro ao parse {self.plano.erro}: {e}")
+            return None
+
+    def _extrair(self, elem) -> Any:
+        textos: Dict[str, Optional[str]] = {}
+        textos_alias: Dict[str, Tuple[str, Optional[str]]] = {}
+        filhos: Dict[str, Any] = {}
+
+        despacho = self.despacho
+        for filho in elem:
+            entrada = despacho.get(filho.tag)
+            if entrada is None:
+                continue
+            destino, nome, alias = entrada
+            if destino == 0:
+                if alias is None:
+                    if nome not in textos:
+                        textos[nome] = filho.text
+                elif nome not in textos_alias:
+                    textos_alias[nome] = (alias, filho.text)
+            elif destino == 1:
+                filhos.setdefault(nome, []).append(filho)
+            elif nome not in filhos:
+                filhos[nome] = filho
+
+        for campo in self.campos:
+            if campo.nome not in textos and campo.nome in textos_alias:
+                alias, texto = textos_alias[campo.nome]
+                logger.warning(f"Tag '{alias}' é um alias. Use '{campo.tag}' (oficial)")
+                textos[campo.nome] = texto
+
+        valores: Dict[str, Any] = {}
+        for grupo in self.grupos:
+            sub = self.compilados[grupo.plano]
+            if grupo.lista:
+                resultados = (sub.extrair(f) for f in filhos.get(grupo.nome, []))
+                valores[grupo.nome] = [r for r in resultados if r is not None]
+            else:
+                filho = filhos.get(grupo.nome)
+                valores[grupo.nome] = sub.extrair(filho) if filho is not None else None
+
+        for campo in self.campos:
+            if campo.nome in textos:
+                texto = textos[campo.nome]
+                valores[campo.nome] = campo.conversor(texto) if campo.conversor else texto
+            elif campo.padrao is not _AUSENTE:
+                valores[campo.nome] = campo.padrao
+
+        return self.plano.construtor(valores)
+
+
+def _decimal_ou_zero(texto: Optional[str]) -> Decimal:
+    return Decimal(texto) if texto else Decimal('0.00')
+
+
+def _valores(valores: Dict[str, Any]) -> Dict[str, Any]:
+    return valores
+
+
+def _construir_pensao(v: Dict[str, Any]) -> Optional[PensaoAlimenticia]:
+    if 'cpf' not in v or 'valor' not in v:
+        return None
+    val = float(v['valor'])
+    tp = v['tp_rend']
+
+    pensao = PensaoAlimenticia(cpf_beneficiario=v['cpf'])
+
+    if tp == '11':  # Mensal
+        pensao.valor_mensal = val
+    elif tp == '12':  # 13º
+        pensao.valor_13 = val
+    elif tp == '14':  # PLR
+        pensao.valor_plr = val
+
+    return pensao
+
+
+def _construir_previdencia(v: Dict[str, Any]) -> Optional[PrevidenciaComplementar]:
+    if 'cnpj' not in v:
+        return None
+    return PrevidenciaComplementar(
+        cnpj=v['cnpj'],
+        tp_prev=v['tp_prev'],
+        valor=float(v['valor']) if 'valor' in v else 0.0
+    )
+
+
+def _construir_plano_saude(v: Dict[str, Any]) -> PlanoSaude:
+    plano = PlanoSaude(
+        cnpj_operadora=v['cnpj_operadora'],
+        nome_operadora=v['nome_operadora'],
+        registro_ans=v['registro_ans'],
+        valor_titular=v['valor_titular']
+    )
+
+    # Dependentes do plano
+    for dep in v['info_dep_sau']:
+        if 'cpf' in dep:
+            # LEGADO
+            plano.dependentes.append((
+                dep['cpf'],
+                dep['nome'],
+                float(dep['valor']) if 'valor' in dep else 0.0
+            ))
+            # NOVO V5.2.0 - estrutura completa
+            plano.info_dep_sau.append(InfoDepSau(
+                cpf_dep=dep['cpf'],
+                nm_dep=dep['nome'],
+                dt_nasc_dep=dep['dt_nascto'],
+                vlr_plano=Decimal(dep['valor']) if 'valor' in dep else Decimal('0.00')
+            ))
+
+    return plano
+
+
+def _construir_reembolso(v: Dict[str, Any]) -> Optional[ReembolsoMedico]:
+    reemb = ReembolsoMedico()
+
+    # Reembolso do titular (LEGADO + NOVO V5.2.0)
+    for det in v['det_reemb_tit']:
+        if 'nr_insc' in det:
+            # LEGADO
+            reemb.cnpj_prestador = det['nr_insc']
+            reemb.valor_reembolsado = float(det['vlr_reemb']) if 'vlr_reemb' in det else 0.0
+            reemb.valor_dedutivel = float(det['vlr_deducao']) if 'vlr_deducao' in det else 0.0
+            # NOVO V5.2.0
+            reemb.det_reemb_tit = DetReembTit(
+                tp_insc=det['tp_insc'],
+                nr_insc=det['nr_insc'],
+                vlr_reemb=Decimal(det['vlr_reemb']) if 'vlr_reemb' in det else Decimal('0.00'),
+                vlr_deducao=Decimal(det['vlr_deducao']) if 'vlr_deducao' in det else Decimal('0.00')
+            )
+
+    # Reembolso de dependentes - NOVO V5.2.0
+    for dep in v['info_reemb_dep']:
+        if 'cpf_dep' in dep:
+            reemb.info_reemb_dep.append(InfoReembDep(
+                cpf_dep=dep['cpf_dep'],
+                vlr_reemb=Decimal(dep['vlr_reemb']) if 'vlr_reemb' in dep else Decimal('0.00'),
+                vlr_deducao=Decimal(dep['vlr_deducao']) if 'vlr_deducao' in dep else Decimal('0.00')
+            ))
+
+    return reemb if reemb.cnpj_prestador else None
+
+
+def _construir_info_rra(v: Dict[str, Any]) -> InfoRRA:
+    info_rra = InfoRRA(descricao=v['descricao'])
+
+    desp = v['desp_proc']
+    if desp is not None:
+        # LEGADO
+        info_rra.custas_judiciais = float(desp['vlr_custas']) if 'vlr_custas' in desp else 0.0
+        info_rra.despesas_advogados = float(desp['vlr_adv']) if 'vlr_adv' in desp else 0.0
+
+        # NOVO V5.2.0 - Estrutura DespProc
+        desp_proc = DespProc(
+            vlr_desp_proc=Decimal(desp['vlr_custas']) if 'vlr_custas' in desp else Decimal('0.00'),
+            vlr_adv=Decimal(desp['vlr_adv']) if 'vlr_adv' in desp else Decimal('0.00')
+        )
+
+        # Advogados
+        for adv in desp['ide_adv']:
+            if 'nr_insc' in adv:
+                # LEGADO
+                info_rra.advogados.append((
+                    adv['nr_insc'],
+                    adv['nm_adv'],
+                    float(adv['valor']) if 'valor' in adv else 0.0
+                ))
+                # NOVO V5.2.0
+                desp_proc.ide_adv.append(IdeAdv(
+                    tp_insc=adv['tp_insc'],
+                    nr_insc=adv['nr_insc'],
+                    vlr_adv=Decimal(adv['valor']) if 'valor' in adv else Decimal('0.00'),
+                    nm_adv=adv['nm_adv']
+                ))
+
+        info_rra.desp_proc = desp_proc
+
+    return info_rra
+
+
+def _construir_pagamento_exterior(v: Dict[str, Any]) -> PagamentoExterior:
+    pgto_ext = PagamentoExterior(pais=v['pais'])
+
+    end = v['end_ext']
+    if end is not None:
+        # LEGADO
+        pgto_ext.logradouro = end['end_dsclograd']
+        pgto_ext.numero = end['end_nrlograd']
+        pgto_ext.complemento = end['end_complem']
+        pgto_ext.bairro = end['end_bairro']
+        pgto_ext.cidade = end['end_nmcid']
+        pgto_ext.cod_postal = end['end_codpostal']
+
+        # NOVO V5.2.0
+        pgto_ext.end_ext = EndExt(**end)
+
+    return pgto_ext
+
+
+_TIPOS_DEDUCAO = {
+    '1': 'Previdência Oficial',
+    '2': 'Previdência Privada',
+    '3': 'FAPI',
+    '4': 'Funpresp',
+    '5': 'Dependente',
+    '6': 'Plano de Saúde',
+    '7': 'Pensão Alimentícia'
+}
+
+
+def _construir_ded_susp(v: Dict[str, Any]) -> DedSusp:
+    tp_ded = v['ind_tp_deducao']
+    return DedSusp(descr_deducao=_TIPOS_DEDUCAO.get(tp_ded, f'Tipo {tp_ded}'), **v)
+
+
+# Planos por nome; campos com o nome do atributo do dataclass são repassados
+# direto ao construtor. Novos grupos do leiaute S-1.x entram como linhas aqui.
+PLANOS_EXTRACAO: Dict[str, PlanoExtracao] = {
+    'dependente': PlanoExtracao((
+        Campo('cpfDep', 'cpf', padrao=""),
+        Campo('nmDep', 'nome', padrao=""),
+        Campo('dtNascto', 'dt_nascto', padrao=""),
+        Campo('tpDep', 'tp_dep', padrao=""),
+        Campo('descrDep', 'descr_dep', padrao=""),
+    ), lambda v: Dependente(**v), erro='dependente'),
+
+    'pensao': PlanoExtracao((
+        Campo('cpfDep', 'cpf'),
+        Campo('vlrPensao', 'valor'),
+        Campo('tpRend', 'tp_rend', padrao='11'),
+    ), _construir_pensao, erro='pensão'),
+
+    'previdencia': PlanoExtracao((
+        Campo('cnpjEntidPC', 'cnpj'),
+        Campo('tpPrev', 'tp_prev', padrao=""),
+        Campo('vlrDeduzir', 'valor'),
+    ), _construir_previdencia, erro='previdência'),
+
+    'plano_saude': PlanoExtracao((
+        Campo('cnpjOper', 'cnpj_operadora', padrao=""),
+        Campo('nmRazao', 'nome_operadora', padrao=""),
+        Campo('regANS', 'registro_ans', padrao=""),
+        Campo('vlrSaudeTit', 'valor_titular', float, 0.0),
+        Grupo('infoDepSau', 'info_dep_sau', 'dependente_plano'),
+    ), _construir_plano_saude, erro='plano saúde'),
+
+    'dependente_plano': PlanoExtracao((
+        Campo('cpfDep', 'cpf'),
+        Campo('nmDep', 'nome', padrao=""),
+        Campo('dtNascto', 'dt_nascto', padrao=""),
+        Campo('vlrSaudeDep', 'valor'),
+    ), _valores),
+
+    'reembolso': PlanoExtracao((
+        Grupo('detReembTit', 'det_reemb_tit', 'reembolso_titular'),
+        Grupo('infoReembDep', 'info_reemb_dep', 'reembolso_dependente'),
+    ), _construir_reembolso, erro='reembolso'),
+
+    'reembolso_titular': PlanoExtracao((
+        Campo('tpInsc', 'tp_insc', padrao=""),
+        Campo('nrInsc', 'nr_insc'),
+        Campo('vlrReemb', 'vlr_reemb'),
+        Campo('vlrDeduzir', 'vlr_deducao'),
+    ), _valores),
+
+    'reembolso_dependente': PlanoExtracao((
+        Campo('cpfDep', 'cpf_dep'),
+        Campo('vlrReemb', 'vlr_reemb'),
+        Campo('vlrDeduzir', 'vlr_deducao'),
+    ), _valores),
+
+    'info_rra': PlanoExtracao((
+        Campo('descrRRA', 'descricao', padrao=""),
+        Grupo('despProcJud', 'desp_proc', 'desp_proc_jud', lista=False),
+    ), _construir_info_rra, erro='info RRA'),
+
+    'desp_proc_jud': PlanoExtracao((
+        Campo('vlrDespCustas', 'vlr_custas', aliases=('vlrCustas',)),
+        Campo('vlrDespAdvogados', 'vlr_adv', aliases=('vlrAdvogados',)),
+        Grupo('ideAdv', 'ide_adv', 'advogado'),
+    ), _valores),
+
+    'advogado': PlanoExtracao((
+        Campo('tpInsc', 'tp_insc', padrao=""),
+        Campo('nrInsc', 'nr_insc'),
+        Campo('vlrAdv', 'valor'),
+        Campo('nmAdv', 'nm_adv', padrao=""),
+    ), _valores),
+
+    'pagamento_exterior': PlanoExtracao((
+        Campo('paisResidExt', 'pais', padrao=""),
+        Grupo('endExt', 'end_ext', 'endereco_exterior', lista=False),
+    ), _construir_pagamento_exterior, erro='pagamento exterior'),
+
+    'endereco_exterior': PlanoExtracao((
+        Campo('endDscLograd', 'end_dsclograd', padrao=""),
+        Campo('endNrLograd', 'end_nrlograd', padrao=""),
+        Campo('endComplem', 'end_complem', padrao=""),
+        Campo('endBairro', 'end_bairro', padrao=""),
+        Campo('endCidade', 'end_nmcid', padrao=""),
+        Campo('endCodPostal', 'end_codpostal', padrao=""),
+    ), _valores),
+
+    'processo_judicial': PlanoExtracao((
+        Campo('nrProc', 'numero_processo', padrao=""),
+        Campo('codSusp', 'codigo_suspensao', padrao=""),
+        Campo('vlrNRetido', 'valor_nao_retido', float, 0.0),
+        Campo('vlrDepJud', 'deposito_judicial', float, 0.0),
+        Campo('vlrCompAnoCalend', 'compensacao_ano', float, 0.0),
+        Campo('vlrCompAnoAnt', 'compensacao_anos_ant', float, 0.0),
+        Campo('vlrRendSusp', 'rendimento_suspenso', float, 0.0),
+    ), lambda v: ProcessoJudicial(**v), erro='processo judicial'),
+
+    # ========================================================================
+    # NOVOS GRUPOS V5.1.0
+    # ========================================================================
+
+    'beneficiario_pensao': PlanoExtracao((
+        Campo('cpfDep', 'cpf_dep', padrao=""),
+        Campo('vlrDepenSusp', 'vlr_depen_susp', Decimal, Decimal('0.00')),
+    ), lambda v: BenefPen(**v), erro='beneficiário'),
+
+    'deducao_suspensa': PlanoExtracao((
+        Campo('indTpDeducao', 'ind_tp_deducao', padrao=""),
+        Campo('vlrDedSusp', 'vlr_ded_susp', Decimal, Decimal('0.00')),
+        Campo('cnpjEntidPC', 'cnpj_entid_pc', padrao=None),
+        Campo('vlrPatrocFunp', 'vlr_patroc_funp', Decimal, None),
+        Grupo('benefPen', 'benef_pen', 'beneficiario_pensao'),
+    ), _construir_ded_susp, erro='dedução suspensa'),
+
+    'info_valores': PlanoExtracao((
+        Campo('indApuracao', 'ind_apuracao', padrao=""),
+        Campo('vlrNRetido', 'vlr_nao_retido', Decimal, Decimal('0.00')),
+        Campo('vlrDepJud', 'vlr_dep_judicial', Decimal, Decimal('0.00')),
+        Campo('vlrCmpAnoCal', 'vlr_comp_ano', Decimal, Decimal('0.00')),
+        Campo('vlrCmpAnoAnt', 'vlr_comp_anos_ant', Decimal, Decimal('0.00')),
+        Campo('vlrRendSusp', 'vlr_rend_susp', Decimal, Decimal('0.00')),
+        Grupo('dedSusp', 'ded_susp', 'deducao_suspensa'),
+    ), lambda v: InfoValores(**v), erro='info valores'),
+
+    'deducao_dependente': PlanoExtracao((
+        Campo('tpRend', 'tp_rend', padrao=""),
+        Campo('cpfDep', 'cpf_dep', padrao=""),
+        Campo('vlrDedDep', 'vlr_ded_dep', Decimal, Decimal('0.00')),
+    ), lambda v: DedDepen(**v), erro='dedução dependente'),
+
+    'info_ir_cr': PlanoExtracao((
+        Campo('tpCR', 'tp_cr', padrao=""),
+        Campo('vlrCR', 'vr_cr', Decimal, Decimal('0.00'), aliases=('vrCR',)),
+        Grupo('dedDepen', 'ded_depen', 'deducao_dependente'),
+        Grupo('penAlim', 'pen_alim', 'pensao'),
+        Grupo('previdCompl', 'previd_compl', 'previdencia'),
+        Grupo('infoProcRet', 'info_proc_ret', 'processo_retencao'),
+    ), lambda v: InfoIRCR(**v), erro='info IR CR'),
+
+    'processo_retencao': PlanoExtracao((
+        Campo('tpProcRet', 'tp_proc_ret', padrao=""),
+        Campo('nrProcRet', 'nr_proc_ret', padrao=""),
+        Campo('codSusp', 'cod_susp', padrao=""),
+        Grupo('infoValores', 'info_valores', 'info_valores'),
+    ), lambda v: ProcessoJudicial(**v)),
+
+    'info_proc_jud_rub': PlanoExtracao((
+        Campo('nrProc', 'nr_proc', padrao=""),
+        Campo('ufVara', 'uf_vara', padrao=""),
+        Campo('codMunic', 'cod_munic', padrao=""),
+        Campo('idVara', 'id_vara', padrao=""),
+    ), lambda v: InfoProcJudRub(**v), erro='processo judicial rubrica'),
+
+    'tot_apur_dia': PlanoExtracao((
+        Campo('perApurDia', 'per_apur_dia', padrao=""),
+        Campo('CRDia', 'cr_dia', padrao=""),
+        Campo('frmTribut', 'frm_tribut', padrao=""),
+        Campo('paisResidExt', 'pais_resid_ext', padrao=None),
+        Campo('vlrRendTrib', 'vlr_rend_trib', Decimal, Decimal('0.00')),
+        Campo('vlrCRDia', 'vlr_irrf', Decimal, Decimal('0.00'), aliases=('vlrIRRF',)),
+    ), lambda v: TotApurDia(**v), erro='totalizador diário'),
+
+    'consolid_apur_men': PlanoExtracao((
+        Campo('CRMen', 'cr_men', padrao=""),
+        Campo('vlrRendTrib', 'vlr_rend_trib', Decimal, Decimal('0.00')),
+        Campo('vlrRendTrib13', 'vlr_rend_trib13', Decimal, Decimal('0.00')),
+        Campo('vlrCRMen', 'vlr_irrf', Decimal, Decimal('0.00'), aliases=('vlrIRRF',)),
+        Campo('vlrCRMen13', 'vlr_irrf13', Decimal, Decimal('0.00'), aliases=('vlrIRRF13',)),
+    ), lambda v: ConsolidApurMen(**v), erro='consolidação mensal'),
+
+    # ============ NOVO GRUPO V5.2.0 ============
+    'tot_info_dm_dev': PlanoExtracao(tuple(
+        Campo(tag, nome, _decimal_ou_zero, Decimal('0.00')) for tag, nome in (
+            ('vlrTotRendTrib', 'vlr_tot_rend_trib'),
+            ('vlrTotRendTrib13', 'vlr_tot_rend_trib_13'),
+            ('vlrTotRendMoleGrave', 'vlr_tot_rend_mole_grave'),
+            ('vlrTotRendMoleGrave13', 'vlr_tot_rend_mole_grave_13'),
+            ('vlrTotRendIsen65', 'vlr_tot_rend_isen_65'),
+            ('vlrTotRendIsen65_13', 'vlr_tot_rend_isen_65_13'),
+            ('vlrTotRendTribAnt', 'vlr_tot_rend_trib_ant'),
+            ('vlrTotRendTribAnt13', 'vlr_tot_rend_trib_ant_13'),
+            ('vlrTotRendTribSusp', 'vlr_tot_rend_trib_susp'),
+            ('vlrTotRendTribSusp13', 'vlr_tot_rend_trib_susp_13'),
+        )
+    ), lambda v: TotInfoDmDev(**v), erro='totalização dos demonstrativos'),
+}
+
+# Planos compilados por namespace
+_PLANOS_COMPILADOS: Dict[str, Dict[str, PlanoCompilado]] = {}
+
+
+def planos_compilados(ns: str) -> Dict[str, PlanoCompilado]:
+    """Compila (uma vez por namespace) todos os PLANOS_EXTRACAO em dicts de despacho"""
+    compilados = _PLANOS_COMPILADOS.get(ns)
+    if compilados is None:
+        compilados = {}
+        for nome, plano in PLANOS_EXTRACAO.items():
+            compilados[nome] = PlanoCompilado(plano, ns, compilados)
+        _PLANOS_COMPILADOS[ns] = compilados
+    return compilados
+
+
+@dataclass
+class IdentificacaoEvento:
+    """Identificação de um evtIrrfBenef lida na pré-varredura (Id, perApur, empregador, recibo)"""
+    id_evento: Optional[str] = None
+    per_apur: Optional[str] = None
+    nr_insc: Optional[str] = None
+    nr_rec_arq_base: Optional[str] = None
+
+    def chave(self, cpf: str) -> Optional[Tuple[str, str, str, str]]:
+        """(CNPJ, CPF, perApur, nrRecArqBase ou Id): versões com a mesma chave são retificações
+
+        None quando o evento não traz nem recibo nem Id (não há como deduplicar).
+        """
+        referencia = self.nr_rec_arq_base or self.id_evento
+        if not referencia:
+            return None
+        return self.nr_insc or '', cpf, self.per_apur or '', referencia
+
+    def ordem(self) -> str:
+        """Critério de versão mais recente: o Id traz data/hora de geração após o CNPJ"""
+        return self.id_evento or ''
+
+
+@dataclass(frozen=True)
+class MembroZip:
+    """Um XML dentro de um pacote ZIP (download do eSocial), lido sem extrair para o disco"""
+    arquivo: str
+    membro: str
+    tamanho: int = field(default=0, compare=False)  # Descomprimido, para o planejador de tarefas
+
+    def __str__(self) -> str:
+        return f"{self.arquivo}/{self.membro}"
+
+
+# Pacotes ZIP abertos neste processo: caminho -> (pid, mtime_ns, tamanho, ZipFile)
+_PACOTES_ZIP: Dict[str, Tuple[int, int, int, zipfile.ZipFile]] = {}
+# Com mais pacotes que isso, o aberto há mais tempo é fechado
+MAXIMO_PACOTES_ABERTOS = 8
+
+
+def _pacote_zip(caminho: str) -> zipfile.ZipFile:
+    """ZipFile do pacote, aberto uma vez por processo
+
+    Abrir um ZIP lê o diretório central inteiro; com um ZipFile por membro, um
+    pacote com N XMLs custaria O(N²). O pid evita reaproveitar, num worker
+    criado por fork, o descritor (e a posição de leitura) do processo pai, e
+    mtime/tamanho detectam um pacote substituído (--watch).
+    """
+    st = os.stat(caminho)
+    aberto = _PACOTES_ZIP.get(caminho)
+    if aberto is not None and aberto[:3] == (os.getpid(), st.st_mtime_ns, st.st_size):
+        return aberto[3]
+    if aberto is not None:
+        del _PACOTES_ZIP[caminho]
+        if aberto[0] == os.getpid():
+            aberto[3].close()
+    while len(_PACOTES_ZIP) >= MAXIMO_PACOTES_ABERTOS:
+        antigo = _PACOTES_ZIP.pop(next(iter(_PACOTES_ZIP)))
+        if antigo[0] == os.getpid():
+            antigo[3].close()
+    pacote = zipfile.ZipFile(caminho)
+    _PACOTES_ZIP[caminho] = (os.getpid(), st.st_mtime_ns, st.st_size, pacote)
+    return pacote
+
+
+# Um arquivo XML: caminho (.xml ou .xml.gz) ou membro de um pacote ZIP
+ArquivoXML = Union[str, MembroZip]
+
+
+def _comprimido(arquivo: ArquivoXML) -> bool:
+    """Indica se a leitura do arquivo passa por um descompressor (membro de ZIP ou .gz)"""
+    return isinstance(arquivo, MembroZip) or arquivo.lower().endswith('.gz')
+
+
+def _abrir_arquivo(arquivo: ArquivoXML) -> BinaryIO:
+    """Abre um arquivo XML para leitura binária, descomprimindo em fluxo (.xml.gz e membros de ZIP)"""
+    if isinstance(arquivo, MembroZip):
+        return _pacote_zip(arquivo.arquivo).open(arquivo.membro)
+    if arquivo.lower().endswith('.gz'):
+        return gzip.open(arquivo, 'rb')
+    return open(arquivo, 'rb')
+
+
+@dataclass
+class TrechoXML:
+    """Faixa de bytes de um evtIrrfBenef dentro de um arquivo de lote
+
+    `declaracoes` guarda os xmlns em escopo no início do evento, para que o
+    trecho possa ser parseado isoladamente dentro de um elemento raiz sintético.
+    Em arquivos comprimidos as posições são as do conteúdo descomprimido, e a
+    leitura é feita na cópia descomprimida gravada uma vez por indexar_xml
+    (`descomprimido`): buscar cada trecho no fluxo comprimido o descomprimiria
+    desde o início, O(n²) no lote.
+    """
+    caminho: ArquivoXML
+    inicio: int
+    fim: int
+    tag: str
+    cpf: Optional[str] = None
+    declaracoes: Tuple[Tuple[str, str], ...] = ()
+    encoding: str = 'UTF-8'
+    evento: Optional[IdentificacaoEvento] = None
+    descomprimido: Optional[str] = None
+
+    def __str__(self) -> str:
+        return f"{self.caminho}[{self.inicio}:{self.fim}]"
+
+    def ler(self) -> bytes:
+        """Documento XML autônomo contendo apenas este evento"""
+        with (open(self.descomprimido, 'rb') if self.descomprimido else _abrir_arquivo(self.caminho)) as f:
+            f.seek(self.inicio)
+            conteudo = f.read(self.fim - self.inicio)
+        atributos = ''.join(f" {nome}={quoteattr(valor)}" for nome, valor in self.declaracoes)
+        return (f'<?xml version="1.0" encoding="{self.encoding}"?><trecho{atributos}>'.encode('ascii')
+                + conteudo + f'</{self.tag}></trecho>'.encode('ascii'))
+
+
+# Um XML inteiro (caminho ou membro de ZIP) ou um evento dentro de um arquivo de lote
+FonteXML = Union[str, MembroZip, TrechoXML]
+
+
+def _abrir_xml(fonte: FonteXML) -> BinaryIO:
+    """Abre uma fonte XML para leitura binária"""
+    if isinstance(fonte, TrechoXML):
+        return io.BytesIO(fonte.ler())
+    return _abrir_arquivo(fonte)
+
+
+def _caminho_fonte(fonte: FonteXML) -> str:
+    """Arquivo em disco de onde a fonte é lida (o pacote, para membros de ZIP)"""
+    if isinstance(fonte, TrechoXML):
+        fonte = fonte.caminho
+    return fonte.arquivo if isinstance(fonte, MembroZip) else fonte
+
+
+def _chave_fonte(fonte: FonteXML) -> Tuple[str, int]:
+    """Ordem estável das fontes de um grupo: arquivo e posição no arquivo"""
+    if isinstance(fonte, TrechoXML):
+        return str(fonte.caminho), fonte.inicio
+    return str(fonte), 0
+
+
+# A partir daqui round(float * 100) pode errar o centavo (ver _centavos)
+LIMITE_CENTAVOS_FLOAT = 2 ** 50
+
+
+def _centavos(texto: str) -> int:
+    """Valor monetário do XML em centavos inteiros
+
+    Com até duas casas decimais (formato do leiaute) round(float * 100) é exato
+    enquanto o módulo fica abaixo de LIMITE_CENTAVOS_FLOAT: o erro do float é
+    muito menor que meio centavo. Valores maiores passam por Decimal.
+    """
+    centavos = round(float(texto) * 100)
+    if -LIMITE_CENTAVOS_FLOAT < centavos < LIMITE_CENTAVOS_FLOAT:
+        return centavos
+    return int((Decimal(texto.strip()) * 100).to_integral_value(ROUND_HALF_EVEN))
+
+
+def _slots_dos_quadros(quadros, slots: Dict[str, int]):
+    """Índices do acumulador de cada campo dos quadros, na ordem dos campos da dataclass"""
+    resolvidos = []
+    for classe, campos in quadros:
+        codigos = dict(campos)
+        resolvidos.append((classe, tuple(tuple(slots[codigo] for codigo in codigos[f.name])
+                                         for f in fields(classe))))
+    return tuple(resolvidos)
+
+
+def _nomes_locais(ns: str, tags: Tuple[str, ...]) -> Dict[str, str]:
+    """Mapa tag qualificada -> nome local, para rotear filhos sem ElementPath"""
+    return {'{%s}%s' % (ns, tag): tag for tag in tags}
+
+
+# Namespace do evento S-5002 e versões do leiaute aceitas pelo parser
+NS_EVT_IRRF_BENEF = 'http://www.esocial.gov.br/schema/evt/evtIrrfBenef/'
+VERSOES_LEIAUTE = ('v_S_01_02_00', 'v_S_01_03_00')
+
+
+class TagsLeiaute:
+    """Tags qualificadas ({ns}tag) de uma versão do leiaute, montadas uma única vez
+
+    O parser compara elem.tag com estas strings em vez de resolver prefixos
+    ('esocial:tag' + mapa de namespaces) a cada find.
+    """
+
+    # Filhos de ideTrabalhador, infoIRComplem e totInfoPerAnt roteados por nome local
+    ROTEADAS = (
+        'cpfBenef', 'dmDev', 'infoIRComplem', 'totInfoPerAnt', 'totInfoDmDev',
+        'ideDep', 'infoIRCR', 'planSaude', 'infoReembMed', 'infoRRA', 'infoPgtoExt',
+        'infoProcRet', 'perAnt', 'infoProcJudRub', 'penAlim', 'previdCompl',
+        'totApurDia', 'consolidApurMen',
+    )
+
+    def __init__(self, versao: str):
+        self.versao = versao
+        self.ns = NS_EVT_IRRF_BENEF + versao
+        q = '{%s}%%s' % self.ns
+        self.evento = q % 'evtIrrfBenef'
+        self.per_apur = q % 'perApur'
+        self.ide_empregador = q % 'ideEmpregador'
+        self.nr_insc = q % 'nrInsc'
+        self.ide_trabalhador = q % 'ideTrabalhador'
+        self.cpf_benef = q % 'cpfBenef'
+        self.nr_rec_arq_base = q % 'nrRecArqBase'
+        self.info_ir = q % 'infoIR'
+        self.tp_info_ir = q % 'tpInfoIR'
+        self.valor = q % 'valor'
+        self.nomes_locais = _nomes_locais(self.ns, self.ROTEADAS)
+        self.planos = planos_compilados(self.ns)
+
+    def __repr__(self):
+        return f"TagsLeiaute({self.versao!r})"
+
+
+# Namespace -> tags do leiaute
+LEIAUTES: Dict[str, TagsLeiaute] = {tags.ns: tags for tags in map(TagsLeiaute, VERSOES_LEIAUTE)}
+LEIAUTE_PADRAO = LEIAUTES[NS_EVT_IRRF_BENEF + 'v_S_01_03_00']
+# Tag de abertura do evento -> leiaute (detecta a versão de cada evtIrrfBenef)
+EVENTOS_LEIAUTE = {tags.evento: tags for tags in LEIAUTES.values()}
+TAGS_CPF_BENEF = frozenset(tags.cpf_benef for tags in LEIAUTES.values())
+# Tags lidas pela pré-varredura para identificar o evento (IdentificacaoEvento)
+TAGS_IDENTIFICACAO = {tag: campo for tags in LEIAUTES.values()
+                      for tag, campo in ((tags.per_apur, 'per_apur'), (tags.nr_insc, 'nr_insc'),
+                                         (tags.nr_rec_arq_base, 'nr_rec_arq_base'))}
+# Filtro de tags do iterparse do lxml: só os elementos tratados em S5002Parser.iterar
+TAGS_ITERPARSE = tuple(tag for tags in LEIAUTES.values()
+                       for tag in (tags.evento, tags.per_apur, tags.ide_empregador, tags.ide_trabalhador))
+
+# Backends de parse do S5002Parser ('auto' = lxml quando instalado)
+BACKENDS_PARSER = ('auto', 'lxml', 'etree')
+
+
+def resolver_backend_parser(backend: str = 'auto') -> str:
+    """Backend efetivo ('lxml' ou 'etree'); pedir lxml sem ele instalado cai para etree com aviso"""
+    if backend == 'etree':
+        return 'etree'
+    if lxml_etree is not None:
+        return 'lxml'
+    if backend == 'lxml':
+        logger.warning("lxml não está instalado; usando o parser xml.etree")
+    return 'etree'
 
 
 class S5002Parser:
     """Parser de arquivos XML S-5002 do e-Social"""
     
-    # Namespace do e-Social
-    NS = {'esocial': 'http://www.esocial.gov.br/schema/evt/evtIrrfBenef/v_S_01_03_00'}
+    # Namespace padrão do e-Social (a versão de cada evento é detectada no parse)
+    NS = {'esocial': LEIAUTE_PADRAO.ns}
     
     # Mapeamento de códigos tpInfoIR para campos do comprovante
     CODIGO_IRRF = {
@@ -408,27 +1216,74 @@ class S5002Parser:
         '7954': 'rra_prev_oficial',
         '7955': 'rra_pensao',
     }
+
+    # Posição de cada tpInfoIR no acumulador de centavos (array 'q')
+    SLOTS_TP_INFO_IR = {codigo: i for i, codigo in enumerate(CODIGO_IRRF)}
+
+    # Campos dos quadros 3 a 5 -> códigos tpInfoIR somados em cada um
+    # (somados em centavos no acumulador; o quadro recebe o total em reais)
+    QUADROS_TP_INFO_IR = (
+        (RendimentoTributavel, (
+            ('total_rendimentos', ('11', '12')),
+            ('contrib_previdenciaria', ('41', '42')),
+            ('contrib_prev_privada', ('46', '47', '61', '62', '63', '64')),
+            ('pensao_alimenticia', ('51', '52', '54')),
+            ('imposto_retido', ('31', '32', '34')),
+        )),
+        (RendimentoIsento, (
+            ('parcela_isenta_65', ('70', '71')),
+            ('diarias', ('72',)),
+            ('ajuda_custo', ('73',)),
+            ('indenizacoes', ('74',)),
+            ('abono_pecuniario', ('75',)),
+            ('molestia_grave', ('76', '77')),
+            ('outros', ('79',)),
+        )),
+        (RendimentoExclusivo, (
+            ('decimo_terceiro', ('12',)),
+            ('plr', ('14',)),
+            ('rra', ('7952',)),
+            ('outros', ()),
+        )),
+    )
+    SLOTS_QUADROS = _slots_dos_quadros(QUADROS_TP_INFO_IR, SLOTS_TP_INFO_IR)
     
-    def __init__(self, xml_path: str):
+    def __init__(self, xml_path: FonteXML, backend: str = 'etree'):
         self.xml_path = xml_path
+        # 'lxml' ou 'etree' (sem aviso: resolver_backend_parser avisa uma vez, no main)
+        self.backend = 'lxml' if backend != 'etree' and lxml_etree is not None else 'etree'
         self.tree = None
         self.root = None
+        # Contexto do evento corrente (lido uma vez por evento durante o parse)
+        self._per_apur: Optional[str] = None
+        self._cnpj_empregador: Optional[str] = None
+        # Tags da versão do leiaute do evento corrente
+        self._tags = LEIAUTE_PADRAO
     
     def parse(self) -> List[ComprovanteRendimentos]:
         """Parse do arquivo XML e retorna lista de comprovantes"""
+        return list(self.iterar())
+
+    def iterar(self) -> Iterator[ComprovanteRendimentos]:
+        """Parse incremental (iterparse): gera um comprovante por ideTrabalhador
+
+        perApur e ideEmpregador são lidos uma vez por evento. Cada ideTrabalhador
+        é convertido assim que fecha e removido da árvore em seguida, mantendo a
+        memória constante em arquivos de lote com milhares de trabalhadores.
+        A versão do leiaute vem do namespace de cada evtIrrfBenef (EVENTOS_LEIAUTE),
+        de modo que lotes e diretórios com versões misturadas são lidos corretamente.
+        """
+        self.root = None
+        self._per_apur = None
+        self._cnpj_empregador = None
+        self._tags = LEIAUTE_PADRAO
+
         try:
-            self.tree = ET.parse(self.xml_path)
-            self.root = self.tree.getroot()
-            
-            comprovantes = []
-            
-            # Buscar todos os trabalhadores no arquivo
-            for ide_trab in self.root.findall('.//esocial:ideTrabalhador', self.NS):
-                comprovante = self._parse_trabalhador(ide_trab)
-                if comprovante:
-                    comprovantes.append(comprovante)
-            
-            return comprovantes
+            with _abrir_xml(self.xml_path) as f:
+                if self.backend == 'lxml':
+                    yield from self._iterar_lxml(f)
+                else:
+                    yield from self._iterar_etree(f)
             
         except ET.ParseError as e:
             logger.error(f"Erro ao fazer parse do XML {self.xml_path}: {e}")
@@ -436,124 +1291,151 @@ class S5002Parser:
         except Exception as e:
             logger.error(f"Erro inesperado ao processar {self.xml_path}: {e}")
             raise
-    
+
+    def _iterar_etree(self, f: BinaryIO) -> Iterator[ComprovanteRendimentos]:
+        """iterparse do xml.etree: todos os elementos passam pelo loop"""
+        tags = self._tags
+        pilha = []
+        for evento, elem in ET.iterparse(f, events=('start', 'end')):
+            if evento == 'start':
+                if self.root is None:
+                    self.root = elem
+                pilha.append(elem)
+                leiaute = EVENTOS_LEIAUTE.get(elem.tag)
+                if leiaute is not None:
+                    self._tags = tags = leiaute
+                continue
+
+            pilha.pop()
+            tag = elem.tag
+
+            if tag == tags.per_apur:
+                self._per_apur = elem.text
+            elif tag == tags.ide_empregador:
+                nr_insc = elem.find(tags.nr_insc)
+                self._cnpj_empregador = nr_insc.text if nr_insc is not None else None
+            elif tag == tags.ide_trabalhador or tag == tags.evento:
+                if tag == tags.ide_trabalhador:
+                    comprovante = self._parse_trabalhador(elem)
+                    if comprovante:
+                        yield comprovante
+                # Liberar o subtree já processado
+                elem.clear()
+                if pilha:
+                    pilha[-1].remove(elem)
+
+    def _iterar_lxml(self, f: BinaryIO) -> Iterator[ComprovanteRendimentos]:
+        """iterparse do lxml filtrado por TAGS_ITERPARSE: só os elementos tratados chegam ao Python
+
+        Comentários e instruções de processamento são descartados e entidades
+        externas não são resolvidas, como no xml.etree; erros de sintaxe saem
+        como ET.ParseError para que os chamadores tratem os dois backends igual.
+        """
+        tags = self._tags
+        eventos = lxml_etree.iterparse(f, events=('start', 'end'), tag=TAGS_ITERPARSE,
+                                       remove_comments=True, remove_pis=True,
+                                       resolve_entities=False, no_network=True)
+        try:
+            for evento, elem in eventos:
+                tag = elem.tag
+                if evento == 'start':
+                    if self.root is None:
+                        self.root = elem.getroottree().getroot()
+                    leiaute = EVENTOS_LEIAUTE.get(tag)
+                    if leiaute is not None:
+                        self._tags = tags = leiaute
+                    continue
+
+                if tag == tags.per_apur:
+                    self._per_apur = elem.text
+                elif tag == tags.ide_empregador:
+                    nr_insc = elem.find(tags.nr_insc)
+                    self._cnpj_empregador = nr_insc.text if nr_insc is not None else None
+                elif tag == tags.ide_trabalhador or tag == tags.evento:
+                    if tag == tags.ide_trabalhador:
+                        comprovante = self._parse_trabalhador(elem)
+                        if comprovante:
+                            yield comprovante
+                    # Liberar o subtree já processado
+                    elem.clear()
+                    pai = elem.getparent()
+                    if pai is not None:
+                        pai.remove(elem)
+        except lxml_etree.XMLSyntaxError as e:
+            raise ET.ParseError(str(e)) from e
+
     def _parse_trabalhador(self, ide_trab) -> Optional[ComprovanteRendimentos]:
         """Parse dos dados de um trabalhador"""
         try:
             # Extrair ano de referência
-            per_apur = self.root.find('.//esocial:perApur', self.NS)
-            ano = per_apur.text[:4] if per_apur is not None else datetime.now().year
+            ano = self._per_apur[:4] if self._per_apur else datetime.now().year
             
+            # Filhos de ideTrabalhador em uma única passagem
+            tags = self._tags
+            locais = tags.nomes_locais
+            cpf_benef = None
+            dm_devs = []
+            info_ir_complem = None
+            tot_info_per_ant = None
+            tot_info_dm_dev_elem = None
+            for filho in ide_trab:
+                local = locais.get(filho.tag)
+                if local == 'dmDev':
+                    dm_devs.append(filho)
+                elif local == 'cpfBenef':
+                    if cpf_benef is None:
+                        cpf_benef = filho
+                elif local == 'infoIRComplem':
+                    if info_ir_complem is None:
+                        info_ir_complem = filho
+                elif local == 'totInfoPerAnt':
+                    if tot_info_per_ant is None:
+                        tot_info_per_ant = filho
+                elif local == 'totInfoDmDev':
+                    if tot_info_dm_dev_elem is None:
+                        tot_info_dm_dev_elem = filho
+
             # Dados do beneficiário
-            cpf_benef = ide_trab.find('esocial:cpfBenef', self.NS)
             beneficiario = Beneficiario(
                 cpf=cpf_benef.text if cpf_benef is not None else ""
             )
             
             # Dados da fonte pagadora (do ideEmpregador)
             fonte_pagadora = FontePagadora()
-            ide_empregador = self.root.find('.//esocial:ideEmpregador', self.NS)
-            if ide_empregador is not None:
-                nr_insc = ide_empregador.find('esocial:nrInsc', self.NS)
-                if nr_insc is not None:
-                    fonte_pagadora.cnpj = nr_insc.text
-            
-            # Inicializar estruturas de dados
-            valores = {}
-            
-            # Processar todos os dmDev
-            for dm_dev in ide_trab.findall('esocial:dmDev', self.NS):
-                # Processar infoIR
-                for info_ir in dm_dev.findall('esocial:infoIR', self.NS):
-                    tp_info = info_ir.find('esocial:tpInfoIR', self.NS)
-                    valor = info_ir.find('esocial:valor', self.NS)
+            if self._cnpj_empregador is not None:
+                fonte_pagadora.cnpj = self._cnpj_empregador
+            
+            # Somar infoIR de todos os dmDev em centavos, no slot do tpInfoIR
+            # (códigos fora de CODIGO_IRRF não entram em nenhum quadro)
+            slots = self.SLOTS_TP_INFO_IR
+            centavos = [0] * len(slots)
+            for dm_dev in dm_devs:
+                for info_ir in dm_dev:
+                    if info_ir.tag != tags.info_ir:
+                        continue
+                    tp_info = info_ir.find(tags.tp_info_ir)
+                    valor = info_ir.find(tags.valor)
                     
                     if tp_info is not None and valor is not None:
-                        codigo = tp_info.text
-                        val = float(valor.text)
-                        
-                        if codigo in valores:
-                            valores[codigo] += val
-                        else:
-                            valores[codigo] = val
-            
-            # Montar rendimentos tributáveis
-            rend_trib = RendimentoTributavel(
-                total_rendimentos=valores.get('11', 0.0) + valores.get('12', 0.0),
-                contrib_previdenciaria=valores.get('41', 0.0) + valores.get('42', 0.0),
-                contrib_prev_privada=(valores.get('46', 0.0) + valores.get('47', 0.0) + 
-                                     valores.get('61', 0.0) + valores.get('62', 0.0) +
-                                     valores.get('63', 0.0) + valores.get('64', 0.0)),
-                pensao_alimenticia=valores.get('51', 0.0) + valores.get('52', 0.0) + valores.get('54', 0.0),
-                imposto_retido=valores.get('31', 0.0) + valores.get('32', 0.0) + valores.get('34', 0.0)
-            )
-            
-            # Montar rendimentos isentos
-            rend_isento = RendimentoIsento(
-                parcela_isenta_65=valores.get('70', 0.0) + valores.get('71', 0.0),
-                diarias=valores.get('72', 0.0),
-                ajuda_custo=valores.get('73', 0.0),
-                indenizacoes=valores.get('74', 0.0),
-                abono_pecuniario=valores.get('75', 0.0),
-                molestia_grave=valores.get('76', 0.0) + valores.get('77', 0.0),
-                outros=valores.get('79', 0.0)
-            )
+                        slot = slots.get(tp_info.text)
+                        if slot is not None:
+                            centavos[slot] += _centavos(valor.text)
             
-            # Montar rendimentos exclusivos
-            rend_exclusivo = RendimentoExclusivo(
-                decimo_terceiro=valores.get('12', 0.0),
-                plr=valores.get('14', 0.0),
-                rra=valores.get('7952', 0.0),
-                outros=0.0
-            )
+            # Quadros 3 (tributáveis), 4 (isentos) e 5 (exclusivos)
+            rend_trib, rend_isento, rend_exclusivo = self.montar_quadros(centavos)
+            centavos = array('q', centavos)
             
-            # Parse de informações complementares
-            info_ir_complem = ide_trab.find('esocial:infoIRComplem', self.NS)
+            # Informações complementares
             dependentes = []
             pensoes = []
             previdencias = []
             planos_saude = []
             reembolsos = []
-            
-            if info_ir_complem is not None:
-                # Dependentes
-                for ide_dep in info_ir_complem.findall('esocial:ideDep', self.NS):
-                    dep = self._parse_dependente(ide_dep)
-                    if dep:
-                        dependentes.append(dep)
-                
-                # Processar infoIRCR para pensões e previdências
-                for info_ir_cr in info_ir_complem.findall('esocial:infoIRCR', self.NS):
-                    # Pensões alimentícias
-                    for pen_alim in info_ir_cr.findall('esocial:penAlim', self.NS):
-                        pensao = self._parse_pensao(pen_alim)
-                        if pensao:
-                            pensoes.append(pensao)
-                    
-                    # Previdência complementar
-                    for prev_compl in info_ir_cr.findall('esocial:previdCompl', self.NS):
-                        prev = self._parse_previdencia(prev_compl)
-                        if prev:
-                            previdencias.append(prev)
-                
-                # Planos de saúde
-                for plan_saude in info_ir_complem.findall('esocial:planSaude', self.NS):
-                    plano = self._parse_plano_saude(plan_saude)
-                    if plano:
-                        planos_saude.append(plano)
-                
-                # Reembolsos médicos
-                for info_reemb in info_ir_complem.findall('esocial:infoReembMed', self.NS):
-                    reemb = self._parse_reembolso(info_reemb)
-                    if reemb:
-                        reembolsos.append(reemb)
-            
-            # Parse dos 3 novos grupos (v5.0.0)
             info_rra = None
             pagamento_exterior = None
             processos_judiciais = []
             
-            # Parse dos 8 novos grupos (v5.1.0)
+            # Grupos V5.1.0
             info_ir_cr_list = []
             per_ant = None
             info_proc_jud_rub_list = []
@@ -561,62 +1443,77 @@ class S5002Parser:
             consolid_apur_men_list = []
             
             if info_ir_complem is not None:
-                # Info RRA
-                info_rra_elem = info_ir_complem.find('esocial:infoRRA', self.NS)
-                if info_rra_elem is not None:
-                    info_rra = self._parse_info_rra(info_rra_elem)
-                
-                # Pagamento no Exterior
-                pgto_ext_elem = info_ir_complem.find('esocial:infoPgtoExt', self.NS)
-                if pgto_ext_elem is not None:
-                    pagamento_exterior = self._parse_pagamento_exterior(pgto_ext_elem)
-                
-                # Processos Judiciais
-                for proc_elem in info_ir_complem.findall('esocial:infoProcRet', self.NS):
-                    proc = self._parse_processo_judicial(proc_elem)
-                    if proc:
-                        processos_judiciais.append(proc)
-                
-                # ============ NOVOS GRUPOS V5.1.0 ============
-                
-                # InfoIRCR
-                for info_cr_elem in info_ir_complem.findall('esocial:infoIRCR', self.NS):
-                    info_cr = self._parse_info_ir_cr(info_cr_elem)
-                    if info_cr:
-                        info_ir_cr_list.append(info_cr)
-                
-                # PerAnt
-                per_ant_elem = info_ir_complem.find('esocial:perAnt', self.NS)
-                if per_ant_elem is not None:
-                    per_ant = PerAnt()
-                
-                # InfoProcJudRub
-                for proc_rub_elem in info_ir_complem.findall('esocial:infoProcJudRub', self.NS):
-                    proc_rub = self._parse_info_proc_jud_rub(proc_rub_elem)
-                    if proc_rub:
-                        info_proc_jud_rub_list.append(proc_rub)
+                # Uma única passagem pelos filhos de infoIRComplem; grupos de
+                # ocorrência única (infoRRA, infoPgtoExt, perAnt) usam o primeiro
+                vistos = set()
+                for filho in info_ir_complem:
+                    local = locais.get(filho.tag)
+                    if local == 'ideDep':
+                        dep = self._extrair('dependente', filho)
+                        if dep:
+                            dependentes.append(dep)
+                    elif local == 'infoIRCR':
+                        info_cr = self._extrair('info_ir_cr', filho)
+                        if info_cr:
+                            info_ir_cr_list.append(info_cr)
+                            # Cópias: a consolidação soma valores nas listas do comprovante
+                            pensoes.extend(replace(p) for p in info_cr.pen_alim)
+                            previdencias.extend(replace(p) for p in info_cr.previd_compl)
+                        else:
+                            # infoIRCR inválido: aproveitar pensões e previdências válidas
+                            for neto in filho:
+                                local_neto = locais.get(neto.tag)
+                                if local_neto == 'penAlim':
+                                    pensao = self._extrair('pensao', neto)
+                                    if pensao:
+                                        pensoes.append(pensao)
+                                elif local_neto == 'previdCompl':
+                                    prev = self._extrair('previdencia', neto)
+                                    if prev:
+                                        previdencias.append(prev)
+                    elif local == 'planSaude':
+                        plano = self._extrair('plano_saude', filho)
+                        if plano:
+                            planos_saude.append(plano)
+                    elif local == 'infoReembMed':
+                        reemb = self._extrair('reembolso', filho)
+                        if reemb:
+                            reembolsos.append(reemb)
+                    elif local == 'infoProcRet':
+                        proc = self._extrair('processo_judicial', filho)
+                        if proc:
+                            processos_judiciais.append(proc)
+                    elif local == 'infoProcJudRub':
+                        proc_rub = self._extrair('info_proc_jud_rub', filho)
+                        if proc_rub:
+                            info_proc_jud_rub_list.append(proc_rub)
+                    elif local in ('infoRRA', 'infoPgtoExt', 'perAnt') and local not in vistos:
+                        vistos.add(local)
+                        if local == 'infoRRA':
+                            info_rra = self._extrair('info_rra', filho)
+                        elif local == 'infoPgtoExt':
+                            pagamento_exterior = self._extrair('pagamento_exterior', filho)
+                        else:
+                            per_ant = PerAnt()
             
             # TotApurDia e ConsolidApurMen (podem estar em totInfoPerAnt)
-            tot_info_per_ant = ide_trab.find('esocial:totInfoPerAnt', self.NS)
             if tot_info_per_ant is not None:
-                # TotApurDia
-                for tot_dia_elem in tot_info_per_ant.findall('esocial:totApurDia', self.NS):
-                    tot_dia = self._parse_tot_apur_dia(tot_dia_elem)
-                    if tot_dia:
-                        tot_apur_dia_list.append(tot_dia)
-                
-                # ConsolidApurMen
-                for cons_elem in tot_info_per_ant.findall('esocial:consolidApurMen', self.NS):
-                    cons = self._parse_consolid_apur_men(cons_elem)
-                    if cons:
-                        consolid_apur_men_list.append(cons)
+                for filho in tot_info_per_ant:
+                    local = locais.get(filho.tag)
+                    if local == 'totApurDia':
+                        tot_dia = self._extrair('tot_apur_dia', filho)
+                        if tot_dia:
+                            tot_apur_dia_list.append(tot_dia)
+                    elif local == 'consolidApurMen':
+                        cons = self._extrair('consolid_apur_men', filho)
+                        if cons:
+                            consolid_apur_men_list.append(cons)
             
             # ============ NOVO GRUPO V5.2.0 ============
             # TotInfoDmDev - Totalização dos demonstrativos
             tot_info_dm_dev = None
-            tot_info_dm_dev_elem = ide_trab.find('esocial:totInfoDmDev', self.NS)
             if tot_info_dm_dev_elem is not None:
-                tot_info_dm_dev = self._parse_tot_info_dm_dev(tot_info_dm_dev_elem)
+                tot_info_dm_dev = self._extrair('tot_info_dm_dev', tot_info_dm_dev_elem)
             
             # Criar comprovante
             comprovante = ComprovanteRendimentos(
@@ -641,7 +1538,8 @@ class S5002Parser:
                 tot_apur_dia=tot_apur_dia_list,
                 consolid_apur_men=consolid_apur_men_list,
                 # NOVO GRUPO V5.2.0
-                tot_info_dm_dev=tot_info_dm_dev
+                tot_info_dm_dev=tot_info_dm_dev,
+                centavos_tp_info_ir=centavos
             )
             
             return comprovante
@@ -650,559 +1548,150 @@ class S5002Parser:
             logger.error(f"Erro ao processar trabalhador: {e}")
             return None
     
-    def _parse_dependente(self, ide_dep) -> Optional[Dependente]:
-        """Parse de um dependente"""
-        try:
-            cpf = ide_dep.find('esocial:cpfDep', self.NS)
-            nome = ide_dep.find('esocial:nmDep', self.NS)
-            dt_nascto = ide_dep.find('esocial:dtNascto', self.NS)
-            tp_dep = ide_dep.find('esocial:tpDep', self.NS)
-            descr_dep = ide_dep.find('esocial:descrDep', self.NS)
-            
-            return Dependente(
-                cpf=cpf.text if cpf is not None else "",
-                nome=nome.text if nome is not None else "",
-                dt_nascto=dt_nascto.text if dt_nascto is not None else "",
-                tp_dep=tp_dep.text if tp_dep is not None else "",
-                descr_dep=descr_dep.text if descr_dep is not None else ""
-            )
-        except Exception as e:
-            logger.warning(f"Erro ao parse dependente: {e}")
-            return None
-    
-    def _parse_pensao(self, pen_alim) -> Optional[PensaoAlimenticia]:
-        """Parse de pensão alimentícia"""
-        try:
-            cpf = pen_alim.find('esocial:cpfDep', self.NS)
-            valor = pen_alim.find('esocial:vlrPensao', self.NS)
-            tp_rend = pen_alim.find('esocial:tpRend', self.NS)
-            
-            if cpf is not None and valor is not None:
-                val = float(valor.text)
-                tp = tp_rend.text if tp_rend is not None else '11'
-                
-                pensao = PensaoAlimenticia(cpf_beneficiario=cpf.text)
-                
-                if tp == '11':  # Mensal
-                    pensao.valor_mensal = val
-                elif tp == '12':  # 13º
-                    pensao.valor_13 = val
-                elif tp == '14':  # PLR
-                    pensao.valor_plr = val
-                
-                return pensao
-        except Exception as e:
-            logger.warning(f"Erro ao parse pensão: {e}")
-            return None
-    
-    def _parse_previdencia(self, prev_compl) -> Optional[PrevidenciaComplementar]:
-        """Parse de previdência complementar"""
-        try:
-            cnpj = prev_compl.find('esocial:cnpjEntidPC', self.NS)
-            tp_prev = prev_compl.find('esocial:tpPrev', self.NS)
-            valor = prev_compl.find('esocial:vlrDeduzir', self.NS)
-            
-            if cnpj is not None:
-                return PrevidenciaComplementar(
-                    cnpj=cnpj.text,
-                    tp_prev=tp_prev.text if tp_prev is not None else "",
-                    valor=float(valor.text) if valor is not None else 0.0
-                )
-        except Exception as e:
-            logger.warning(f"Erro ao parse previdência: {e}")
-            return None
-    
-    def _parse_plano_saude(self, plan_saude) -> Optional[PlanoSaude]:
-        """Parse de plano de saúde"""
-        try:
-            cnpj = plan_saude.find('esocial:cnpjOper', self.NS)
-            nome = plan_saude.find('esocial:nmRazao', self.NS)
-            reg_ans = plan_saude.find('esocial:regANS', self.NS)
-            valor_tit = plan_saude.find('esocial:vlrSaudeTit', self.NS)
-            
-            plano = PlanoSaude(
-                cnpj_operadora=cnpj.text if cnpj is not None else "",
-                nome_operadora=nome.text if nome is not None else "",
-                registro_ans=reg_ans.text if reg_ans is not None else "",
-                valor_titular=float(valor_tit.text) if valor_tit is not None else 0.0
-            )
-            
-            # Dependentes do plano (LEGADO - mantém compatibilidade)
-            for info_dep in plan_saude.findall('esocial:infoDepSau', self.NS):
-                cpf_dep = info_dep.find('esocial:cpfDep', self.NS)
-                nome_dep = info_dep.find('esocial:nmDep', self.NS)
-                dt_nasc_dep = info_dep.find('esocial:dtNascto', self.NS)
-                valor_dep = info_dep.find('esocial:vlrSaudeDep', self.NS)
-                
-                if cpf_dep is not None:
-                    # LEGADO
-                    plano.dependentes.append((
-                        cpf_dep.text,
-                        nome_dep.text if nome_dep is not None else "",
-                        float(valor_dep.text) if valor_dep is not None else 0.0
-                    ))
-                    # NOVO V5.2.0 - estrutura completa
-                    plano.info_dep_sau.append(InfoDepSau(
-                        cpf_dep=cpf_dep.text,
-                        nm_dep=nome_dep.text if nome_dep is not None else "",
-                        dt_nasc_dep=dt_nasc_dep.text if dt_nasc_dep is not None else "",
-                        vlr_plano=Decimal(valor_dep.text) if valor_dep is not None else Decimal('0.00')
-                    ))
-            
-            return plano
-        except Exception as e:
-            logger.warning(f"Erro ao parse plano saúde: {e}")
-            return None
-    
-    def _parse_reembolso(self, info_reemb) -> Optional[ReembolsoMedico]:
-        """Parse de reembolso médico"""
-        try:
-            reemb = ReembolsoMedico()
-            
-            # Reembolso do titular (LEGADO + NOVO V5.2.0)
-            for det_reemb in info_reemb.findall('esocial:detReembTit', self.NS):
-                tp_insc = det_reemb.find('esocial:tpInsc', self.NS)
-                nr_insc = det_reemb.find('esocial:nrInsc', self.NS)
-                valor_reemb = det_reemb.find('esocial:vlrReemb', self.NS)
-                valor_ded = det_reemb.find('esocial:vlrDeduzir', self.NS)
-                
-                if nr_insc is not None:
-                    # LEGADO
-                    reemb.cnpj_prestador = nr_insc.text
-                    reemb.valor_reembolsado = float(valor_reemb.text) if valor_reemb is not None else 0.0
-                    reemb.valor_dedutivel = float(valor_ded.text) if valor_ded is not None else 0.0
-                    # NOVO V5.2.0
-                    reemb.det_reemb_tit = DetReembTit(
-                        tp_insc=tp_insc.text if tp_insc is not None else "",
-                        nr_insc=nr_insc.text,
-                        vlr_reemb=Decimal(valor_reemb.text) if valor_reemb is not None else Decimal('0.00'),
-                        vlr_deducao=Decimal(valor_ded.text) if valor_ded is not None else Decimal('0.00')
-                    )
-            
-            # Reembolso de dependentes - NOVO V5.2.0
-            for info_reemb_dep in info_reemb.findall('esocial:infoReembDep', self.NS):
-                cpf_dep = info_reemb_dep.find('esocial:cpfDep', self.NS)
-                valor_reemb = info_reemb_dep.find('esocial:vlrReemb', self.NS)
-                valor_ded = info_reemb_dep.find('esocial:vlrDeduzir', self.NS)
-                
-                if cpf_dep is not None:
-                    reemb.info_reemb_dep.append(InfoReembDep(
-                        cpf_dep=cpf_dep.text,
-                        vlr_reemb=Decimal(valor_reemb.text) if valor_reemb is not None else Decimal('0.00'),
-                        vlr_deducao=Decimal(valor_ded.text) if valor_ded is not None else Decimal('0.00')
-                    ))
-            
-            return reemb if reemb.cnpj_prestador else None
-        except Exception as e:
-            logger.warning(f"Erro ao parse reembolso: {e}")
-            return None
-    
-    def _parse_info_rra(self, info_rra_elem) -> Optional[InfoRRA]:
-        """Parse de informações de RRA"""
-        try:
-            descr = info_rra_elem.find('esocial:descrRRA', self.NS)
-            
-            info_rra = InfoRRA(
-                descricao=descr.text if descr is not None else ""
-            )
-            
-            # Despesas com processo judicial
-            desp_proc_elem = info_rra_elem.find('esocial:despProcJud', self.NS)
-            if desp_proc_elem is not None:
-                # Tentar tag oficial primeiro, depois fallback para alias
-                vlr_custas = desp_proc_elem.find('esocial:vlrDespCustas', self.NS)
-                if vlr_custas is None:
-                    vlr_custas = desp_proc_elem.find('esocial:vlrCustas', self.NS)  # Fallback
-                    if vlr_custas is not None:
-                        logger.warning("Tag 'vlrCustas' é um alias. Use 'vlrDespCustas' (oficial)")
-                
-                vlr_adv_total = desp_proc_elem.find('esocial:vlrDespAdvogados', self.NS)
-                if vlr_adv_total is None:
-                    vlr_adv_total = desp_proc_elem.find('esocial:vlrAdvogados', self.NS)  # Fallback
-                    if vlr_adv_total is not None:
-                        logger.warning("Tag 'vlrAdvogados' é um alias. Use 'vlrDespAdvogados' (oficial)")
-                
-                # LEGADO
-                info_rra.custas_judiciais = float(vlr_custas.text) if vlr_custas is not None else 0.0
-                info_rra.despesas_advogados = float(vlr_adv_total.text) if vlr_adv_total is not None else 0.0
-                
-                # NOVO V5.2.0 - Estrutura DespProc
-                desp_proc = DespProc(
-                    vlr_desp_proc=Decimal(vlr_custas.text) if vlr_custas is not None else Decimal('0.00'),
-                    vlr_adv=Decimal(vlr_adv_total.text) if vlr_adv_total is not None else Decimal('0.00')
-                )
-                
-                # Advogados
-                for ide_adv_elem in desp_proc_elem.findall('esocial:ideAdv', self.NS):
-                    tp_insc = ide_adv_elem.find('esocial:tpInsc', self.NS)
-                    nr_insc = ide_adv_elem.find('esocial:nrInsc', self.NS)
-                    valor = ide_adv_elem.find('esocial:vlrAdv', self.NS)
-                    nm_adv = ide_adv_elem.find('esocial:nmAdv', self.NS)  # NOVO V5.2.2
-                    
-                    if nr_insc is not None:
-                        nome_adv = nm_adv.text if nm_adv is not None else ""
-                        # LEGADO
-                        info_rra.advogados.append((
-                            nr_insc.text,
-                            nome_adv,
-                            float(valor.text) if valor is not None else 0.0
-                        ))
-                        # NOVO V5.2.0
-                        desp_proc.ide_adv.append(IdeAdv(
-                            tp_insc=tp_insc.text if tp_insc is not None else "",
-                            nr_insc=nr_insc.text,
-                            vlr_adv=Decimal(valor.text) if valor is not None else Decimal('0.00'),
-                            nm_adv=nome_adv
-                        ))
-                
-                info_rra.desp_proc = desp_proc
-            
-            return info_rra
-        except Exception as e:
-            logger.warning(f"Erro ao parse info RRA: {e}")
-            return None
-    
-    def _parse_pagamento_exterior(self, pgto_ext_elem) -> Optional[PagamentoExterior]:
-        """Parse de pagamento no exterior"""
-        try:
-            pais = pgto_ext_elem.find('esocial:paisResidExt', self.NS)
-            
-            pgto_ext = PagamentoExterior(
-                pais=pais.text if pais is not None else ""
-            )
-            
-            # Endereço
-            end_ext_elem = pgto_ext_elem.find('esocial:endExt', self.NS)
-            if end_ext_elem is not None:
-                logr = end_ext_elem.find('esocial:endDscLograd', self.NS)
-                num = end_ext_elem.find('esocial:endNrLograd', self.NS)
-                compl = end_ext_elem.find('esocial:endComplem', self.NS)
-                bairro = end_ext_elem.find('esocial:endBairro', self.NS)
-                cidade = end_ext_elem.find('esocial:endCidade', self.NS)
-                cod_post = end_ext_elem.find('esocial:endCodPostal', self.NS)
-                
-                # LEGADO
-                pgto_ext.logradouro = logr.text if logr is not None else ""
-                pgto_ext.numero = num.text if num is not None else ""
-                pgto_ext.complemento = compl.text if compl is not None else ""
-                pgto_ext.bairro = bairro.text if bairro is not None else ""
-                pgto_ext.cidade = cidade.text if cidade is not None else ""
-                pgto_ext.cod_postal = cod_post.text if cod_post is not None else ""
-                
-                # NOVO V5.2.0
-                pgto_ext.end_ext = EndExt(
-                    end_dsclograd=logr.text if logr is not None else "",
-                    end_nrlograd=num.text if num is not None else "",
-                    end_complem=compl.text if compl is not None else "",
-                    end_bairro=bairro.text if bairro is not None else "",
-                    end_nmcid=cidade.text if cidade is not None else "",
-                    end_codpostal=cod_post.text if cod_post is not None else ""
-                )
-            
-            return pgto_ext
-        except Exception as e:
-            logger.warning(f"Erro ao parse pagamento exterior: {e}")
-            return None
-    
-    def _parse_processo_judicial(self, proc_elem) -> Optional[ProcessoJudicial]:
-        """Parse de processo judicial"""
-        try:
-            nr_proc = proc_elem.find('esocial:nrProc', self.NS)
-            cod_susp = proc_elem.find('esocial:codSusp', self.NS)
-            vlr_nao_ret = proc_elem.find('esocial:vlrNRetido', self.NS)
-            vlr_dep = proc_elem.find('esocial:vlrDepJud', self.NS)
-            vlr_comp_ano = proc_elem.find('esocial:vlrCompAnoCalend', self.NS)
-            vlr_comp_ant = proc_elem.find('esocial:vlrCompAnoAnt', self.NS)
-            vlr_rend_susp = proc_elem.find('esocial:vlrRendSusp', self.NS)
-            
-            return ProcessoJudicial(
-                numero_processo=nr_proc.text if nr_proc is not None else "",
-                codigo_suspensao=cod_susp.text if cod_susp is not None else "",
-                valor_nao_retido=float(vlr_nao_ret.text) if vlr_nao_ret is not None else 0.0,
-                deposito_judicial=float(vlr_dep.text) if vlr_dep is not None else 0.0,
-                compensacao_ano=float(vlr_comp_ano.text) if vlr_comp_ano is not None else 0.0,
-                compensacao_anos_ant=float(vlr_comp_ant.text) if vlr_comp_ant is not None else 0.0,
-                rendimento_suspenso=float(vlr_rend_susp.text) if vlr_rend_susp is not None else 0.0
-            )
-        except Exception as e:
-            logger.warning(f"Erro ao parse processo judicial: {e}")
-            return None
-    
-    # ========================================================================
-    # NOVOS PARSERS V5.1.0
-    # ========================================================================
-    
-    def _parse_benef_pen(self, benef_elem) -> Optional[BenefPen]:
-        """Parse de beneficiário de dedução suspensa"""
-        try:
-            cpf = benef_elem.find('esocial:cpfDep', self.NS)
-            vlr = benef_elem.find('esocial:vlrDepenSusp', self.NS)
-            
-            return BenefPen(
-                cpf_dep=cpf.text if cpf is not None else "",
-                vlr_depen_susp=Decimal(vlr.text) if vlr is not None else Decimal('0.00')
-            )
-        except Exception as e:
-            logger.warning(f"Erro ao parse beneficiário: {e}")
-            return None
-    
-    def _parse_ded_susp(self, ded_elem) -> Optional[DedSusp]:
-        """Parse de dedução suspensa"""
-        try:
-            ind_tp = ded_elem.find('esocial:indTpDeducao', self.NS)
-            vlr_ded = ded_elem.find('esocial:vlrDedSusp', self.NS)
-            cnpj = ded_elem.find('esocial:cnpjEntidPC', self.NS)
-            vlr_patroc = ded_elem.find('esocial:vlrPatrocFunp', self.NS)
-            
-            # Parse beneficiários
-            beneficiarios = []
-            for benef in ded_elem.findall('esocial:benefPen', self.NS):
-                b = self._parse_benef_pen(benef)
-                if b:
-                    beneficiarios.append(b)
-            
-            tipos_deducao = {
-                '1': 'Previdência Oficial',
-                '2': 'Previdência Privada',
-                '3': 'FAPI',
-                '4': 'Funpresp',
-                '5': 'Dependente',
-                '6': 'Plano de Saúde',
-                '7': 'Pensão Alimentícia'
-            }
-            
-            tp_ded = ind_tp.text if ind_tp is not None else ""
-            
-            return DedSusp(
-                ind_tp_deducao=tp_ded,
-                descr_deducao=tipos_deducao.get(tp_ded, f'Tipo {tp_ded}'),
-                vlr_ded_susp=Decimal(vlr_ded.text) if vlr_ded is not None else Decimal('0.00'),
-                cnpj_entid_pc=cnpj.text if cnpj is not None else None,
-                vlr_patroc_funp=Decimal(vlr_patroc.text) if vlr_patroc is not None else None,
-                benef_pen=beneficiarios
-            )
-        except Exception as e:
-            logger.warning(f"Erro ao parse dedução suspensa: {e}")
-            return None
-    
-    def _parse_info_valores(self, info_val_elem) -> Optional[InfoValores]:
-        """Parse de valores de processo"""
-        try:
-            ind_apur = info_val_elem.find('esocial:indApuracao', self.NS)
-            vlr_nao_ret = info_val_elem.find('esocial:vlrNRetido', self.NS)
-            vlr_dep = info_val_elem.find('esocial:vlrDepJud', self.NS)
-            vlr_comp_ano = info_val_elem.find('esocial:vlrCmpAnoCal', self.NS)
-            vlr_comp_ant = info_val_elem.find('esocial:vlrCmpAnoAnt', self.NS)
-            vlr_rend_susp = info_val_elem.find('esocial:vlrRendSusp', self.NS)
-            
-            # Parse deduções suspensas
-            ded_susp_list = []
-            for ded in info_val_elem.findall('esocial:dedSusp', self.NS):
-                d = self._parse_ded_susp(ded)
-                if d:
-                    ded_susp_list.append(d)
-            
-            return InfoValores(
-                ind_apuracao=ind_apur.text if ind_apur is not None else "",
-                vlr_nao_retido=Decimal(vlr_nao_ret.text) if vlr_nao_ret is not None else Decimal('0.00'),
-                vlr_dep_judicial=Decimal(vlr_dep.text) if vlr_dep is not None else Decimal('0.00'),
-                vlr_comp_ano=Decimal(vlr_comp_ano.text) if vlr_comp_ano is not None else Decimal('0.00'),
-                vlr_comp_anos_ant=Decimal(vlr_comp_ant.text) if vlr_comp_ant is not None else Decimal('0.00'),
-                vlr_rend_susp=Decimal(vlr_rend_susp.text) if vlr_rend_susp is not None else Decimal('0.00'),
-                ded_susp=ded_susp_list
-            )
-        except Exception as e:
-            logger.warning(f"Erro ao parse info valores: {e}")
-            return None
-    
-    def _parse_ded_depen(self, ded_elem) -> Optional[DedDepen]:
-        """Parse de dedução por dependente"""
-        try:
-            tp_rend = ded_elem.find('esocial:tpRend', self.NS)
-            cpf_dep = ded_elem.find('esocial:cpfDep', self.NS)
-            vlr_ded = ded_elem.find('esocial:vlrDedDep', self.NS)
-            
-            return DedDepen(
-                tp_rend=tp_rend.text if tp_rend is not None else "",
-                cpf_dep=cpf_dep.text if cpf_dep is not None else "",
-                vlr_ded_dep=Decimal(vlr_ded.text) if vlr_ded is not None else Decimal('0.00')
-            )
-        except Exception as e:
-            logger.warning(f"Erro ao parse dedução dependente: {e}")
-            return None
-    
-    def _parse_info_ir_cr(self, info_cr_elem) -> Optional[InfoIRCR]:
-        """Parse de informações por código de receita"""
-        try:
-            tp_cr = info_cr_elem.find('esocial:tpCR', self.NS)
-            
-            # Tentar tag oficial primeiro, depois fallback para alias
-            vr_cr = info_cr_elem.find('esocial:vlrCR', self.NS)
-            if vr_cr is None:
-                vr_cr = info_cr_elem.find('esocial:vrCR', self.NS)  # Fallback
-                if vr_cr is not None:
-                    logger.warning("Tag 'vrCR' é um alias. Use 'vlrCR' (oficial)")
-            
-            # Parse deduções por dependente
-            ded_depen_list = []
-            for ded in info_cr_elem.findall('esocial:dedDepen', self.NS):
-                d = self._parse_ded_depen(ded)
-                if d:
-                    ded_depen_list.append(d)
-            
-            # Parse pensões
-            pensoes = []
-            for pen in info_cr_elem.findall('esocial:penAlim', self.NS):
-                p = self._parse_pensao(pen)
-                if p:
-                    pensoes.append(p)
-            
-            # Parse previdência
-            previdencias = []
-            for prev in info_cr_elem.findall('esocial:previdCompl', self.NS):
-                p = self._parse_previdencia(prev)
-                if p:
-                    previdencias.append(p)
-            
-            # Parse processos
-            processos = []
-            for proc in info_cr_elem.findall('esocial:infoProcRet', self.NS):
-                # Parse completo com info_valores
-                tp_proc = proc.find('esocial:tpProcRet', self.NS)
-                nr_proc = proc.find('esocial:nrProcRet', self.NS)
-                cod_susp = proc.find('esocial:codSusp', self.NS)
-                
-                info_valores_list = []
-                for info_val in proc.findall('esocial:infoValores', self.NS):
-                    iv = self._parse_info_valores(info_val)
-                    if iv:
-                        info_valores_list.append(iv)
-                
-                processos.append(ProcessoJudicial(
-                    tp_proc_ret=tp_proc.text if tp_proc is not None else "",
-                    nr_proc_ret=nr_proc.text if nr_proc is not None else "",
-                    cod_susp=cod_susp.text if cod_susp is not None else "",
-                    info_valores=info_valores_list
-                ))
-            
-            return InfoIRCR(
-                tp_cr=tp_cr.text if tp_cr is not None else "",
-                vr_cr=Decimal(vr_cr.text) if vr_cr is not None else Decimal('0.00'),
-                ded_depen=ded_depen_list,
-                pen_alim=pensoes,
-                previd_compl=previdencias,
-                info_proc_ret=processos
-            )
-        except Exception as e:
-            logger.warning(f"Erro ao parse info IR CR: {e}")
-            return None
-    
-    def _parse_info_proc_jud_rub(self, proc_elem) -> Optional[InfoProcJudRub]:
-        """Parse de processo judicial por rubrica"""
-        try:
-            nr_proc = proc_elem.find('esocial:nrProc', self.NS)
-            uf_vara = proc_elem.find('esocial:ufVara', self.NS)
-            cod_munic = proc_elem.find('esocial:codMunic', self.NS)
-            id_vara = proc_elem.find('esocial:idVara', self.NS)
-            
-            return InfoProcJudRub(
-                nr_proc=nr_proc.text if nr_proc is not None else "",
-                uf_vara=uf_vara.text if uf_vara is not None else "",
-                cod_munic=cod_munic.text if cod_munic is not None else "",
-                id_vara=id_vara.text if id_vara is not None else ""
-            )
-        except Exception as e:
-            logger.warning(f"Erro ao parse processo judicial rubrica: {e}")
-            return None
-    
-    def _parse_tot_apur_dia(self, tot_elem) -> Optional[TotApurDia]:
-        """Parse de totalizador diário"""
-        try:
-            per_apur = tot_elem.find('esocial:perApurDia', self.NS)
-            cr_dia = tot_elem.find('esocial:CRDia', self.NS)
-            frm_trib = tot_elem.find('esocial:frmTribut', self.NS)
-            pais = tot_elem.find('esocial:paisResidExt', self.NS)
-            vlr_rend = tot_elem.find('esocial:vlrRendTrib', self.NS)
-            
-            # Tentar tag oficial primeiro, depois fallback para alias
-            vlr_irrf = tot_elem.find('esocial:vlrCRDia', self.NS)
-            if vlr_irrf is None:
-                vlr_irrf = tot_elem.find('esocial:vlrIRRF', self.NS)  # Fallback
-                if vlr_irrf is not None:
-                    logger.warning("Tag 'vlrIRRF' é um alias. Use 'vlrCRDia' (oficial)")
-            
-            return TotApurDia(
-                per_apur_dia=per_apur.text if per_apur is not None else "",
-                cr_dia=cr_dia.text if cr_dia is not None else "",
-                frm_tribut=frm_trib.text if frm_trib is not None else "",
-                pais_resid_ext=pais.text if pais is not None else None,
-                vlr_rend_trib=Decimal(vlr_rend.text) if vlr_rend is not None else Decimal('0.00'),
-                vlr_irrf=Decimal(vlr_irrf.text) if vlr_irrf is not None else Decimal('0.00')
-            )
-        except Exception as e:
-            logger.warning(f"Erro ao parse totalizador diário: {e}")
-            return None
-    
-    def _parse_consolid_apur_men(self, cons_elem) -> Optional[ConsolidApurMen]:
-        """Parse de consolidação mensal"""
-        try:
-            cr_men = cons_elem.find('esocial:CRMen', self.NS)
-            vlr_rend = cons_elem.find('esocial:vlrRendTrib', self.NS)
-            vlr_rend13 = cons_elem.find('esocial:vlrRendTrib13', self.NS)
-            
-            # Tentar tags oficiais primeiro, depois fallback para aliases
-            vlr_irrf = cons_elem.find('esocial:vlrCRMen', self.NS)
-            if vlr_irrf is None:
-                vlr_irrf = cons_elem.find('esocial:vlrIRRF', self.NS)  # Fallback
-                if vlr_irrf is not None:
-                    logger.warning("Tag 'vlrIRRF' é um alias. Use 'vlrCRMen' (oficial)")
-            
-            vlr_irrf13 = cons_elem.find('esocial:vlrCRMen13', self.NS)
-            if vlr_irrf13 is None:
-                vlr_irrf13 = cons_elem.find('esocial:vlrIRRF13', self.NS)  # Fallback
-                if vlr_irrf13 is not None:
-                    logger.warning("Tag 'vlrIRRF13' é um alias. Use 'vlrCRMen13' (oficial)")
-            
-            return ConsolidApurMen(
-                cr_men=cr_men.text if cr_men is not None else "",
-                vlr_rend_trib=Decimal(vlr_rend.text) if vlr_rend is not None else Decimal('0.00'),
-                vlr_rend_trib13=Decimal(vlr_rend13.text) if vlr_rend13 is not None else Decimal('0.00'),
-                vlr_irrf=Decimal(vlr_irrf.text) if vlr_irrf is not None else Decimal('0.00'),
-                vlr_irrf13=Decimal(vlr_irrf13.text) if vlr_irrf13 is not None else Decimal('0.00')
-            )
-        except Exception as e:
-            logger.warning(f"Erro ao parse consolidação mensal: {e}")
-            return None
-    
-    def _parse_tot_info_dm_dev(self, tot_elem) -> Optional[TotInfoDmDev]:
-        """Parse de totalização dos demonstrativos - NOVO V5.2.0"""
-        try:
-            return TotInfoDmDev(
-                vlr_tot_rend_trib=self._parse_decimal(tot_elem, 'vlrTotRendTrib'),
-                vlr_tot_rend_trib_13=self._parse_decimal(tot_elem, 'vlrTotRendTrib13'),
-                vlr_tot_rend_mole_grave=self._parse_decimal(tot_elem, 'vlrTotRendMoleGrave'),
-                vlr_tot_rend_mole_grave_13=self._parse_decimal(tot_elem, 'vlrTotRendMoleGrave13'),
-                vlr_tot_rend_isen_65=self._parse_decimal(tot_elem, 'vlrTotRendIsen65'),
-                vlr_tot_rend_isen_65_13=self._parse_decimal(tot_elem, 'vlrTotRendIsen65_13'),
-                vlr_tot_rend_trib_ant=self._parse_decimal(tot_elem, 'vlrTotRendTribAnt'),
-                vlr_tot_rend_trib_ant_13=self._parse_decimal(tot_elem, 'vlrTotRendTribAnt13'),
-                vlr_tot_rend_trib_susp=self._parse_decimal(tot_elem, 'vlrTotRendTribSusp'),
-                vlr_tot_rend_trib_susp_13=self._parse_decimal(tot_elem, 'vlrTotRendTribSusp13')
-            )
-        except Exception as e:
-            logger.warning(f"Erro ao parse totalização dos demonstrativos: {e}")
-            return None
-    
-    def _parse_decimal(self, elem, tag_name: str) -> Decimal:
-        """Helper para parse de valores decimais"""
-        tag = elem.find(f'esocial:{tag_name}', self.NS)
-        return Decimal(tag.text) if tag is not None and tag.text else Decimal('0.00')
+    @classmethod
+    def montar_quadros(cls, centavos) -> Tuple[RendimentoTributavel, RendimentoIsento, RendimentoExclusivo]:
+        """Quadros 3 a 5 a partir dos totais em centavos por tpInfoIR (SLOTS_QUADROS)"""
+        quadros = []
+        for classe, campos in cls.SLOTS_QUADROS:
+            valores = []
+            for indices in campos:
+                total = 0
+                for i in indices:
+                    total += centavos[i]
+                # 0.0 literal é um objeto único: campos zerados não alocam um float cada
+                valores.append(total / 100 if total else 0.0)
+            quadros.append(classe(*valores))
+        return tuple(quadros)
 
+    def _extrair(self, plano: str, elem) -> Any:
+        """Extrai um elemento pelo plano (PLANOS_EXTRACAO) compilado para o leiaute do evento"""
+        return self._tags.planos[plano].extrair(elem)
+
+
+def _estampar_esqueleto(c: canvas.Canvas, nome: str, operacoes: List[tuple], como_form: bool):
+    """Emite no canvas o esqueleto fixo `nome` gravado por um LayoutPaginado
+
+    As operações (setFont, drawString, line, ...) são medidas e gravadas uma
+    vez por processo (PDFGenerator._esqueleto) e aqui só reexecutadas pela
+    API pública do canvas. Com como_form=True o esqueleto é um form XObject
+    definido uma vez por documento e referenciado com um único operador Do,
+    o que compensa quando o mesmo canvas recebe vários comprovantes; com
+    como_form=False as operações entram no conteúdo da própria página (mais
+    barato num PDF de um comprovante só, que pagaria o objeto e o stream
+    extras do form).
+    """
+    if como_form:
+        if c.hasForm(nome):
+            c.doForm(nome)
+            return
+        c.beginForm(nome)
+    else:
+        c.saveState()
+
+    for op in operacoes:
+        getattr(c, op[0])(*op[1:])
+
+    if como_form:
+        c.endForm()
+        c.doForm(nome)
+    else:
+        c.restoreState()
+
+
+class _CanvasNulo:
+    """Descarta as operações de desenho (valores ao gravar o esqueleto, rótulos ao desenhar os valores)"""
+
+    def _descartar(self, *args):
+        pass
+
+    setFont = drawString = drawCentredString = drawRightString = line = _descartar
+
+
+_CANVAS_NULO = _CanvasNulo()
+
+
+class LayoutPaginado:
+    """Layout medido em memória: registra as operações de desenho por página.
+
+    Expõe o mesmo subconjunto da API do canvas usado pelo PDFGenerator.
+    O conteúdo é medido uma única vez (quebras de linha e de página) e depois
+    emitido em passagem única, já com o total de páginas conhecido.
+    """
 
-class PDFGenerator:
-    """Gerador de PDF do comprovante de rendimentos"""
-    
     def __init__(self):
+        self.paginas: List[List[tuple]] = [[]]
+
+    @property
+    def total_paginas(self) -> int:
+        return len(self.paginas)
+
+    def setFont(self, nome: str, tamanho: float):
+        self.paginas[-1].append(('setFont', nome, tamanho))
+
+    def drawString(self, x: float, y: float, texto: str):
+        self.paginas[-1].append(('drawString', x, y, texto))
+
+    def drawCentredString(self, x: float, y: float, texto: str):
+        self.paginas[-1].append(('drawCentredString', x, y, texto))
+
+    def drawRightString(self, x: float, y: float, texto: str):
+        self.paginas[-1].append(('drawRightString', x, y, texto))
+
+    def line(self, x1: float, y1: float, x2: float, y2: float):
+        self.paginas[-1].append(('line', x1, y1, x2, y2))
+
+    def showPage(self):
+        self.paginas.append([])
+
+    def paginacao(self, x: float, y: float, pagina_atual: int):
+        """Registra "Página X de Y" com o total resolvido apenas na emissão"""
+        self.paginas[-1].append(('paginacao', x, y, pagina_atual))
+
+    def estampar(self, nome: str, operacoes: List[tuple], como_form: bool):
+        """Registra o esqueleto fixo `nome`, emitido por _estampar_esqueleto"""
+        self.paginas[-1].append(('estampar', nome, operacoes, como_form))
+
+    def emitir(self, c: canvas.Canvas):
+        """Emite as operações registradas no canvas real"""
+        total = self.total_paginas
+        for indice, operacoes in enumerate(self.paginas):
+            if indice:
+                c.showPage()
+            for op in operacoes:
+                if op[0] == 'paginacao':
+                    c.drawRightString(op[1], op[2], f"Página {op[3]} de {total}")
+                elif op[0] == 'estampar':
+                    _estampar_esqueleto(c, *op[1:])
+                else:
+                    getattr(c, op[0])(*op[1:])
+
+
+class PDFGenerator:
+    """Gerador de PDF do comprovante de rendimentos
+
+    Modos de paginação:
+    - 'layout': mede o documento em memória (LayoutPaginado) e emite em passagem única
+    - 'xobject': desenha direto no canvas; o total de "Página X de Y" é um form
+      XObject referenciado em todas as páginas e preenchido no c.save()
+    """
+
+    MODOS_PAGINACAO = ('layout', 'xobject')
+
+    # Nome do form XObject com o total de páginas (modo 'xobject')
+    FORM_TOTAL_PAGINAS = 'TotalPaginas'
+    # Prefixo dos esqueletos fixos da página 1, também nome dos forms XObject (ver _esqueleto)
+    FORM_ESQUELETO = 'Esqueleto'
+    # (ano, linhas do nome da fonte, linhas do nome do beneficiário) -> (nome, operações)
+    _esqueletos: Dict[Tuple[str, int, int], Tuple[str, List[tuple]]] = {}
+
+    def __init__(self, modo_paginacao: str = 'layout', esqueleto_form: bool = False):
+        if modo_paginacao not in self.MODOS_PAGINACAO:
+            raise ValueError(f"Modo de paginação inválido: {modo_paginacao}")
+        self.modo_paginacao = modo_paginacao
+        # Esqueleto da página 1 como form XObject (vários comprovantes por canvas)
+        self.esqueleto_form = esqueleto_form
+        # Form com o total de páginas do comprovante atual (modo 'xobject')
+        self.form_total_paginas = self.FORM_TOTAL_PAGINAS
         self.page_width = A4[0]
         self.page_height = A4[1]
         self.margin_left = 20*mm
@@ -1211,264 +1700,159 @@ class PDFGenerator:
         self.margin_bottom = 20*mm
         self.content_width = self.page_width - self.margin_left - self.margin_right
         
-    def gerar_pdf(self, comprovante: ComprovanteRendimentos, output_path: str):
+    def gerar_pdf(self, comprovante: ComprovanteRendimentos, output_path: Union[str, BinaryIO]):
         """Gera o PDF do comprovante com paginação correta"""
-        import os
         try:
-            # Sistema de convergência: loop até paginação estabilizar
-            temp_path = output_path + ".temp"
-            total_pages_estimado = 999  # Começa com número alto
-            max_iteracoes = 5
-            
-            for iteracao in range(max_iteracoes):
-                # Gerar PDF temporário e contar páginas reais
-                c = canvas.Canvas(temp_path, pagesize=A4)
-                total_pages_real = self._gerar_conteudo(c, comprovante, total_pages_estimado)
-                c.save()
-                
-                # Se convergiu, sair do loop
-                if total_pages_real == total_pages_estimado:
-                    logger.debug(f"Paginação convergiu em {iteracao + 1} iterações: {total_pages_real} páginas")
-                    break
-                
-                # Atualizar estimativa para próxima iteração
-                total_pages_estimado = total_pages_real
-            else:
-                # Se não convergiu, usar último valor
-                logger.warning(f"Paginação não convergiu após {max_iteracoes} iterações, usando {total_pages_real} páginas")
-            
-            # Gerar PDF final com paginação correta
             c = canvas.Canvas(output_path, pagesize=A4)
-            self._gerar_conteudo(c, comprovante, total_pages_real)
+            total_paginas = self._desenhar_comprovante(c, comprovante)
             c.save()
-            
-            # Remover arquivo temporário
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            
-            logger.debug(f"PDF gerado com sucesso: {output_path} ({total_pages_real} páginas)")
+
+            logger.debug(f"PDF gerado com sucesso: {output_path} ({total_paginas} páginas)")
             
         except Exception as e:
             logger.error(f"Erro ao gerar PDF {output_path}: {e}")
             raise
+
+    def renderizar(self, comprovante: ComprovanteRendimentos) -> bytes:
+        """Gera o PDF do comprovante em memória, para ser entregue a uma saída (--saida)"""
+        buffer = io.BytesIO()
+        self.gerar_pdf(comprovante, buffer)
+        return buffer.getvalue()
+    
+    def gerar_pdf_lote(self, comprovantes: Iterable[ComprovanteRendimentos],
+                       output_path: Union[str, BinaryIO]) -> int:
+        """Gera um único PDF com vários comprovantes, na ordem recebida
+
+        Todos passam pelo mesmo canvas, então fontes e esqueletos da página 1
+        entram uma vez no documento (use esqueleto_form=True). A
+        paginação "Página X de Y" recomeça em cada comprovante, e cada um
+        ganha uma entrada no sumário (outline) com nome e CPF. `comprovantes`
+        pode ser um gerador: cada comprovante é desenhado e descartado antes
+        do próximo, mas o ReportLab retém as páginas até o save(): quem chama
+        limita a quantidade por documento (--comprovantes-por-pdf). Retorna o
+        número de comprovantes gravados; sem nenhum, o arquivo não é criado.
+        """
+        c = canvas.Canvas(output_path, pagesize=A4)
+        total = 0
+        try:
+            for comprovante in comprovantes:
+                if total:
+                    c.showPage()
+                total += 1
+                chave = f"comprovante{total}"
+                c.bookmarkPage(chave)
+                titulo = f"CPF {self._formatar_cpf(comprovante.beneficiario.cpf)}"
+                if comprovante.beneficiario.nome:
+                    titulo = f"{comprovante.beneficiario.nome} - {titulo}"
+                c.addOutlineEntry(titulo, chave, level=0)
+                self.form_total_paginas = f"{self.FORM_TOTAL_PAGINAS}{total}"
+                self._desenhar_comprovante(c, comprovante)
+
+            if total:
+                c.showOutline()
+                c.save()
+                logger.debug(f"PDF em lote gerado com sucesso: {output_path} ({total} comprovantes)")
+        except Exception as e:
+            logger.error(f"Erro ao gerar PDF {output_path}: {e}")
+            raise
+        finally:
+            self.form_total_paginas = self.FORM_TOTAL_PAGINAS
+        return total
+    
+    def _desenhar_comprovante(self, c: canvas.Canvas, comprovante: ComprovanteRendimentos) -> int:
+        """Desenha um comprovante a partir da página atual do canvas e retorna o número de páginas"""
+        if self.modo_paginacao == 'xobject':
+            # Desenhar direto no canvas; o total entra no form XObject ao final
+            total_paginas = self._gerar_conteudo(c, comprovante, None)
+            self._definir_total_paginas(c, total_paginas)
+            return total_paginas
+
+        # Medir o documento uma única vez em memória; "Página X de Y"
+        # fica pendente até o total de páginas ser conhecido
+        layout = LayoutPaginado()
+        self._gerar_conteudo(layout, comprovante, None)
+
+        # Emitir no canvas em passagem única
+        layout.emitir(c)
+        return layout.total_paginas
     
-    def _calcular_total_paginas(self, c: canvas.Canvas, comprovante: ComprovanteRendimentos) -> int:
-        """Calcula o número total de páginas necessárias"""
+    def _gerar_conteudo(self, c: canvas.Canvas, comprovante: ComprovanteRendimentos, total_pages: int) -> int:
+        """Gera o conteúdo completo do PDF e retorna o número real de páginas"""
+        pagina_atual = 1
         y = self.page_height - self.margin_top
-        paginas = 1
         
-        # Simular desenho para calcular páginas
-        y = self._simular_cabecalho(y)
-        y -= 6*mm
-        y = self._simular_fonte_pagadora(y)
-        y -= 6*mm
-        y = self._simular_beneficiario(y)
-        y -= 6*mm
-        y = self._simular_rendimentos_tributaveis(y)
-        y -= 6*mm
-        y = self._simular_rendimentos_isentos(y)
-        y -= 6*mm
-        y = self._simular_rendimentos_exclusivos(y)
-        y -= 6*mm
+        # Cabeçalho e quadros 1 a 5: o esqueleto fixo (títulos, rótulos e linhas)
+        # é gravado uma vez por processo e estampado; aqui só os valores são desenhados
+        linhas_fonte = simpleSplit(comprovante.fonte_pagadora.nome, "Helvetica", 12, self.content_width - 10*mm)
+        linhas_benef = simpleSplit(comprovante.beneficiario.nome, "Helvetica", 12, self.content_width - 10*mm)
+        nome_esqueleto, operacoes = self._esqueleto(comprovante.ano, len(linhas_fonte), len(linhas_benef))
+        if isinstance(c, LayoutPaginado):
+            c.estampar(nome_esqueleto, operacoes, self.esqueleto_form)
+        else:
+            _estampar_esqueleto(c, nome_esqueleto, operacoes, self.esqueleto_form)
+        y = self._desenhar_quadros(c, _CANVAS_NULO, comprovante, linhas_fonte, linhas_benef, y)
         
-        # Informações complementares
+        # Quadro 6: Informações Complementares
         if (comprovante.dependentes or comprovante.pensoes_alimenticias or 
             comprovante.previdencias_complementares or comprovante.planos_saude or
             comprovante.reembolsos_medicos):
-            y, paginas_adicionais = self._simular_info_complementares(y, comprovante, paginas)
-            paginas += paginas_adicionais
-        
-        return paginas
-    
-    def _simular_cabecalho(self, y: float) -> float:
-        """Simula desenho do cabeçalho"""
-        return y - 40*mm
-    
-    def _simular_fonte_pagadora(self, y: float) -> float:
-        """Simula desenho da fonte pagadora"""
-        return y - 20*mm
-    
-    def _simular_beneficiario(self, y: float) -> float:
-        """Simula desenho do beneficiário"""
-        return y - 20*mm
-    
-    def _simular_rendimentos_tributaveis(self, y: float) -> float:
-        """Simula desenho dos rendimentos tributáveis"""
-        return y - 35*mm
-    
-    def _simular_rendimentos_isentos(self, y: float) -> float:
-        """Simula desenho dos rendimentos isentos"""
-        return y - 40*mm
-    
-    def _simular_rendimentos_exclusivos(self, y: float) -> float:
-        """Simula desenho dos rendimentos exclusivos"""
-        return y - 20*mm
-    
-    def _simular_info_complementares(self, y: float, comprovante: ComprovanteRendimentos, 
-                                     pagina_atual: int) -> Tuple[float, int]:
-        """Simula desenho das informações complementares e retorna páginas adicionais"""
-        paginas_adicionais = 0
-        y_inicial = y
-        
-        # Título da seção
-        y -= 15*mm
-        
-        # Dependentes
-        if comprovante.dependentes:
-            y -= 10*mm
-            y -= len(comprovante.dependentes) * 6.5*mm
-        
-        # Pensões
-        if comprovante.pensoes_alimenticias:
-            if y < 40*mm:
-                paginas_adicionais += 1
-                y = self.page_height - self.margin_top - 10*mm
-            y -= 10*mm
-            y -= len(comprovante.pensoes_alimenticias) * 6.5*mm
-        
-        # Previdências
-        if comprovante.previdencias_complementares:
-            if y < 40*mm:
-                paginas_adicionais += 1
-                y = self.page_height - self.margin_top - 10*mm
-            y -= 10*mm
-            y -= len(comprovante.previdencias_complementares) * 6.5*mm
-        
-        # Planos de saúde
-        if comprovante.planos_saude:
-            if y < 40*mm:
-                paginas_adicionais += 1
-                y = self.page_height - self.margin_top - 10*mm
-            y -= 10*mm
-            for plano in comprovante.planos_saude:
-                y -= 10*mm + len(plano.dependentes) * 5*mm
-                if y < 40*mm:
-                    paginas_adicionais += 1
-                    y = self.page_height - self.margin_top - 10*mm
-        
-        # Reembolsos
-        if comprovante.reembolsos_medicos:
-            if y < 40*mm:
-                paginas_adicionais += 1
-                y = self.page_height - self.margin_top - 10*mm
-            y -= 10*mm
-            y -= len(comprovante.reembolsos_medicos) * 6.5*mm
-        
-        # INFO RRA
-        if comprovante.info_rra:
-            if y < 40*mm:
-                paginas_adicionais += 1
-                y = self.page_height - self.margin_top - 10*mm
-            y -= 15*mm  # Título + conteúdo
-            if comprovante.info_rra.advogados:
-                y -= len(comprovante.info_rra.advogados) * 6*mm
-        
-        # PAGAMENTO NO EXTERIOR
-        if comprovante.pagamento_exterior:
-            if y < 40*mm:
-                paginas_adicionais += 1
-                y = self.page_height - self.margin_top - 10*mm
-            y -= 20*mm
-        
-        # PROCESSOS JUDICIAIS
-        if comprovante.processos_judiciais:
-            if y < 40*mm:
-                paginas_adicionais += 1
-                y = self.page_height - self.margin_top - 10*mm
-            y -= 10*mm
-            y -= len(comprovante.processos_judiciais) * 15*mm
-        
-        # INFO IR CR
-        if comprovante.info_ir_cr:
-            if y < 40*mm:
-                paginas_adicionais += 1
-                y = self.page_height - self.margin_top - 10*mm
-            y -= 10*mm
-            for info_cr in comprovante.info_ir_cr:
-                y -= 8*mm
-                if info_cr.ded_depen:
-                    y -= len(info_cr.ded_depen) * 6*mm
-        
-        # INFO PROC JUD RUB
-        if comprovante.info_proc_jud_rub:
-            if y < 40*mm:
-                paginas_adicionais += 1
-                y = self.page_height - self.margin_top - 10*mm
-            y -= 10*mm
-            y -= len(comprovante.info_proc_jud_rub) * 12*mm
-        
-        # TOT APUR DIA
-        if comprovante.tot_apur_dia:
-            if y < 40*mm:
-                paginas_adicionais += 1
-                y = self.page_height - self.margin_top - 10*mm
-            y -= 10*mm
-            y -= len(comprovante.tot_apur_dia) * 12*mm
-        
-        # TOT INFO DM DEV
-        if comprovante.tot_info_dm_dev:
-            if y < 40*mm:
-                paginas_adicionais += 1
-                y = self.page_height - self.margin_top - 10*mm
-            y -= 20*mm
-        
-        # CONSOLID APUR MEN
-        if comprovante.consolid_apur_men:
-            if y < 40*mm:
-                paginas_adicionais += 1
-                y = self.page_height - self.margin_top - 10*mm
-            y -= 10*mm
-            y -= len(comprovante.consolid_apur_men) * 15*mm
+            y, pagina_atual = self._desenhar_info_complementares(c, comprovante, y, pagina_atual, total_pages)
         
-        # PER ANT
-        if comprovante.per_ant:
-            if y < 40*mm:
-                paginas_adicionais += 1
-                y = self.page_height - self.margin_top - 10*mm
-            y -= 10*mm
+        # Rodapé da última página
+        self._desenhar_rodape(c, y, pagina_atual, total_pages)
         
-        return y, paginas_adicionais
+        # Retornar número real de páginas
+        return pagina_atual
     
-    def _gerar_conteudo(self, c: canvas.Canvas, comprovante: ComprovanteRendimentos, total_pages: int) -> int:
-        """Gera o conteúdo completo do PDF e retorna o número real de páginas"""
-        pagina_atual = 1
-        y = self.page_height - self.margin_top
-        
+    @classmethod
+    def _esqueleto(cls, ano: str, n_linhas_fonte: int, n_linhas_benef: int) -> Tuple[str, List[tuple]]:
+        """Nome e operações do esqueleto da página 1 (gravadas uma vez por processo)
+
+        A posição dos quadros 2 a 5 depende só do número de linhas dos nomes
+        da fonte pagadora e do beneficiário, então há um esqueleto por ano e
+        combinação de linhas.
+        """
+        chave = (ano, n_linhas_fonte, n_linhas_benef)
+        esqueleto = cls._esqueletos.get(chave)
+        if esqueleto is None:
+            gravacao = LayoutPaginado()
+            gerador = cls()
+            comprovante = ComprovanteRendimentos(ano, FontePagadora(), Beneficiario(), RendimentoTributavel(),
+                                                 RendimentoIsento(), RendimentoExclusivo())
+            gerador._desenhar_quadros(_CANVAS_NULO, gravacao, comprovante, [''] * n_linhas_fonte,
+                                      [''] * n_linhas_benef, gerador.page_height - gerador.margin_top)
+            esqueleto = (f"{cls.FORM_ESQUELETO}{len(cls._esqueletos) + 1}", gravacao.paginas[0])
+            cls._esqueletos[chave] = esqueleto
+        return esqueleto
+    
+    def _desenhar_quadros(self, c: canvas.Canvas, fixo: canvas.Canvas, comprovante: ComprovanteRendimentos,
+                          linhas_fonte: List[str], linhas_benef: List[str], y: float) -> float:
+        """Cabeçalho e quadros 1 a 5: o que é fixo vai para `fixo`, os valores para `c`"""
         # Cabeçalho
-        y = self._desenhar_cabecalho(c, comprovante.ano, y)
+        y = self._desenhar_cabecalho(fixo, comprovante.ano, y)
         y -= 6*mm
         
         # Quadro 1: Fonte Pagadora
-        y = self._desenhar_fonte_pagadora(c, comprovante.fonte_pagadora, y)
+        y = self._desenhar_fonte_pagadora(c, fixo, linhas_fonte, comprovante.fonte_pagadora, y)
         y -= 6*mm
         
         # Quadro 2: Beneficiário
-        y = self._desenhar_beneficiario(c, comprovante.beneficiario, y)
+        y = self._desenhar_beneficiario(c, fixo, linhas_benef, comprovante.beneficiario, y)
         y -= 6*mm
         
         # Quadro 3: Rendimentos Tributáveis
-        y = self._desenhar_rendimentos_tributaveis(c, comprovante.rendimento_tributavel, y)
+        y = self._desenhar_rendimentos_tributaveis(c, fixo, comprovante.rendimento_tributavel, y)
         y -= 6*mm
         
         # Quadro 4: Rendimentos Isentos
-        y = self._desenhar_rendimentos_isentos(c, comprovante.rendimento_isento, y)
+        y = self._desenhar_rendimentos_isentos(c, fixo, comprovante.rendimento_isento, y)
         y -= 6*mm
         
         # Quadro 5: Rendimentos Exclusivos
-        y = self._desenhar_rendimentos_exclusivos(c, comprovante.rendimento_exclusivo, y)
+        y = self._desenhar_rendimentos_exclusivos(c, fixo, comprovante.rendimento_exclusivo, y)
         y -= 6*mm
         
-        # Quadro 6: Informações Complementares
-        if (comprovante.dependentes or comprovante.pensoes_alimenticias or 
-            comprovante.previdencias_complementares or comprovante.planos_saude or
-            comprovante.reembolsos_medicos):
-            y, pagina_atual = self._desenhar_info_complementares(c, comprovante, y, pagina_atual, total_pages)
-        
-        # Rodapé da última página
-        self._desenhar_rodape(c, y, pagina_atual, total_pages)
-        
-        # Retornar número real de páginas
-        return pagina_atual
+        return y
     
     def _desenhar_cabecalho(self, c: canvas.Canvas, ano: str, y: float) -> float:
         """Desenha o cabeçalho do comprovante"""
@@ -1494,85 +1878,98 @@ class PDFGenerator:
         
         return y
     
-    def _desenhar_fonte_pagadora(self, c: canvas.Canvas, fonte: FontePagadora, y: float) -> float:
+    def _desenhar_rotulo_valor(self, c: canvas.Canvas, fixo: canvas.Canvas, y: float, rotulo: str, valor: str):
+        """Rótulo em `fixo` e o valor logo após ele em `c` (Helvetica 12)"""
+        fixo.drawString(self.margin_left, y, rotulo)
+        c.drawString(self.margin_left + stringWidth(rotulo, "Helvetica", 12), y, valor)
+    
+    def _desenhar_fonte_pagadora(self, c: canvas.Canvas, fixo: canvas.Canvas, nome_lines: List[str],
+                                 fonte: FontePagadora, y: float) -> float:
         """Desenha os dados da fonte pagadora"""
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(self.margin_left, y, "1. FONTE PAGADORA (PESSOA JURÍDICA OU PESSOA FÍSICA)")
+        fixo.setFont("Helvetica-Bold", 12)
+        fixo.drawString(self.margin_left, y, "1. FONTE PAGADORA (PESSOA JURÍDICA OU PESSOA FÍSICA)")
         y -= 6*mm
         
+        fixo.setFont("Helvetica", 12)
         c.setFont("Helvetica", 12)
-        nome_lines = simpleSplit(fonte.nome, "Helvetica", 12, self.content_width - 10*mm)
         for line in nome_lines:
-            c.drawString(self.margin_left, y, f"NOME EMPRESARIAL/NOME: {line}")
+            self._desenhar_rotulo_valor(c, fixo, y, "NOME EMPRESARIAL/NOME: ", line)
             y -= 4.5*mm
         
-        c.drawString(self.margin_left, y, f"CNPJ: {self._formatar_cnpj(fonte.cnpj)}")
+        self._desenhar_rotulo_valor(c, fixo, y, "CNPJ: ", self._formatar_cnpj(fonte.cnpj))
         y -= 6*mm
         
         # Linha separadora
-        c.line(self.margin_left, y, self.page_width - self.margin_right, y)
+        fixo.line(self.margin_left, y, self.page_width - self.margin_right, y)
         y -= 6*mm
         
         return y
     
-    def _desenhar_beneficiario(self, c: canvas.Canvas, beneficiario: Beneficiario, y: float) -> float:
+    def _desenhar_beneficiario(self, c: canvas.Canvas, fixo: canvas.Canvas, nome_lines: List[str],
+                               beneficiario: Beneficiario, y: float) -> float:
         """Desenha os dados do beneficiário"""
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(self.margin_left, y, "2. PESSOA FÍSICA BENEFICIÁRIA DOS RENDIMENTOS")
+        fixo.setFont("Helvetica-Bold", 12)
+        fixo.drawString(self.margin_left, y, "2. PESSOA FÍSICA BENEFICIÁRIA DOS RENDIMENTOS")
         y -= 6*mm
         
+        fixo.setFont("Helvetica", 12)
         c.setFont("Helvetica", 12)
-        c.drawString(self.margin_left, y, f"CPF: {self._formatar_cpf(beneficiario.cpf)}")
+        self._desenhar_rotulo_valor(c, fixo, y, "CPF: ", self._formatar_cpf(beneficiario.cpf))
         y -= 4.5*mm
         
-        nome_lines = simpleSplit(beneficiario.nome, "Helvetica", 12, self.content_width - 10*mm)
         for line in nome_lines:
-            c.drawString(self.margin_left, y, f"NOME COMPLETO: {line}")
+            self._desenhar_rotulo_valor(c, fixo, y, "NOME COMPLETO: ", line)
             y -= 4.5*mm
         
         y -= 1.5*mm
         
         # Linha separadora
-        c.line(self.margin_left, y, self.page_width - self.margin_right, y)
+        fixo.line(self.margin_left, y, self.page_width - self.margin_right, y)
         y -= 6*mm
         
         return y
     
-    def _desenhar_rendimentos_tributaveis(self, c: canvas.Canvas, rend: RendimentoTributavel, y: float) -> float:
-        """Desenha os rendimentos tributáveis"""
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(self.margin_left, y, "3. RENDIMENTOS TRIBUTÁVEIS, DEDUÇÕES E IMPOSTO RETIDO NA FONTE")
-        y -= 6*mm
-        
+    def _desenhar_valores(self, c: canvas.Canvas, fixo: canvas.Canvas, dados: List[Tuple[str, float]],
+                          y: float) -> float:
+        """Linhas "descrição ... valor" de um quadro: descrição em `fixo`, valor em `c`"""
+        fixo.setFont("Helvetica", 12)
         c.setFont("Helvetica", 12)
-        dados = [
-            ("01. Total de Rendimentos (inclusive férias)", rend.total_rendimentos),
-            ("02. Contribuição Previdenciária Oficial", rend.contrib_previdenciaria),
-            ("03. Contribuição à Previdência Privada e FAPI", rend.contrib_prev_privada),
-            ("04. Pensão Alimentícia", rend.pensao_alimenticia),
-            ("05. Imposto de Renda Retido", rend.imposto_retido),
-        ]
-        
         for descricao, valor in dados:
-            c.drawString(self.margin_left, y, descricao)
+            fixo.drawString(self.margin_left, y, descricao)
             c.drawRightString(self.page_width - self.margin_right, y, self._formatar_valor(valor))
             y -= 4.5*mm
         
         y -= 1.5*mm
         
         # Linha separadora
-        c.line(self.margin_left, y, self.page_width - self.margin_right, y)
+        fixo.line(self.margin_left, y, self.page_width - self.margin_right, y)
         y -= 6*mm
         
         return y
     
-    def _desenhar_rendimentos_isentos(self, c: canvas.Canvas, rend: RendimentoIsento, y: float) -> float:
+    def _desenhar_rendimentos_tributaveis(self, c: canvas.Canvas, fixo: canvas.Canvas, rend: RendimentoTributavel,
+                                          y: float) -> float:
+        """Desenha os rendimentos tributáveis"""
+        fixo.setFont("Helvetica-Bold", 12)
+        fixo.drawString(self.margin_left, y, "3. RENDIMENTOS TRIBUTÁVEIS, DEDUÇÕES E IMPOSTO RETIDO NA FONTE")
+        y -= 6*mm
+        
+        dados = [
+            ("01. Total de Rendimentos (inclusive férias)", rend.total_rendimentos),
+            ("02. Contribuição Previdenciária Oficial", rend.contrib_previdenciaria),
+            ("03. Contribuição à Previdência Privada e FAPI", rend.contrib_prev_privada),
+            ("04. Pensão Alimentícia", rend.pensao_alimenticia),
+            ("05. Imposto de Renda Retido", rend.imposto_retido),
+        ]
+        return self._desenhar_valores(c, fixo, dados, y)
+    
+    def _desenhar_rendimentos_isentos(self, c: canvas.Canvas, fixo: canvas.Canvas, rend: RendimentoIsento,
+                                      y: float) -> float:
         """Desenha os rendimentos isentos"""
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(self.margin_left, y, "4. RENDIMENTOS ISENTOS E NÃO TRIBUTÁVEIS")
+        fixo.setFont("Helvetica-Bold", 12)
+        fixo.drawString(self.margin_left, y, "4. RENDIMENTOS ISENTOS E NÃO TRIBUTÁVEIS")
         y -= 6*mm
         
-        c.setFont("Helvetica", 12)
         dados = [
             ("01. Parcela Isenta dos Proventos de Aposentadoria (65 anos ou mais)", rend.parcela_isenta_65),
             ("02. Diárias e Ajudas de Custo", rend.diarias + rend.ajuda_custo),
@@ -1580,44 +1977,20 @@ class PDFGenerator:
             ("04. Abono Pecuniário", rend.abono_pecuniario),
             ("05. Outros", rend.molestia_grave + rend.outros),
         ]
-        
-        for descricao, valor in dados:
-            c.drawString(self.margin_left, y, descricao)
-            c.drawRightString(self.page_width - self.margin_right, y, self._formatar_valor(valor))
-            y -= 4.5*mm
-        
-        y -= 1.5*mm
-        
-        # Linha separadora
-        c.line(self.margin_left, y, self.page_width - self.margin_right, y)
-        y -= 6*mm
-        
-        return y
+        return self._desenhar_valores(c, fixo, dados, y)
     
-    def _desenhar_rendimentos_exclusivos(self, c: canvas.Canvas, rend: RendimentoExclusivo, y: float) -> float:
+    def _desenhar_rendimentos_exclusivos(self, c: canvas.Canvas, fixo: canvas.Canvas, rend: RendimentoExclusivo,
+                                         y: float) -> float:
         """Desenha os rendimentos com tributação exclusiva"""
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(self.margin_left, y, "5. RENDIMENTOS SUJEITOS À TRIBUTAÇÃO EXCLUSIVA (RENDIMENTO LÍQUIDO)")
+        fixo.setFont("Helvetica-Bold", 12)
+        fixo.drawString(self.margin_left, y, "5. RENDIMENTOS SUJEITOS À TRIBUTAÇÃO EXCLUSIVA (RENDIMENTO LÍQUIDO)")
         y -= 6*mm
         
-        c.setFont("Helvetica", 12)
         dados = [
             ("01. Décimo Terceiro Salário", rend.decimo_terceiro),
             ("02. Outros", rend.plr + rend.rra + rend.outros),
         ]
-        
-        for descricao, valor in dados:
-            c.drawString(self.margin_left, y, descricao)
-            c.drawRightString(self.page_width - self.margin_right, y, self._formatar_valor(valor))
-            y -= 4.5*mm
-        
-        y -= 1.5*mm
-        
-        # Linha separadora
-        c.line(self.margin_left, y, self.page_width - self.margin_right, y)
-        y -= 6*mm
-        
-        return y
+        return self._desenhar_valores(c, fixo, dados, y)
     
     def _desenhar_info_complementares(self, c: canvas.Canvas, comprovante: ComprovanteRendimentos, 
                                      y: float, pagina_atual: int, total_pages: int) -> Tuple[float, int]:
@@ -2232,18 +2605,42 @@ class PDFGenerator:
         
         return y, pagina_atual
     
-    def _desenhar_rodape(self, c: canvas.Canvas, y: float, pagina_atual: int, total_pages: int):
-        """Desenha o rodapé com data/hora e paginação"""
+    def _desenhar_rodape(self, c: canvas.Canvas, y: float, pagina_atual: int, total_pages: Optional[int]):
+        """Desenha o rodapé com data/hora e paginação
+
+        Com total_pages=None o total é resolvido depois: pelo LayoutPaginado na
+        emissão ou pelo form XObject definido em _definir_total_paginas.
+        """
         y_rodape = self.margin_bottom + 5*mm
-        
+
         c.setFont("Helvetica", 10)
         data_hora = datetime.now().strftime('%d/%m/%Y às %H:%M')
         c.drawString(self.margin_left, y_rodape, f"Documento gerado eletronicamente em {data_hora}")
-        
+
         # Paginação
-        paginacao = f"Página {pagina_atual} de {total_pages}"
-        c.drawRightString(self.page_width - self.margin_right, y_rodape, paginacao)
+        if total_pages is None and self.modo_paginacao == 'xobject':
+            # Reservar a largura do total com a mesma quantidade de dígitos da
+            # página atual (dígitos da Helvetica têm largura fixa)
+            x_total = (self.page_width - self.margin_right -
+                       stringWidth('0' * len(str(pagina_atual)), "Helvetica", 10))
+            c.drawRightString(x_total, y_rodape, f"Página {pagina_atual} de ")
+            c.saveState()
+            c.translate(x_total, y_rodape)
+            c.doForm(self.form_total_paginas)
+            c.restoreState()
+        elif total_pages is None:
+            c.paginacao(self.page_width - self.margin_right, y_rodape, pagina_atual)
+        else:
+            paginacao = f"Página {pagina_atual} de {total_pages}"
+            c.drawRightString(self.page_width - self.margin_right, y_rodape, paginacao)
     
+    def _definir_total_paginas(self, c: canvas.Canvas, total_pages: int):
+        """Define o form XObject com o total de páginas referenciado nos rodapés"""
+        c.beginForm(self.form_total_paginas, lowerx=0, lowery=-5, upperx=50, uppery=15)
+        c.setFont("Helvetica", 10)
+        c.drawString(0, 0, str(total_pages))
+        c.endForm()
+
     def _formatar_cpf(self, cpf: str) -> str:
         """Formata CPF no padrão XXX.XXX.XXX-XX"""
         cpf = ''.join(filter(str.isdigit, cpf))
@@ -2283,86 +2680,189 @@ class PDFGenerator:
         return tipos.get(tp_prev, 'Não especificado')
 
 
-def consolidar_comprovantes(comprovantes: List[ComprovanteRendimentos]) -> ComprovanteRendimentos:
-    """Consolida múltiplos comprovantes do mesmo CPF em um único"""
-    if not comprovantes:
-        return None
+def _somar_quadros(consolidado: ComprovanteRendimentos, comp: ComprovanteRendimentos):
+    """Soma os quadros 3 a 5 campo a campo (comprovantes sem totais em centavos)"""
+    # Rendimentos tributáveis
+    consolidado.rendimento_tributavel.total_rendimentos += comp.rendimento_tributavel.total_rendimentos
+    consolidado.rendimento_tributavel.contrib_previdenciaria += comp.rendimento_tributavel.contrib_previdenciaria
+    consolidado.rendimento_tributavel.contrib_prev_privada += comp.rendimento_tributavel.contrib_prev_privada
+    consolidado.rendimento_tributavel.pensao_alimenticia += comp.rendimento_tributavel.pensao_alimenticia
+    consolidado.rendimento_tributavel.imposto_retido += comp.rendimento_tributavel.imposto_retido
     
-    if len(comprovantes) == 1:
-        return comprovantes[0]
+    # Rendimentos isentos
+    consolidado.rendimento_isento.parcela_isenta_65 += comp.rendimento_isento.parcela_isenta_65
+    consolidado.rendimento_isento.diarias += comp.rendimento_isento.diarias
+    consolidado.rendimento_isento.ajuda_custo += comp.rendimento_isento.ajuda_custo
+    consolidado.rendimento_isento.indenizacoes += comp.rendimento_isento.indenizacoes
+    consolidado.rendimento_isento.abono_pecuniario += comp.rendimento_isento.abono_pecuniario
+    consolidado.rendimento_isento.molestia_grave += comp.rendimento_isento.molestia_grave
+    consolidado.rendimento_isento.outros += comp.rendimento_isento.outros
     
-    # Usar primeiro como base
-    consolidado = comprovantes[0]
-    
-    # Consolidar valores de todos os outros
-    for comp in comprovantes[1:]:
-        # Rendimentos tributáveis
-        consolidado.rendimento_tributavel.total_rendimentos += comp.rendimento_tributavel.total_rendimentos
-        consolidado.rendimento_tributavel.contrib_previdenciaria += comp.rendimento_tributavel.contrib_previdenciaria
-        consolidado.rendimento_tributavel.contrib_prev_privada += comp.rendimento_tributavel.contrib_prev_privada
-        consolidado.rendimento_tributavel.pensao_alimenticia += comp.rendimento_tributavel.pensao_alimenticia
-        consolidado.rendimento_tributavel.imposto_retido += comp.rendimento_tributavel.imposto_retido
-        
-        # Rendimentos isentos
-        consolidado.rendimento_isento.parcela_isenta_65 += comp.rendimento_isento.parcela_isenta_65
-        consolidado.rendimento_isento.diarias += comp.rendimento_isento.diarias
-        consolidado.rendimento_isento.ajuda_custo += comp.rendimento_isento.ajuda_custo
-        consolidado.rendimento_isento.indenizacoes += comp.rendimento_isento.indenizacoes
-        consolidado.rendimento_isento.abono_pecuniario += comp.rendimento_isento.abono_pecuniario
-        consolidado.rendimento_isento.molestia_grave += comp.rendimento_isento.molestia_grave
-        consolidado.rendimento_isento.outros += comp.rendimento_isento.outros
-        
-        # Rendimentos exclusivos
-        consolidado.rendimento_exclusivo.decimo_terceiro += comp.rendimento_exclusivo.decimo_terceiro
-        consolidado.rendimento_exclusivo.plr += comp.rendimento_exclusivo.plr
-        consolidado.rendimento_exclusivo.rra += comp.rendimento_exclusivo.rra
-        consolidado.rendimento_exclusivo.outros += comp.rendimento_exclusivo.outros
-        
+    # Rendimentos exclusivos
+    consolidado.rendimento_exclusivo.decimo_terceiro += comp.rendimento_exclusivo.decimo_terceiro
+    consolidado.rendimento_exclusivo.plr += comp.rendimento_exclusivo.plr
+    consolidado.rendimento_exclusivo.rra += comp.rendimento_exclusivo.rra
+    consolidado.rendimento_exclusivo.outros += comp.rendimento_exclusivo.outros
+
+
+class ConsolidadorComprovantes:
+    """Consolidação incremental (fold) de comprovantes do mesmo CPF
+
+    Mantém índices por chave durante todo o fold (CPF do dependente e do
+    beneficiário da pensão, CNPJ da previdência e da operadora), de modo que
+    cada entidade é mesclada em O(1). Os comprovantes recebidos não são
+    alterados: previdências e planos somados são cópias, e resultado() monta
+    um comprovante novo. Regras mantidas da consolidação original:
+    - o primeiro comprovante define ano, fonte pagadora, beneficiário e os
+      grupos de ocorrência única (infoRRA, infoPgtoExt, perAnt, ...)
+    - dependentes e pensões: a primeira ocorrência de cada CPF vale
+    - previdências e planos: a primeira ocorrência de cada CNPJ recebe a soma
+      de valor / valor_titular das seguintes
+    - reembolsos, processos, infoIRCR e totalizadores são concatenados
+    Os quadros 3 a 5 são somados em centavos enquanto todos os comprovantes
+    trazem centavos_tp_info_ir; o primeiro que não traz converte o acumulado
+    para os campos float, que passam a ser somados campo a campo.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self._consolidado: Optional[ComprovanteRendimentos] = None
+        self._centavos: Optional[List[int]] = None
+        self._dependentes: set = set()
+        self._pensoes: set = set()
+        self._previdencias: Dict[str, PrevidenciaComplementar] = {}
+        self._planos: Dict[str, PlanoSaude] = {}
+
+    def adicionar(self, comp: ComprovanteRendimentos):
+        """Mescla mais um comprovante no consolidado"""
+        self.total += 1
+        if self._consolidado is None:
+            self._iniciar(comp)
+            return
+        consolidado = self._consolidado
+
+        # Quadros 3 a 5
+        if self._centavos is not None and comp.centavos_tp_info_ir is not None:
+            centavos = self._centavos
+            for slot, valor in enumerate(comp.centavos_tp_info_ir):
+                centavos[slot] += valor
+        else:
+            self._quadros_em_float()
+            _somar_quadros(consolidado, comp)
+
         # Mesclar listas (sem duplicatas por CPF)
-        cpfs_dep = {d.cpf for d in consolidado.dependentes}
+        vistos = self._dependentes
         for dep in comp.dependentes:
-            if dep.cpf not in cpfs_dep:
+            if dep.cpf not in vistos:
                 consolidado.dependentes.append(dep)
-                cpfs_dep.add(dep.cpf)
-        
-        cpfs_pensao = {p.cpf_beneficiario for p in consolidado.pensoes_alimenticias}
+                vistos.add(dep.cpf)
+
+        vistos = self._pensoes
         for pensao in comp.pensoes_alimenticias:
-            if pensao.cpf_beneficiario not in cpfs_pensao:
+            if pensao.cpf_beneficiario not in vistos:
                 consolidado.pensoes_alimenticias.append(pensao)
-                cpfs_pensao.add(pensao.cpf_beneficiario)
-        
-        cnpjs_prev = {p.cnpj for p in consolidado.previdencias_complementares}
+                vistos.add(pensao.cpf_beneficiario)
+
+        # Somar valores se o CNPJ já existe
+        indice = self._previdencias
         for prev in comp.previdencias_complementares:
-            if prev.cnpj not in cnpjs_prev:
-                consolidado.previdencias_complementares.append(prev)
-                cnpjs_prev.add(prev.cnpj)
+            existente = indice.get(prev.cnpj)
+            if existente is None:
+                self._indexar_previdencia(replace(prev))
             else:
-                # Somar valores se já existe
-                for p in consolidado.previdencias_complementares:
-                    if p.cnpj == prev.cnpj:
-                        p.valor += prev.valor
-                        break
-        
-        cnpjs_plano = {p.cnpj_operadora for p in consolidado.planos_saude}
+                existente.valor += prev.valor
+
+        indice = self._planos
         for plano in comp.planos_saude:
-            if plano.cnpj_operadora not in cnpjs_plano:
-                consolidado.planos_saude.append(plano)
-                cnpjs_plano.add(plano.cnpj_operadora)
+            existente = indice.get(plano.cnpj_operadora)
+            if existente is None:
+                self._indexar_plano(replace(plano))
             else:
-                # Somar valores se já existe
-                for p in consolidado.planos_saude:
-                    if p.cnpj_operadora == plano.cnpj_operadora:
-                        p.valor_titular += plano.valor_titular
-                        break
-        
+                existente.valor_titular += plano.valor_titular
+
         # Mesclar outras listas
         consolidado.reembolsos_medicos.extend(comp.reembolsos_medicos)
         consolidado.processos_judiciais.extend(comp.processos_judiciais)
         consolidado.info_ir_cr.extend(comp.info_ir_cr)
         consolidado.tot_apur_dia.extend(comp.tot_apur_dia)
         consolidado.consolid_apur_men.extend(comp.consolid_apur_men)
-    
-    return consolidado
+
+    def resultado(self) -> Optional[ComprovanteRendimentos]:
+        """Comprovante consolidado (novo objeto; None se nada foi adicionado)"""
+        consolidado = self._consolidado
+        if consolidado is None:
+            return None
+        if self._centavos is not None:
+            quadros = S5002Parser.montar_quadros(self._centavos)
+            centavos = array('q', self._centavos)
+        else:
+            quadros = (replace(consolidado.rendimento_tributavel), replace(consolidado.rendimento_isento),
+                       replace(consolidado.rendimento_exclusivo))
+            centavos = None
+        return replace(consolidado,
+                       rendimento_tributavel=quadros[0], rendimento_isento=quadros[1],
+                       rendimento_exclusivo=quadros[2], centavos_tp_info_ir=centavos,
+                       dependentes=list(consolidado.dependentes),
+                       pensoes_alimenticias=list(consolidado.pensoes_alimenticias),
+                       previdencias_complementares=[replace(p) for p in consolidado.previdencias_complementares],
+                       planos_saude=[replace(p) for p in consolidado.planos_saude],
+                       reembolsos_medicos=list(consolidado.reembolsos_medicos),
+                       processos_judiciais=list(consolidado.processos_judiciais),
+                       info_ir_cr=list(consolidado.info_ir_cr),
+                       tot_apur_dia=list(consolidado.tot_apur_dia),
+                       consolid_apur_men=list(consolidado.consolid_apur_men))
+
+    def _iniciar(self, comp: ComprovanteRendimentos):
+        """O primeiro comprovante é a base; listas e quadros são copiados"""
+        self._consolidado = replace(
+            comp,
+            rendimento_tributavel=replace(comp.rendimento_tributavel),
+            rendimento_isento=replace(comp.rendimento_isento),
+            rendimento_exclusivo=replace(comp.rendimento_exclusivo),
+            dependentes=list(comp.dependentes),
+            pensoes_alimenticias=list(comp.pensoes_alimenticias),
+            previdencias_complementares=[],
+            planos_saude=[],
+            reembolsos_medicos=list(comp.reembolsos_medicos),
+            processos_judiciais=list(comp.processos_judiciais),
+            info_ir_cr=list(comp.info_ir_cr),
+            tot_apur_dia=list(comp.tot_apur_dia),
+            consolid_apur_men=list(comp.consolid_apur_men),
+        )
+        if comp.centavos_tp_info_ir is not None:
+            self._centavos = list(comp.centavos_tp_info_ir)
+        self._dependentes.update(dep.cpf for dep in comp.dependentes)
+        self._pensoes.update(pensao.cpf_beneficiario for pensao in comp.pensoes_alimenticias)
+        # Todos os itens do primeiro entram (mesmo CNPJ repetido); o índice guarda o primeiro
+        for prev in comp.previdencias_complementares:
+            self._indexar_previdencia(replace(prev))
+        for plano in comp.planos_saude:
+            self._indexar_plano(replace(plano))
+
+    def _indexar_previdencia(self, prev: PrevidenciaComplementar):
+        self._consolidado.previdencias_complementares.append(prev)
+        self._previdencias.setdefault(prev.cnpj, prev)
+
+    def _indexar_plano(self, plano: PlanoSaude):
+        self._consolidado.planos_saude.append(plano)
+        self._planos.setdefault(plano.cnpj_operadora, plano)
+
+    def _quadros_em_float(self):
+        """Passa o acumulado em centavos para os campos float dos quadros (uma vez)"""
+        if self._centavos is not None:
+            consolidado = self._consolidado
+            (consolidado.rendimento_tributavel, consolidado.rendimento_isento,
+             consolidado.rendimento_exclusivo) = S5002Parser.montar_quadros(self._centavos)
+            self._centavos = None
+
+
+def consolidar_comprovantes(comprovantes: List[ComprovanteRendimentos]) -> Optional[ComprovanteRendimentos]:
+    """Consolida múltiplos comprovantes do mesmo CPF em um único (novo objeto)"""
+    consolidador = ConsolidadorComprovantes()
+    for comp in comprovantes:
+        consolidador.adicionar(comp)
+    return consolidador.resultado()
+
 
 class DadosComplementares:
     """Gerenciador de dados complementares (CSVs)"""
@@ -2372,6 +2872,7 @@ class DadosComplementares:
         self.funcionarios = {}
         self.dependentes = {}
         self.entidades = {}
+        self._hash_entidades: Optional[str] = None
         
         if csv_path and os.path.exists(csv_path):
             self._carregar_csv_funcionarios(csv_path)
@@ -2440,10 +2941,25 @@ class DadosComplementares:
         except Exception as e:
             logger.warning(f"Erro ao carregar CSV de entidades {csv_path}: {e}")
     
+    def _funcionario(self, cpf: str) -> Optional[Dict[str, str]]:
+        return self.funcionarios.get(cpf)
+
+    def _dependentes_de(self, cpf_titular: str) -> Dict[str, Dict[str, str]]:
+        return self.dependentes.get(cpf_titular, {})
+
+    def _dependente(self, cpf_titular: str, cpf_dependente: str) -> Optional[Dict[str, str]]:
+        return self.dependentes.get(cpf_titular, {}).get(cpf_dependente)
+
+    def _entidade(self, cnpj: str) -> Optional[Dict[str, str]]:
+        return self.entidades.get(cnpj)
+
+    def _todas_entidades(self) -> List[Tuple[str, Dict[str, str]]]:
+        return sorted(self.entidades.items())
+
     def obter_dados(self, cpf: str) -> Dict[str, str]:
         """Obtém dados complementares para um CPF (compatibilidade)"""
         cpf_limpo = ''.join(filter(str.isdigit, cpf))
-        return self.funcionarios.get(cpf_limpo, {})
+        return self._funcionario(cpf_limpo) or {}
     
     def obter_nome_dependente(self, cpf_titular: str, cpf_dependente: str, nome_xml: str = '') -> str:
         """Obtém nome do dependente com fallback"""
@@ -2455,9 +2971,9 @@ class DadosComplementares:
         cpf_tit_limpo = ''.join(filter(str.isdigit, cpf_titular))
         cpf_dep_limpo = ''.join(filter(str.isdigit, cpf_dependente))
         
-        if cpf_tit_limpo in self.dependentes:
-            if cpf_dep_limpo in self.dependentes[cpf_tit_limpo]:
-                return self.dependentes[cpf_tit_limpo][cpf_dep_limpo]['nome']
+        dependente = self._dependente(cpf_tit_limpo, cpf_dep_limpo)
+        if dependente is not None:
+            return dependente['nome']
         
         # 3. Fallback
         return '(Nome não informado)'
@@ -2471,68 +2987,1116 @@ class DadosComplementares:
         # 2. Tentar CSV de entidades
         cnpj_limpo = ''.join(filter(str.isdigit, cnpj))
         
-        if cnpj_limpo in self.entidades:
-            entidade = self.entidades[cnpj_limpo]
+        entidade = self._entidade(cnpj_limpo)
+        if entidade is not None:
             if entidade['tipo'] == tipo or not tipo:
                 return entidade['nome']
         
         # 3. Fallback
         return '(Nome não informado)'
 
+    def assinatura(self, cpf: str) -> str:
+        """Representação estável das linhas dos CSVs que afetam o comprovante de um CPF
+
+        Inclui o funcionário e seus dependentes; as entidades entram como hash
+        da tabela inteira, pois só são conhecidas após o parse dos XMLs.
+        """
+        if self._hash_entidades is None:
+            self._hash_entidades = hashlib.sha256(
+                repr(self._todas_entidades()).encode('utf-8')
+            ).hexdigest()
+
+        cpf_limpo = ''.join(filter(str.isdigit, cpf))
+        return repr((
+            self._funcionario(cpf_limpo),
+            sorted(self._dependentes_de(cpf_limpo).items()),
+            self._hash_entidades,
+        ))
+
+
+class IndiceCSV:
+    """Índice binário ordenado de um CSV, consultado por busca binária sobre mmap
+
+    Layout do arquivo (little-endian):
+        cabeçalho   MAGICO, largura da chave, largura do prefixo, nº de campos, nº de registros
+        chaves      registros × largura da chave, em ordem, completadas com espaços
+        offsets     (registros + 1) × uint64, início de cada registro no heap
+        heap        campos em UTF-8 separados por \\x1f
+
+    Só as páginas tocadas pela busca são lidas, e o mmap é compartilhado
+    entre processos pelo cache de páginas do sistema operacional.
+    """
+
+    MAGICO = b'S5002IX1'
+    CABECALHO = struct.Struct('<8sHHHI')
+    OFFSET = struct.Struct('<Q')
+    SEPARADOR = '\x1f'
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._abrir()
+
+    def _abrir(self):
+        with open(self.caminho, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magico, self.largura, self.largura_prefixo, self.campos, self.total = \
+            self.CABECALHO.unpack_from(self._mm, 0)
+        if magico != self.MAGICO:
+            raise ValueError(f"Índice inválido: {self.caminho}")
+        self._inicio_chaves = self.CABECALHO.size
+        self._inicio_offsets = self._inicio_chaves + self.total * self.largura
+        self._inicio_heap = self._inicio_offsets + (self.total + 1) * self.OFFSET.size
+
+    def __getstate__(self):
+        # mmap não é serializável: cada processo reabre o arquivo
+        return {'caminho': self.caminho}
+
+    def __setstate__(self, estado):
+        self.caminho = estado['caminho']
+        self._abrir()
+
+    @classmethod
+    def compilar(cls, caminho: str, registros: Dict[str, Tuple[str, ...]],
+                 campos: int, largura_prefixo: int = 0):
+        """Grava o índice de `registros` (chave -> campos) em `caminho`, de forma atômica"""
+        chaves = sorted(registros)
+        largura = max((len(c.encode('utf-8')) for c in chaves), default=1)
+
+        heap = bytearray()
+        offsets = bytearray()
+        for chave in chaves:
+            offsets += cls.OFFSET.pack(len(heap))
+            heap += cls.SEPARADOR.join(registros[chave]).encode('utf-8')
+        offsets += cls.OFFSET.pack(len(heap))
+
+        temporario = caminho + '.tmp'
+        with open(temporario, 'wb') as f:
+            f.write(cls.CABECALHO.pack(cls.MAGICO, largura, largura_prefixo, campos, len(chaves)))
+            for chave in chaves:
+                f.write(chave.encode('utf-8').ljust(largura))
+            f.write(offsets)
+            f.write(heap)
+        os.replace(temporario, caminho)
+
+    def _chave(self, i: int) -> bytes:
+        inicio = self._inicio_chaves + i * self.largura
+        return self._mm[inicio:inicio + self.largura]
+
+    def _limite_inferior(self, alvo: bytes) -> int:
+        baixo, alto = 0, self.total
+        while baixo < alto:
+            meio = (baixo + alto) // 2
+            if self._chave(meio) < alvo:
+                baixo = meio + 1
+            else:
+                alto = meio
+        return baixo
+
+    def _registro(self, i: int) -> Tuple[str, ...]:
+        inicio, fim = struct.unpack_from('<QQ', self._mm, self._inicio_offsets + i * self.OFFSET.size)
+        texto = self._mm[self._inicio_heap + inicio:self._inicio_heap + fim].decode('utf-8')
+        return tuple(texto.split(self.SEPARADOR))
+
+    def obter(self, chave: str) -> Optional[Tuple[str, ...]]:
+        """Campos do registro com a chave exata, ou None"""
+        alvo = chave.encode('utf-8')
+        if len(alvo) > self.largura:
+            return None
+        alvo = alvo.ljust(self.largura)
+        i = self._limite_inferior(alvo)
+        if i < self.total and self._chave(i) == alvo:
+            return self._registro(i)
+        return None
+
+    def prefixo(self, prefixo: str) -> Iterator[Tuple[str, Tuple[str, ...]]]:
+        """Registros cuja chave começa com `prefixo` (completado até a largura do prefixo)"""
+        alvo = prefixo.encode('utf-8').ljust(self.largura_prefixo)
+        if len(alvo) > self.largura_prefixo:
+            return
+        i = self._limite_inferior(alvo)
+        while i < self.total:
+            chave = self._chave(i)
+            if not chave.startswith(alvo):
+                break
+            yield chave[len(alvo):].decode('utf-8').rstrip(' '), self._registro(i)
+            i += 1
+
+    def __iter__(self) -> Iterator[Tuple[str, Tuple[str, ...]]]:
+        for i in range(self.total):
+            yield self._chave(i).decode('utf-8').rstrip(' '), self._registro(i)
+
+
+class DadosComplementaresIndexados(DadosComplementares):
+    """DadosComplementares consultando índices binários (`<csv>.idx`) em vez de dicts
+
+    Os índices são compilados a partir dos CSVs na primeira execução (ou quando
+    o CSV é mais novo que o índice) e reaproveitados nas seguintes. Nenhuma
+    tabela é materializada em memória: cada consulta é uma busca binária.
+    """
+
+    CAMPOS_FUNCIONARIO = ('nome_funcionario', 'nome_empresa', 'cnpj_empresa')
+    CAMPOS_DEPENDENTE = ('nome', 'data_nascimento', 'tipo')
+    CAMPOS_ENTIDADE = ('tipo', 'nome', 'registro')
+    EXTENSAO = '.idx'
+
+    def __init__(self, csv_path: Optional[str] = None, csv_dependentes: Optional[str] = None,
+                 csv_entidades: Optional[str] = None):
+        super().__init__()
+        self._idx_funcionarios = self._preparar_indice(csv_path, 'funcionarios')
+        self._idx_dependentes = self._preparar_indice(csv_dependentes, 'dependentes')
+        self._idx_entidades = self._preparar_indice(csv_entidades, 'entidades')
+
+    def _preparar_indice(self, csv_path: Optional[str], tabela: str) -> Optional[IndiceCSV]:
+        """Abre o índice do CSV, compilando-o antes se estiver ausente ou desatualizado"""
+        if not csv_path or not os.path.exists(csv_path):
+            return None
+
+        caminho_idx = csv_path + self.EXTENSAO
+        if (not os.path.exists(caminho_idx)
+                or os.stat(caminho_idx).st_mtime_ns < os.stat(csv_path).st_mtime_ns):
+            self._compilar(csv_path, tabela, caminho_idx)
+
+        indice = IndiceCSV(caminho_idx)
+        logger.info(f"Índice {caminho_idx}: {indice.total} registros de {tabela}")
+        return indice
+
+    @classmethod
+    def _compilar(cls, csv_path: str, tabela: str, caminho_idx: str):
+        """Compila o índice reaproveitando o carregamento do CSV de DadosComplementares"""
+        inicio = time.perf_counter()
+        if tabela == 'funcionarios':
+            dados = DadosComplementares(csv_path=csv_path).funcionarios
+            registros = {cpf: tuple(d[c] for c in cls.CAMPOS_FUNCIONARIO) for cpf, d in dados.items()}
+            IndiceCSV.compilar(caminho_idx, registros, len(cls.CAMPOS_FUNCIONARIO))
+        elif tabela == 'dependentes':
+            dados = DadosComplementares(csv_dependentes=csv_path).dependentes
+            largura_titular = max((len(t.encode('utf-8')) for t in dados), default=1)
+            registros = {
+                titular.ljust(largura_titular) + cpf_dep: tuple(d[c] for c in cls.CAMPOS_DEPENDENTE)
+                for titular, deps in dados.items()
+                for cpf_dep, d in deps.items()
+            }
+            IndiceCSV.compilar(caminho_idx, registros, len(cls.CAMPOS_DEPENDENTE), largura_titular)
+        else:
+            dados = DadosComplementares(csv_entidades=csv_path).entidades
+            registros = {cnpj: tuple(d[c] for c in cls.CAMPOS_ENTIDADE) for cnpj, d in dados.items()}
+            IndiceCSV.compilar(caminho_idx, registros, len(cls.CAMPOS_ENTIDADE))
+        logger.info(f"Índice compilado: {caminho_idx} ({time.perf_counter() - inicio:.2f}s)")
+
+    def _funcionario(self, cpf: str) -> Optional[Dict[str, str]]:
+        if self._idx_funcionarios is None:
+            return None
+        campos = self._idx_funcionarios.obter(cpf)
+        return dict(zip(self.CAMPOS_FUNCIONARIO, campos)) if campos is not None else None
+
+    def _dependentes_de(self, cpf_titular: str) -> Dict[str, Dict[str, str]]:
+        if self._idx_dependentes is None:
+            return {}
+        return {
+            cpf_dep: dict(zip(self.CAMPOS_DEPENDENTE, campos))
+            for cpf_dep, campos in self._idx_dependentes.prefixo(cpf_titular)
+        }
+
+    def _dependente(self, cpf_titular: str, cpf_dependente: str) -> Optional[Dict[str, str]]:
+        if self._idx_dependentes is None:
+            return None
+        largura_titular = self._idx_dependentes.largura_prefixo
+        if len(cpf_titular.encode('utf-8')) > largura_titular:
+            return None
+        campos = self._idx_dependentes.obter(cpf_titular.ljust(largura_titular) + cpf_dependente)
+        return dict(zip(self.CAMPOS_DEPENDENTE, campos)) if campos is not None else None
+
+    def _entidade(self, cnpj: str) -> Optional[Dict[str, str]]:
+        if self._idx_entidades is None:
+            return None
+        campos = self._idx_entidades.obter(cnpj)
+        return dict(zip(self.CAMPOS_ENTIDADE, campos)) if campos is not None else None
+
+    def _todas_entidades(self) -> List[Tuple[str, Dict[str, str]]]:
+        if self._idx_entidades is None:
+            return []
+        return [(cnpj, dict(zip(self.CAMPOS_ENTIDADE, campos))) for cnpj, campos in self._idx_entidades]
+
+
+class CacheComprovantes:
+    """Manifesto persistente (SQLite) dos PDFs já gerados, por grupo de CPF
+
+    Cada CPF é associado ao hash do conteúdo dos seus XMLs, das linhas
+    relevantes dos CSVs, do ano-calendário e da versão do gerador. Grupos com
+    o mesmo hash e cujo PDF ainda existe não são processados novamente.
+    """
+
+    ARQUIVO = '.s5002_cache.sqlite'
+
+    def __init__(self, output_dir: str):
+        self.caminho = os.path.join(output_dir, self.ARQUIVO)
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def __getstate__(self):
+        # A conexão não é serializável; cada processo abre a sua
+        estado = self.__dict__.copy()
+        estado['_conn'] = None
+        return estado
+
+    def _conexao(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.caminho, timeout=60)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        return self._conn
+
+    def preparar(self):
+        """Cria a tabela do manifesto (chamado uma vez no processo principal)"""
+        conn = self._conexao()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS comprovantes ('
+            'cpf TEXT PRIMARY KEY, hash TEXT NOT NULL, pdf TEXT NOT NULL, gerado_em TEXT NOT NULL)'
+        )
+        conn.commit()
+
+    def pdf_atualizado(self, cpf: str, hash_grupo: str) -> Optional[str]:
+        """PDF registrado para o CPF com o mesmo hash, se ainda existir"""
+        linha = self._conexao().execute(
+            'SELECT hash, pdf FROM comprovantes WHERE cpf = ?', (cpf,)
+        ).fetchone()
+        if linha is not None and linha[0] == hash_grupo and os.path.exists(linha[1]):
+            return linha[1]
+        return None
+
+    def registrar(self, cpf: str, hash_grupo: str, pdf_path: str):
+        """Registra o hash do PDF gerado para o CPF"""
+        conn = self._conexao()
+        conn.execute(
+            'INSERT OR REPLACE INTO comprovantes (cpf, hash, pdf, gerado_em) VALUES (?, ?, ?, ?)',
+            (cpf, hash_grupo, pdf_path, datetime.now().isoformat(timespec='seconds'))
+        )
+        conn.commit()
+
+
+def calcular_hash_grupo(xml_paths: List[FonteXML], dados_compl: DadosComplementares, cpf: str,
+                        ano: str, modo_paginacao: str, layout: str = 'plano') -> str:
+    """Hash do que determina o PDF de um grupo: XMLs, CSVs, ano, versão do gerador e layout da saída"""
+    h = hashlib.sha256()
+    h.update(f"{__version__}|{modo_paginacao}|{ano}|".encode('utf-8'))
+    if layout != 'plano':
+        h.update(f"{layout}|".encode('utf-8'))
+    h.update(dados_compl.assinatura(cpf).encode('utf-8'))
+    for xml_path in xml_paths:
+        h.update(b'|')
+        with _abrir_xml(xml_path) as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(bloco)
+    return h.hexdigest()
+
+
+def nome_arquivo_pdf(ano: str, cpf: str) -> str:
+    """Nome do PDF de um CPF: irpf{ano}-XXX_XXX_XXX_XX.pdf"""
+    cpf_formatado = ''.join(filter(str.isdigit, cpf))
+    if len(cpf_formatado) == 11:
+        cpf_mask = f"{cpf_formatado[:3]}_{cpf_formatado[3:6]}_{cpf_formatado[6:9]}_{cpf_formatado[9:]}"
+    else:
+        cpf_mask = cpf_formatado
+    return f"irpf{ano}-{cpf_mask}.pdf"
+
+
+def nome_arquivo_pdf_cnpj(ano: str, cnpj: str, extensao: str = 'pdf', parte: int = 0) -> str:
+    """Nome do PDF em lote (ou do ZIP, com --saida zip) de uma fonte pagadora: irpf{ano}-cnpj-XX_XXX_XXX_XXXX_XX.pdf
+
+    Uma fonte pagadora dividida em vários PDFs (--comprovantes-por-pdf) tem
+    o número da parte no nome: irpf{ano}-cnpj-XX_XXX_XXX_XXXX_XX-parte-001.pdf
+    """
+    cnpj_formatado = ''.join(filter(str.isdigit, cnpj))
+    if len(cnpj_formatado) == 14:
+        cnpj_mask = (f"{cnpj_formatado[:2]}_{cnpj_formatado[2:5]}_{cnpj_formatado[5:8]}_"
+                     f"{cnpj_formatado[8:12]}_{cnpj_formatado[12:]}")
+    else:
+        cnpj_mask = cnpj_formatado or 'nao_informado'
+    if parte:
+        cnpj_mask = f"{cnpj_mask}-parte-{parte:03d}"
+    return f"irpf{ano}-cnpj-{cnpj_mask}.{extensao}"
+
+
+LAYOUTS_SAIDA = ('plano', 'cnpj', 'cpf', 'cnpj-cpf')
+
+
+def caminho_relativo_pdf(layout: str, nome: str, cpf: str = '', cnpj: str = '') -> str:
+    """Caminho do PDF dentro da saída conforme --layout-saida (separado por '/')
+
+    plano: tudo na raiz; cnpj: um subdiretório por fonte pagadora; cpf: um
+    subdiretório pelos 3 primeiros dígitos do CPF (até 1000 por nível);
+    cnpj-cpf: os dois níveis. PDFs em lote (--pdf-por-cnpj) só usam o nível
+    da fonte pagadora.
+    """
+    partes = []
+    if layout in ('cnpj', 'cnpj-cpf'):
+        partes.append(''.join(filter(str.isdigit, cnpj)) or 'nao_informado')
+    cpf_digitos = ''.join(filter(str.isdigit, cpf))
+    if layout in ('cpf', 'cnpj-cpf') and cpf_digitos:
+        partes.append(cpf_digitos[:3])
+    partes.append(nome)
+    return '/'.join(partes)
+
+
+@dataclass
+class PDFGerado:
+    """PDF renderizado, a caminho de uma saída
+
+    Com `conteudo` e `arquivo` vazios o PDF já foi gravado pelo worker (ou
+    está inalterado no cache) e só entra no manifesto.
+    """
+    nome: str                       # Caminho relativo dentro da saída (caminho_relativo_pdf)
+    cnpj: str                       # Fonte pagadora (só dígitos); vazio quando desconhecida (cache)
+    cpfs: List[str]                 # CPFs com comprovante no PDF, para o manifesto
+    conteudo: Optional[bytes]       # PDF em memória (um comprovante)
+    arquivo: Optional[str] = None   # PDF em um temporário (PDFs em lote), movido ou copiado pela saída
+
+
+class ManifestoSaida:
+    """Manifesto CSV (cpf, cnpj, pacote, arquivo) dos PDFs da saída, em ordem de CPF
+
+    Escrito pelo processo principal ao final (e a cada reprocessamento do
+    --watch), para que processos de entrega localizem o PDF de cada CPF sem
+    listar o diretório. `pacote` é o ZIP que contém o arquivo (--saida zip).
+    Um manifesto existente é carregado antes, de modo que CPFs não
+    reprocessados nesta execução continuam nele.
+    """
+
+    CAMPOS = ('cpf', 'cnpj', 'pacote', 'arquivo')
+
+    def __init__(self, ano: str, output_dir: Optional[str] = None):
+        self.nome = f"irpf{ano}-manifesto.csv"
+        self._linhas: Dict[str, Tuple[str, str, str]] = {}
+        caminho = os.path.join(output_dir, self.nome) if output_dir else None
+        if caminho and os.path.exists(caminho):
+            with open(caminho, 'r', encoding='utf-8', newline='') as f:
+                for linha in csv.DictReader(f):
+                    self._linhas[linha['cpf']] = (linha['cnpj'], linha['pacote'], linha['arquivo'])
+
+    def registrar(self, pdf: PDFGerado, pacote: str):
+        for cpf in pdf.cpfs:
+            cnpj = pdf.cnpj or self._linhas.get(cpf, ('',))[0]
+            self._linhas[cpf] = (cnpj, pacote, pdf.nome)
+
+    def conteudo(self) -> bytes:
+        saida = io.StringIO()
+        writer = csv.writer(saida, lineterminator='\n')
+        writer.writerow(self.CAMPOS)
+        for cpf in sorted(self._linhas):
+            writer.writerow((cpf,) + self._linhas[cpf])
+        return saida.getvalue().encode('utf-8')
+
+
+class SaidaPDF:
+    """Base das saídas de PDF: recebe os resultados dos workers no processo principal
+
+    PDFs com conteúdo são gravados (gravar); os já gravados pelo worker só
+    entram no manifesto, quando houver (--layout-saida diferente de plano).
+    """
+
+    def __init__(self, manifesto: Optional[ManifestoSaida] = None):
+        self.manifesto = manifesto
+
+    def receber(self, pdf: PDFGerado):
+        if pdf.conteudo is not None or pdf.arquivo is not None:
+            try:
+                self.gravar(pdf)
+            finally:
+                if pdf.arquivo is not None and os.path.exists(pdf.arquivo):
+                    os.remove(pdf.arquivo)
+        if self.manifesto is not None:
+            self.manifesto.registrar(pdf, self.pacote(pdf))
+
+    def gravar(self, pdf: PDFGerado):
+        raise NotImplementedError
+
+    def pacote(self, pdf: PDFGerado) -> str:
+        return ''
+
+    def gravar_manifesto(self, nome: str, conteudo: bytes):
+        raise NotImplementedError
+
+    def atualizar_manifesto(self):
+        if self.manifesto is not None:
+            self.gravar_manifesto(self.manifesto.nome, self.manifesto.conteudo())
+
+    def fechar(self):
+        self.atualizar_manifesto()
+
+
+class SaidaDiretorio(SaidaPDF):
+    """PDFs gravados como arquivos no diretório de saída
+
+    Cada PDF é escrito em um temporário no mesmo diretório e renomeado com
+    os.replace: um leitor nunca vê um PDF pela metade, e uma execução
+    interrompida não deixa arquivos truncados com o nome final.
+    """
+
+    def __init__(self, output_dir: str, manifesto: Optional[ManifestoSaida] = None):
+        super().__init__(manifesto)
+        self.output_dir = output_dir
+
+    def caminho(self, nome: str) -> str:
+        return os.path.join(self.output_dir, *nome.split('/'))
+
+    def temporario(self, nome: str) -> str:
+        """Temporário ao lado do destino de `nome`, para gravar e renomear com os.replace"""
+        destino = self.caminho(nome)
+        if '/' in nome:
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+        return f"{destino}.{os.getpid()}.tmp"
+
+    def gravar(self, pdf: PDFGerado):
+        destino = self.caminho(pdf.nome)
+        if pdf.arquivo is not None:
+            os.replace(pdf.arquivo, destino)  # Gravado em self.temporario(pdf.nome)
+            return
+        temporario = self.temporario(pdf.nome)
+        try:
+            with open(temporario, 'wb') as f:
+                f.write(pdf.conteudo)
+            os.replace(temporario, destino)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+    def gravar_manifesto(self, nome: str, conteudo: bytes):
+        self.gravar(PDFGerado(nome, '', [], conteudo))
+
+
+class SaidaZip(SaidaPDF):
+    """Um arquivo ZIP por fonte pagadora (irpf{ano}-cnpj-<cnpj>.zip)
+
+    Os PDFs já são comprimidos internamente, então entram sem compressão
+    (ZIP_STORED). Cada ZIP é gravado em um temporário e renomeado no fechar();
+    o manifesto fica ao lado dos ZIPs.
+    """
+
+    def __init__(self, output_dir: str, ano: str, manifesto: Optional[ManifestoSaida] = None):
+        super().__init__(manifesto)
+        self.output_dir = output_dir
+        self.ano = ano
+        self._arquivos: Dict[str, Tuple[zipfile.ZipFile, str, str]] = {}
+
+    def pacote(self, pdf: PDFGerado) -> str:
+        return nome_arquivo_pdf_cnpj(self.ano, pdf.cnpj, 'zip')
+
+    def gravar(self, pdf: PDFGerado):
+        if pdf.cnpj not in self._arquivos:
+            destino = os.path.join(self.output_dir, self.pacote(pdf))
+            temporario = f"{destino}.tmp"
+            self._arquivos[pdf.cnpj] = (zipfile.ZipFile(temporario, 'w', zipfile.ZIP_STORED), temporario, destino)
+        arquivo = self._arquivos[pdf.cnpj][0]
+        info = zipfile.ZipInfo(pdf.nome, date_time=time.localtime()[:6])
+        info.external_attr = 0o644 << 16
+        if pdf.arquivo is None:
+            arquivo.writestr(info, pdf.conteudo)
+            return
+        # PDF em lote: copiado do temporário em blocos, sem passar inteiro pela memória
+        info.file_size = os.path.getsize(pdf.arquivo)
+        with open(pdf.arquivo, 'rb') as origem, arquivo.open(info, 'w') as destino:
+            shutil.copyfileobj(origem, destino)
+
+    def gravar_manifesto(self, nome: str, conteudo: bytes):
+        SaidaDiretorio(self.output_dir).gravar(PDFGerado(nome, '', [], conteudo))
+
+    def fechar(self):
+        super().fechar()
+        for arquivo, temporario, destino in self._arquivos.values():
+            arquivo.close()
+            os.replace(temporario, destino)
+            logger.info(f"ZIP gerado: {destino} ({len(arquivo.infolist())} PDF(s))")
+        self._arquivos.clear()
+
+
+class SaidaTar(SaidaPDF):
+    """PDFs em um único TAR gravado em fluxo (modo 'w|'), em arquivo ou na saída padrão
+
+    Em fluxo o TAR não é relido nem reposicionado, então funciona em pipes
+    (--saida stdout | ...); os logs continuam no stderr. O manifesto é o
+    último membro do TAR.
+    """
+
+    def __init__(self, destino: Optional[str] = None, manifesto: Optional[ManifestoSaida] = None):
+        super().__init__(manifesto)
+        self.destino = destino
+        if destino is None:
+            self._temporario = None
+            fluxo = sys.stdout.buffer
+        else:
+            self._temporario = f"{destino}.tmp"
+            fluxo = open(self._temporario, 'wb')
+        self._fluxo = fluxo
+        self._tar = tarfile.open(fileobj=fluxo, mode='w|')
+        self._total = 0
+
+    def _adicionar(self, nome: str, conteudo: bytes):
+        info = tarfile.TarInfo(nome)
+        info.size = len(conteudo)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        self._tar.addfile(info, io.BytesIO(conteudo))
+
+    def gravar(self, pdf: PDFGerado):
+        if pdf.arquivo is None:
+            self._adicionar(pdf.nome, pdf.conteudo)
+        else:
+            info = tarfile.TarInfo(pdf.nome)
+            info.size = os.path.getsize(pdf.arquivo)
+            info.mtime = int(time.time())
+            info.mode = 0o644
+            with open(pdf.arquivo, 'rb') as origem:
+                self._tar.addfile(info, origem)
+        self._total += 1
+
+    def gravar_manifesto(self, nome: str, conteudo: bytes):
+        self._adicionar(nome, conteudo)
+
+    def fechar(self):
+        if self._tar is None:
+            return
+        super().fechar()
+        self._tar.close()
+        self._tar = None
+        if self._temporario is None:
+            self._fluxo.flush()
+        else:
+            self._fluxo.close()
+            os.replace(self._temporario, self.destino)
+            logger.info(f"TAR gerado: {self.destino} ({self._total} PDF(s))")
+
+
+TIPOS_SAIDA = ('diretorio', 'zip', 'tar', 'stdout')
+
+
+def criar_saida(tipo: str, output_dir: str, ano: str, layout: str = 'plano') -> SaidaPDF:
+    """Saída dos PDFs conforme --saida, com manifesto quando --layout-saida não é plano"""
+    manifesto = None
+    if layout != 'plano':
+        manifesto = ManifestoSaida(ano, output_dir if tipo == 'diretorio' else None)
+    if tipo == 'zip':
+        return SaidaZip(output_dir, ano, manifesto)
+    if tipo == 'tar':
+        return SaidaTar(os.path.join(output_dir, f"irpf{ano}.tar"), manifesto)
+    if tipo == 'stdout':
+        return SaidaTar(None, manifesto)
+    return SaidaDiretorio(output_dir, manifesto)
+
+
+# Tamanho do bloco lido por vez na pré-varredura de CPF
+TAMANHO_BLOCO_VARREDURA = 8 * 1024
+
+
+@dataclass
+class VarreduraXML:
+    """Resultado da pré-varredura de um XML (CPF e tempos de leitura/parse)"""
+    caminho: ArquivoXML
+    cpf: Optional[str] = None
+    bytes_lidos: int = 0
+    tempo_leitura: float = 0.0
+    tempo_parse: float = 0.0
+    # mtime do arquivo, desempate entre versões do mesmo evento (IndiceRetificacoes)
+    mtime_ns: int = 0
+    # Identificação do (primeiro) evento do arquivo
+    evento: IdentificacaoEvento = field(default_factory=IdentificacaoEvento)
+    # Eventos do arquivo (só preenchido por indexar_xml)
+    trechos: List[TrechoXML] = field(default_factory=list)
+    # Cópia descomprimida de um lote comprimido (indexar_xml), lida pelos trechos
+    descomprimido: Optional[str] = None
+
+
+def varrer_xml(xml_path: ArquivoXML) -> VarreduraXML:
+    """Pré-varredura com leitura limitada: para ao encontrar o primeiro cpfBenef
+
+    O arquivo é lido em blocos de TAMANHO_BLOCO_VARREDURA e alimentado a um
+    XMLPullParser; a leitura termina assim que o cpfBenef é visto. Funciona
+    também para XMLs de retorno (retornoProcessamentoDownload), pois o evento
+    encapsulado é percorrido pela mesma varredura. Os tempos de leitura e de
+    parse são medidos separadamente para diferenciar storage lento de parse lento.
+    Id, perApur, nrInsc e nrRecArqBase, que antecedem o cpfBenef, são guardados
+    em resultado.evento para a deduplicação de retificações.
+    """
+    resultado = VarreduraXML(caminho=xml_path)
+    evento = resultado.evento
+    parser = ET.XMLPullParser(events=('start', 'end'))
 
-def extrair_cpf_xml(xml_path: str) -> Optional[str]:
-    """Extrai CPF do XML sem parse completo (rápido)"""
     try:
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-        
-        # Tentar namespace v_S_01_03_00
-        ns = {'esocial': 'http://www.esocial.gov.br/schema/evt/evtIrrfBenef/v_S_01_03_00'}
-        cpf_elem = root.find('.//esocial:cpfBenef', ns)
-        
-        if cpf_elem is not None and cpf_elem.text:
-            return cpf_elem.text.strip()
-        
-        # Se não encontrou, pode ser XML de retorno - extrair XML interno
-        ns_ret = '{http://www.esocial.gov.br/schema/download/retornoProcessamento/v1_0_0}'
-        ret_proc = root.find(f'{ns_ret}retornoProcessamentoDownload')
-        if ret_proc is not None:
-            evento = ret_proc.find(f'{ns_ret}evento')
-            if evento is not None:
-                for child in evento:
-                    if 'eSocial' in child.tag:
-                        cpf_elem = child.find('.//esocial:cpfBenef', ns)
-                        if cpf_elem is not None and cpf_elem.text:
-                            return cpf_elem.text.strip()
-        
-        return None
-    except:
-        return None
+        inicio = time.perf_counter()
+        with _abrir_arquivo(xml_path) as f:
+            resultado.mtime_ns = os.stat(_caminho_fonte(xml_path)).st_mtime_ns
+            while resultado.cpf is None:
+                bloco = f.read(TAMANHO_BLOCO_VARREDURA)
+                lido = time.perf_counter()
+                resultado.tempo_leitura += lido - inicio
+                if not bloco:
+                    break
+                resultado.bytes_lidos += len(bloco)
+
+                parser.feed(bloco)
+                for tipo, elem in parser.read_events():
+                    tag = elem.tag
+                    if tipo == 'start':
+                        if tag in EVENTOS_LEIAUTE and evento.id_evento is None:
+                            evento.id_evento = elem.get('Id')
+                    elif tag in TAGS_CPF_BENEF:
+                        resultado.cpf = elem.text.strip() if elem.text else ''
+                        break
+                    else:
+                        campo = TAGS_IDENTIFICACAO.get(tag)
+                        if campo is not None and getattr(evento, campo) is None:
+                            setattr(evento, campo, elem.text.strip() if elem.text else '')
 
+                inicio = time.perf_counter()
+                resultado.tempo_parse += inicio - lido
+    except (OSError, EOFError, zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        logger.debug(f"Erro na pré-varredura de {xml_path}: {e}")
 
-def agrupar_xmls_por_cpf(xml_files: List[Path]) -> Dict[str, List[str]]:
-    """Agrupa XMLs por CPF"""
-    grupos = {}
-    
-    for xml_file in xml_files:
-        cpf = extrair_cpf_xml(str(xml_file))
-        if cpf:
-            cpf_limpo = ''.join(filter(str.isdigit, cpf))
-            if cpf_limpo not in grupos:
-                grupos[cpf_limpo] = []
-            grupos[cpf_limpo].append(str(xml_file))
+    return resultado
+
+
+# Nome local -> campo registrado por indexar_xml (primeira ocorrência em cada evento)
+CAMPOS_INDEXACAO = {'cpfBenef': 'cpf', 'perApur': 'per_apur', 'nrInsc': 'nr_insc',
+                    'nrRecArqBase': 'nr_rec_arq_base'}
+
+
+def indexar_xml(xml_path: ArquivoXML) -> VarreduraXML:
+    """Varredura completa que registra a faixa de bytes e o CPF de cada evtIrrfBenef
+
+    Usa o expat diretamente (CurrentByteIndex) sem processamento de namespaces,
+    acompanhando as declarações xmlns em escopo para que cada trecho possa ser
+    parseado sozinho (TrechoXML.ler). Cada trecho leva também a identificação
+    do seu evento (TrechoXML.evento). O cpf e a identificação do resultado são
+    os do primeiro evento.
+
+    Um lote comprimido (.xml.gz ou membro de ZIP) é descomprimido uma única
+    vez: a partir do segundo evento, o conteúdo lido é copiado para um
+    temporário (resultado.descomprimido, removido por IndiceRetificacoes) de
+    onde os trechos são lidos. Arquivos com um só evento não geram cópia.
+    """
+    resultado = VarreduraXML(caminho=xml_path)
+    comprimido = _comprimido(xml_path)
+    lidos: List[bytes] = []  # Conteúdo descomprimido até a cópia ser criada
+    copia: Optional[BinaryIO] = None
+    parser = expat.ParserCreate()
+    escopos: List[Dict[str, str]] = []
+    encoding = ['UTF-8']
+    atual: Dict[str, object] = {}
+    texto_campo: List[str] = []
+
+    def declaracao(versao, enc, standalone):
+        if enc:
+            encoding[0] = enc
+
+    def abrir(nome, atributos):
+        escopos.append({k: v for k, v in atributos.items() if k == 'xmlns' or k.startswith('xmlns:')})
+        local = nome.rpartition(':')[2]
+        if local == 'evtIrrfBenef' and not atual:
+            declaracoes = {}
+            for escopo in escopos[:-1]:
+                declaracoes.update(escopo)
+            atual.update(inicio=parser.CurrentByteIndex, declaracoes=declaracoes,
+                         campos={'id_evento': atributos.get('Id')}, lendo=None)
+        elif atual and local in CAMPOS_INDEXACAO:
+            campo = CAMPOS_INDEXACAO[local]
+            if campo not in atual['campos']:
+                atual['campos'][campo] = ''
+                texto_campo.clear()
+                atual['lendo'] = campo
+
+    def texto(dados):
+        if atual and atual['lendo']:
+            texto_campo.append(dados)
+
+    def fechar(nome):
+        escopos.pop()
+        local = nome.rpartition(':')[2]
+        if atual and atual['lendo'] and CAMPOS_INDEXACAO.get(local) == atual['lendo']:
+            atual['campos'][atual['lendo']] = ''.join(texto_campo).strip()
+            atual['lendo'] = None
+        elif local == 'evtIrrfBenef' and atual:
+            campos = atual['campos']
+            cpf = campos.pop('cpf', None)
+            resultado.trechos.append(TrechoXML(
+                caminho=xml_path,
+                inicio=atual['inicio'],
+                fim=parser.CurrentByteIndex,
+                tag=nome,
+                cpf=cpf or None,
+                declaracoes=tuple(sorted(atual['declaracoes'].items())),
+                encoding=encoding[0],
+                evento=IdentificacaoEvento(**campos),
+            ))
+            atual.clear()
+
+    parser.XmlDeclHandler = declaracao
+    parser.StartElementHandler = abrir
+    parser.EndElementHandler = fechar
+    parser.CharacterDataHandler = texto
+
+    try:
+        inicio = time.perf_counter()
+        with _abrir_arquivo(xml_path) as f:
+            resultado.mtime_ns = os.stat(_caminho_fonte(xml_path)).st_mtime_ns
+            while True:
+                bloco = f.read(TAMANHO_BLOCO_VARREDURA * 8)
+                lido = time.perf_counter()
+                resultado.tempo_leitura += lido - inicio
+                resultado.bytes_lidos += len(bloco)
+                parser.Parse(bloco, not bloco)
+                if comprimido and bloco:
+                    if copia is not None:
+                        copia.write(bloco)
+                    else:
+                        lidos.append(bloco)
+                        if len(resultado.trechos) + bool(atual) > 1:
+                            descritor, resultado.descomprimido = tempfile.mkstemp(prefix='s5002_', suffix='.xml')
+                            copia = os.fdopen(descritor, 'wb')
+                            copia.writelines(lidos)
+                            lidos = []
+                inicio = time.perf_counter()
+                resultado.tempo_parse += inicio - lido
+                if not bloco:
+                    break
+    except (OSError, EOFError, zipfile.BadZipFile, KeyError, expat.ExpatError) as e:
+        logger.debug(f"Erro na indexação de {xml_path}: {e}")
+    finally:
+        if copia is not None:
+            copia.close()
+
+    # Trechos só são autônomos em codificações compatíveis com ASCII
+    if encoding[0].lower().replace('-', '').startswith(('utf16', 'utf32')):
+        resultado.trechos = []
+    if resultado.descomprimido is not None:
+        if len(resultado.trechos) > 1:
+            for trecho in resultado.trechos:
+                trecho.descomprimido = resultado.descomprimido
         else:
-            logger.warning(f"Não foi possível extrair CPF de {xml_file}")
-    
-    return grupos
+            os.remove(resultado.descomprimido)
+            resultado.descomprimido = None
+    resultado.cpf = next((t.cpf for t in resultado.trechos if t.cpf), None)
+    if resultado.trechos:
+        resultado.evento = resultado.trechos[0].evento
+    return resultado
+
+
+def extrair_cpf_xml(xml_path: FonteXML) -> Optional[str]:
+    """Extrai CPF do XML sem parse completo (rápido)"""
+    if isinstance(xml_path, TrechoXML):
+        return xml_path.cpf or None
+    return varrer_xml(xml_path).cpf or None
+
+
+def fontes_da_varredura(varredura: VarreduraXML) -> List[Tuple[str, FonteXML, IdentificacaoEvento]]:
+    """Triplas (CPF, fonte, identificação do evento) de um arquivo varrido
+
+    Arquivos de lote indexados com mais de um evento entram evento a evento
+    (TrechoXML), cada um no grupo do seu CPF; os demais entram inteiros.
+    """
+    if len(varredura.trechos) > 1:
+        fontes = []
+        for trecho in varredura.trechos:
+            if trecho.cpf:
+                fontes.append((''.join(filter(str.isdigit, trecho.cpf)), trecho,
+                               trecho.evento or IdentificacaoEvento()))
+            else:
+                logger.warning(f"Não foi possível extrair CPF de {trecho}")
+        return fontes
+
+    if varredura.cpf:
+        return [(''.join(filter(str.isdigit, varredura.cpf)), varredura.caminho, varredura.evento)]
+
+    logger.warning(f"Não foi possível extrair CPF de {varredura.caminho}")
+    return []
+
+
+class IndiceRetificacoes:
+    """Índice de versões de eventos anterior à consolidação
+
+    Cada fonte entra com a chave (CNPJ, CPF, perApur, nrRecArqBase ou Id) lida
+    na pré-varredura (IdentificacaoEvento.chave). Quando mais de uma fonte tem a
+    mesma chave (o original e suas retificações, ou o mesmo arquivo copiado
+    duas vezes), só a versão mais recente entra nos grupos: maior Id, depois
+    maior mtime e, por fim, maior caminho. As versões descartadas nunca chegam
+    a ser parseadas. Fontes sem chave, ou todas com deduplicar=False, ficam
+    sempre (uma chave própria por fonte).
 
-def processar_xml(args: Tuple[str, str, str, Optional[str], DadosComplementares]) -> Tuple[int, int]:
-    """Processa um arquivo XML e gera os PDFs"""
+    A pré-varredura sem --indexar-lotes (varrer_xml) só lê o primeiro evento,
+    então um arquivo inteiro só é descartado depois de indexado (indexar_xml,
+    ver indexar_descartados): um lote passa a entrar evento a evento e só a
+    versão substituída sai. Um lote que não pode ser repartido em trechos
+    (UTF-16) nunca é descartado.
+
+    O índice também é dono das cópias descomprimidas de lotes comprimidos
+    (VarreduraXML.descomprimido): cada uma é removida quando o arquivo sai do
+    índice (retirar_arquivo) ou em limpar(), ao fim do processamento.
+    """
+
+    def __init__(self, deduplicar: bool = True):
+        self.deduplicar = deduplicar
+        self._versoes: Dict[tuple, List[tuple]] = {}
+        self._chaves_por_cpf: Dict[str, set] = {}
+        self._chaves_por_arquivo: Dict[str, set] = {}
+        self._empregadores: Dict[str, str] = {}
+        self._descomprimidos: Dict[str, List[str]] = {}
+        # Arquivos inteiros já indexados, e os que têm mais de um evento sem poder ser repartidos
+        self._indexados: set = set()
+        self._inteiros: set = set()
+        self._sequencia = 0
+
+    def adicionar(self, cpf: str, fonte: FonteXML, evento: IdentificacaoEvento, mtime_ns: int = 0):
+        """Registra mais uma versão (fonte) de um evento"""
+        caminho = _caminho_fonte(fonte)
+        chave = evento.chave(cpf) if self.deduplicar else None
+        if chave is None:
+            chave = ('', cpf, '', _chave_fonte(fonte))
+        self._sequencia += 1
+        ordem = (evento.ordem(), mtime_ns) + _chave_fonte(fonte)
+        self._versoes.setdefault(chave, []).append((ordem, self._sequencia, fonte))
+        self._chaves_por_cpf.setdefault(cpf, set()).add(chave)
+        self._chaves_por_arquivo.setdefault(caminho, set()).add(chave)
+        if evento.nr_insc and cpf not in self._empregadores:
+            self._empregadores[cpf] = evento.nr_insc
+
+    def adicionar_varredura(self, varredura: VarreduraXML) -> set:
+        """Registra todas as fontes de um arquivo varrido e retorna os CPFs envolvidos"""
+        if varredura.descomprimido is not None:
+            self._descomprimidos.setdefault(_caminho_fonte(varredura.caminho), []).append(varredura.descomprimido)
+        cpfs = set()
+        for cpf, fonte, evento in fontes_da_varredura(varredura):
+            self.adicionar(cpf, fonte, evento, varredura.mtime_ns)
+            cpfs.add(cpf)
+        return cpfs
+
+    def retirar_arquivo(self, caminho: str) -> set:
+        """Remove todas as versões vindas de um arquivo e retorna os CPFs afetados"""
+        self._remover_descomprimido(caminho)
+        self._indexados = {fonte for fonte in self._indexados if _caminho_fonte(fonte) != caminho}
+        self._inteiros = {fonte for fonte in self._inteiros if _caminho_fonte(fonte) != caminho}
+        cpfs = set()
+        for chave in self._chaves_por_arquivo.pop(caminho, set()):
+            cpf = chave[1]
+            cpfs.add(cpf)
+            restantes = [v for v in self._versoes.get(chave, []) if _caminho_fonte(v[2]) != caminho]
+            if restantes:
+                self._versoes[chave] = restantes
+            else:
+                self._versoes.pop(chave, None)
+                self._chaves_por_cpf[cpf].discard(chave)
+                if not self._chaves_por_cpf[cpf]:
+                    del self._chaves_por_cpf[cpf]
+        return cpfs
+
+    def _retirar_fonte(self, fonte: ArquivoXML) -> set:
+        """Remove as versões de um arquivo inteiro (ou membro de ZIP) e retorna os CPFs afetados"""
+        caminho = _caminho_fonte(fonte)
+        cpfs = set()
+        for chave in list(self._chaves_por_arquivo.get(caminho, ())):
+            versoes = self._versoes.get(chave, [])
+            restantes = [v for v in versoes if v[2] != fonte]
+            if len(restantes) == len(versoes):
+                continue
+            cpf = chave[1]
+            cpfs.add(cpf)
+            if not any(_caminho_fonte(v[2]) == caminho for v in restantes):
+                self._chaves_por_arquivo[caminho].discard(chave)
+            if restantes:
+                self._versoes[chave] = restantes
+            else:
+                self._versoes.pop(chave, None)
+                self._chaves_por_cpf[cpf].discard(chave)
+                if not self._chaves_por_cpf[cpf]:
+                    del self._chaves_por_cpf[cpf]
+        return cpfs
+
+    def a_indexar(self) -> List[ArquivoXML]:
+        """Arquivos inteiros ainda não indexados que a deduplicação descartaria"""
+        pendentes = []
+        for versoes in self._versoes.values():
+            if len(versoes) > 1:
+                vigente = max(versoes)[2]
+                pendentes.extend(versao[2] for versao in versoes
+                                 if versao[2] is not vigente and not isinstance(versao[2], TrechoXML)
+                                 and versao[2] not in self._indexados and versao[2] not in pendentes)
+        return pendentes
+
+    def substituir_varredura(self, varredura: VarreduraXML) -> set:
+        """Troca um arquivo inteiro pela sua indexação (indexar_xml) e retorna os CPFs afetados
+
+        Com um evento só, o arquivo volta como estava; com vários, entra
+        evento a evento. Sem trechos (lote em UTF-16), a entrada inteira é
+        mantida e o arquivo deixa de ser descartável.
+        """
+        fonte = varredura.caminho
+        self._indexados.add(fonte)
+        if not varredura.trechos:
+            self._inteiros.add(fonte)
+            logger.warning(f"{fonte} tem uma versão substituída mas não pode ser indexado por evento; "
+                           f"mantido inteiro")
+            return set()
+        return self._retirar_fonte(fonte) | self.adicionar_varredura(varredura)
+
+    def _vigentes(self, versoes: List[tuple]) -> List[tuple]:
+        vigente = max(versoes)
+        return [vigente] + [v for v in versoes
+                            if v is not vigente and not isinstance(v[2], TrechoXML) and v[2] in self._inteiros]
+
+    def _remover_descomprimido(self, caminho: str):
+        for descomprimido in self._descomprimidos.pop(caminho, []):
+            try:
+                os.remove(descomprimido)
+            except OSError:
+                pass
+
+    def limpar(self):
+        """Remove as cópias descomprimidas de lotes comprimidos (fim do processamento)"""
+        for caminho in list(self._descomprimidos):
+            self._remover_descomprimido(caminho)
+
+    def fontes(self, cpf: str) -> List[FonteXML]:
+        """Versões vigentes das fontes de um CPF, na ordem em que foram registradas"""
+        vigentes = [v for chave in self._chaves_por_cpf.get(cpf, ()) for v in self._vigentes(self._versoes[chave])]
+        vigentes.sort(key=lambda versao: versao[1])
+        return [versao[2] for versao in vigentes]
+
+    def empregador(self, cpf: str) -> str:
+        """nrInsc do primeiro evento registrado para o CPF ('' se nenhum trouxe)"""
+        return self._empregadores.get(cpf, '')
+
+    def grupos(self) -> Dict[str, List[FonteXML]]:
+        """Grupos por CPF só com as versões vigentes"""
+        return {cpf: self.fontes(cpf) for cpf in self._chaves_por_cpf}
+
+    def descartadas(self) -> List[Tuple[FonteXML, FonteXML]]:
+        """Pares (versão descartada, versão vigente) de todas as chaves repetidas"""
+        pares = []
+        for versoes in self._versoes.values():
+            if len(versoes) > 1:
+                vigente = max(versoes)[2]
+                mantidas = [v[2] for v in self._vigentes(versoes)]
+                pares.extend((versao[2], vigente) for versao in versoes if versao[2] not in mantidas)
+        return pares
+
+
+def indexar_descartados(indice: IndiceRetificacoes, executor: Optional[ProcessPoolExecutor] = None) -> set:
+    """Indexa por evento os arquivos inteiros que a deduplicação descartaria e retorna os CPFs afetados
+
+    Sem --indexar-lotes um lote é conhecido só pelo primeiro evento; uma
+    retificação desse evento descartaria o arquivo com os eventos de todos os
+    outros CPFs. Repete até não sobrar arquivo inteiro não indexado entre as
+    versões descartadas (um trecho novo pode substituir outro arquivo).
+    """
+    cpfs = set()
+    pendentes = indice.a_indexar()
+    while pendentes:
+        logger.info(f"Retificações: indexando {len(pendentes)} arquivo(s) com versão substituída")
+        varreduras = executor.map(indexar_xml, pendentes) if executor is not None else map(indexar_xml, pendentes)
+        for varredura in varreduras:
+            cpfs |= indice.substituir_varredura(varredura)
+        pendentes = indice.a_indexar()
+    return cpfs
+
+
+def agrupar_xmls_por_cpf(xml_files: List[Union[Path, ArquivoXML]], executor: Optional[ProcessPoolExecutor] = None,
+                         chunksize: int = 1, indexar: bool = False,
+                         indice: Optional[IndiceRetificacoes] = None) -> Dict[str, List[FonteXML]]:
+    """Agrupa XMLs por CPF
+
+    Com um executor, a pré-varredura roda distribuída entre os workers.
+    Com indexar=True cada arquivo é indexado por evento (indexar_xml), de modo
+    que arquivos de lote sejam repartidos entre os grupos de todos os seus CPFs.
+    As fontes passam por um IndiceRetificacoes (criado aqui se não for dado),
+    que deixa nos grupos só a versão mais recente de cada evento. Lotes
+    comprimidos indexados deixam cópias descomprimidas que os grupos usam:
+    passe o índice e chame indice.limpar() depois de processá-los.
+    """
+    if indice is None:
+        indice = IndiceRetificacoes()
+    caminhos = [xml_file if isinstance(xml_file, MembroZip) else str(xml_file) for xml_file in xml_files]
+    varredor = indexar_xml if indexar else varrer_xml
+    if executor is not None:
+        varreduras = executor.map(varredor, caminhos, chunksize=chunksize)
+    else:
+        varreduras = map(varredor, caminhos)
+
+    total_bytes = 0
+    total_leitura = 0.0
+    total_parse = 0.0
+    mais_lenta = None
+
+    for varredura in varreduras:
+        total_bytes += varredura.bytes_lidos
+        total_leitura += varredura.tempo_leitura
+        total_parse += varredura.tempo_parse
+        if mais_lenta is None or (varredura.tempo_leitura + varredura.tempo_parse >
+                                  mais_lenta.tempo_leitura + mais_lenta.tempo_parse):
+            mais_lenta = varredura
+        logger.debug(f"Pré-varredura {varredura.caminho}: {varredura.bytes_lidos} bytes, "
+                     f"leitura {varredura.tempo_leitura * 1000:.2f}ms, parse {varredura.tempo_parse * 1000:.2f}ms")
+
+        indice.adicionar_varredura(varredura)
+
+    if indice.deduplicar:
+        indexar_descartados(indice, executor)
+
+    if mais_lenta is not None:
+        logger.info(f"Pré-varredura: {total_bytes / 1024:.1f} KB lidos, "
+                    f"leitura {total_leitura:.3f}s, parse {total_parse:.3f}s (soma dos workers); "
+                    f"mais lenta: {os.path.basename(str(mais_lenta.caminho))} "
+                    f"(leitura {mais_lenta.tempo_leitura * 1000:.2f}ms, parse {mais_lenta.tempo_parse * 1000:.2f}ms)")
+
+    descartadas = indice.descartadas()
+    if descartadas:
+        for antiga, vigente in descartadas:
+            logger.debug(f"Versão substituída: {antiga} (vigente: {vigente})")
+        logger.info(f"Retificações: {len(descartadas)} versão(ões) substituída(s) ignorada(s)")
+
+    return indice.grupos()
+
+
+# Dados complementares do processo worker, definidos uma vez pelo initializer do pool
+_dados_compl_worker: Optional[DadosComplementares] = None
+# Backend de parse dos XMLs no worker (--parser-backend)
+_backend_parser_worker = 'etree'
+# Saída dos PDFs (--saida): 'diretorio' grava no próprio worker; as demais devolvem os bytes
+_saida_worker = 'diretorio'
+# Layout dos caminhos na saída (--layout-saida)
+_layout_worker = 'plano'
+
+
+def inicializar_worker(dados_compl: DadosComplementares, backend_parser: str = 'etree', saida: str = 'diretorio',
+                       layout: str = 'plano'):
+    """Initializer do ProcessPoolExecutor: disponibiliza os dados complementares no worker
+
+    Com fork os dados são herdados por copy-on-write; com spawn são serializados
+    uma vez por worker, e não uma vez por tarefa.
+    """
+    global _dados_compl_worker, _backend_parser_worker, _saida_worker, _layout_worker
+    _dados_compl_worker = dados_compl
+    _backend_parser_worker = backend_parser
+    _saida_worker = saida
+    _layout_worker = layout
+
+
+def _dados_compl_do_worker() -> DadosComplementares:
+    """Dados complementares carregados pelo initializer (ou vazios, fora do pool)"""
+    global _dados_compl_worker
+    if _dados_compl_worker is None:
+        _dados_compl_worker = DadosComplementares()
+    return _dados_compl_worker
+
+
+def processar_xml(args: Tuple[str, str, str, Optional[str], Optional[DadosComplementares]]) -> Tuple[int, int]:
+    """Processa um arquivo XML e gera os PDFs
+
+    Com dados_compl=None usa os dados carregados pelo initializer do worker.
+    """
     xml_path, output_dir, ano, csv_path, dados_compl = args
+    if dados_compl is None:
+        dados_compl = _dados_compl_do_worker()
     
     try:
         # Parse do XML
-        parser = S5002Parser(xml_path)
+        parser = S5002Parser(xml_path, _backend_parser_worker)
         comprovantes = parser.parse()
         
         sucesso = 0
@@ -2587,13 +4151,7 @@ def processar_xml(args: Tuple[str, str, str, Optional[str], DadosComplementares]
                     comprovante.ano = ano
                 
                 # Gerar nome do arquivo
-                cpf_formatado = ''.join(filter(str.isdigit, cpf))
-                if len(cpf_formatado) == 11:
-                    cpf_mask = f"{cpf_formatado[:3]}_{cpf_formatado[3:6]}_{cpf_formatado[6:9]}_{cpf_formatado[9:]}"
-                else:
-                    cpf_mask = cpf_formatado
-                
-                output_path = os.path.join(output_dir, f"irpf{ano}-{cpf_mask}.pdf")
+                output_path = os.path.join(output_dir, nome_arquivo_pdf(ano, cpf))
                 
                 # Gerar PDF
                 pdf_gen = PDFGenerator()
@@ -2614,87 +4172,632 @@ def processar_xml(args: Tuple[str, str, str, Optional[str], DadosComplementares]
 
 
 
-def processar_xmls_agrupados(args: Tuple[List[str], str, str, Optional[str], DadosComplementares]) -> Tuple[int, int]:
-    """Processa múltiplos XMLs do mesmo CPF e gera um PDF consolidado"""
-    xml_paths, output_dir, ano, csv_path, dados_compl = args
+def _verificar_cache(cpf: str, xml_paths: List[FonteXML], output_dir: str, ano: str, dados_compl: DadosComplementares,
+                     modo_paginacao: str, cache: CacheComprovantes, layout: str) -> Tuple[Optional[PDFGerado], str]:
+    """Calcula o hash do grupo e, se o PDF registrado no cache continua válido, retorna-o (para o manifesto)
+
+    `cpf` é a chave do grupo (agrupar_xmls_por_cpf), sem nova leitura dos XMLs.
+    O caminho vem do registro no cache: com --layout-saida cnpj ele depende
+    da fonte pagadora, que só é conhecida depois do parse.
+    """
+    cpf_grupo = ''.join(filter(str.isdigit, cpf))
+    hash_grupo = calcular_hash_grupo(xml_paths, dados_compl, cpf_grupo, ano, modo_paginacao, layout)
+    output_path = cache.pdf_atualizado(cpf_grupo, hash_grupo)
+    if output_path is not None:
+        logger.info(f"PDF inalterado (cache): {output_path}")
+        nome = os.path.relpath(output_path, output_dir).replace(os.sep, '/')
+        return PDFGerado(nome, '', [cpf_grupo], None), hash_grupo
+    return None, hash_grupo
+
+
+def consolidar_parcial(xml_paths: List[FonteXML]) -> Optional[ComprovanteRendimentos]:
+    """Parse de XMLs do mesmo CPF, já consolidados em um único comprovante
+
+    Cada comprovante é mesclado assim que sai do iterparse e a árvore do
+    trabalhador é liberada em seguida: o pico de memória da tarefa é o de um
+    XML, não o do histórico inteiro do CPF. Também é a tarefa usada para cada
+    fatia de um grupo dividido pelo planejador; as fatias são consolidadas de
+    novo em renderizar_parciais.
+    """
+    consolidador = ConsolidadorComprovantes()
+    for xml_path in xml_paths:
+        for comprovante in S5002Parser(xml_path, _backend_parser_worker).iterar():
+            consolidador.adicionar(comprovante)
+
+    return consolidador.resultado()
+
+
+def _completar_comprovante(comprovante: ComprovanteRendimentos, ano: str, dados_compl: DadosComplementares):
+    """Completa o comprovante consolidado com os dados complementares (nomes, CNPJ e ano)"""
+    # Atualizar com dados complementares
+    cpf = comprovante.beneficiario.cpf
+    dados = dados_compl.obter_dados(cpf)
+    
+    # Atualizar nomes
+    if dados.get('nome_funcionario'):
+        comprovante.beneficiario.nome = dados['nome_funcionario']
+    if dados.get('nome_empresa'):
+        comprovante.fonte_pagadora.nome = dados['nome_empresa']
+    if dados.get('cnpj_empresa'):
+        comprovante.fonte_pagadora.cnpj = dados['cnpj_empresa']
+    
+    # Atualizar nomes de dependentes
+    for dep in comprovante.dependentes:
+        dep.nome = dados_compl.obter_nome_dependente(cpf, dep.cpf, dep.nome)
+    
+    # Atualizar nomes de operadoras
+    for plano in comprovante.planos_saude:
+        plano.nome_operadora = dados_compl.obter_nome_entidade(
+            plano.cnpj_operadora, 'plano_saude', plano.nome_operadora
+        )
+        for dep_plano in plano.info_dep_sau:
+            dep_plano.nm_dep = dados_compl.obter_nome_dependente(
+                cpf, dep_plano.cpf_dep, dep_plano.nm_dep
+            )
+    
+    # Atualizar nomes de previdência
+    for prev in comprovante.previdencias_complementares:
+        prev.nome_entidade = dados_compl.obter_nome_entidade(
+            prev.cnpj, 'previdencia', getattr(prev, 'nome_entidade', '')
+        )
+    
+    # Definir ano
+    if not comprovante.ano or comprovante.ano == str(datetime.now().year):
+        comprovante.ano = ano
+
+
+def _entregar_pdf(pdf: PDFGerado, output_dir: str) -> PDFGerado:
+    """Grava o PDF no diretório de saída (--saida diretorio) ou o devolve ao processo principal
+
+    Nas saídas em arquivo único (zip, tar, stdout) só o processo principal
+    escreve: o worker devolve os bytes junto com o resultado da tarefa. No
+    diretório o PDF volta sem conteúdo, só para o manifesto.
+    """
+    if _saida_worker != 'diretorio':
+        return pdf
+    SaidaDiretorio(output_dir).gravar(pdf)
+    return replace(pdf, conteudo=None, arquivo=None)
+
+
+def _gerar_pdf_consolidado(comprovante_consolidado: ComprovanteRendimentos, total_xmls: int, output_dir: str,
+                           ano: str, dados_compl: DadosComplementares, modo_paginacao: str,
+                           cache: Optional[CacheComprovantes],
+                           hash_grupo: Optional[str]) -> Tuple[int, int, List[PDFGerado]]:
+    """Completa o comprovante consolidado com os dados complementares e gera o PDF em memória"""
+    _completar_comprovante(comprovante_consolidado, ano, dados_compl)
+    cpf = comprovante_consolidado.beneficiario.cpf
+    
+    # Gerar PDF
+    cpf_digitos = ''.join(filter(str.isdigit, cpf))
+    cnpj = ''.join(filter(str.isdigit, comprovante_consolidado.fonte_pagadora.cnpj))
+    nome = caminho_relativo_pdf(_layout_worker, nome_arquivo_pdf(ano, cpf), cpf, cnpj)
+    conteudo = PDFGenerator(modo_paginacao).renderizar(comprovante_consolidado)
+    pdf = _entregar_pdf(PDFGerado(nome, cnpj, [cpf_digitos], conteudo), output_dir)
+
+    output_path = SaidaDiretorio(output_dir).caminho(nome)
+    if cache is not None:
+        cache.registrar(cpf_digitos, hash_grupo, output_path)
+    
+    logger.info(f"PDF consolidado gerado: {output_path if pdf.conteudo is None else nome} ({total_xmls} XMLs)")
+    return 1, 0, [pdf]
+
+
+def processar_xmls_agrupados(args: Tuple[str, List[FonteXML], str, str, Optional[str], Optional[DadosComplementares],
+                                         str, Optional[CacheComprovantes]]) -> Tuple[int, int, List[PDFGerado]]:
+    """Processa múltiplos XMLs do mesmo CPF e gera um PDF consolidado
+
+    Com dados_compl=None usa os dados carregados pelo initializer do worker,
+    de modo que cada tarefa carrega apenas caminhos de arquivo. Retorna
+    (sucesso, erros, PDFs a gravar pelo processo principal).
+    """
+    cpf, xml_paths, output_dir, ano, csv_path, dados_compl, modo_paginacao, cache = args
+    if dados_compl is None:
+        dados_compl = _dados_compl_do_worker()
     
     try:
-        # Parse de todos os XMLs
-        todos_comprovantes = []
-        for xml_path in xml_paths:
-            parser = S5002Parser(xml_path)
-            comprovantes = parser.parse()
-            todos_comprovantes.extend(comprovantes)
-        
-        if not todos_comprovantes:
-            return 0, 0
-        
-        # Consolidar comprovantes do mesmo CPF
-        comprovante_consolidado = consolidar_comprovantes(todos_comprovantes)
+        # Pular grupos inalterados desde a última execução
+        hash_grupo = None
+        if cache is not None:
+            registro, hash_grupo = _verificar_cache(cpf, xml_paths, output_dir, ano, dados_compl,
+                                                    modo_paginacao, cache, _layout_worker)
+            if registro is not None:
+                return 1, 0, [registro]
+
+        # Parse e consolidação dos comprovantes do mesmo CPF
+        comprovante_consolidado = consolidar_parcial(xml_paths)
         
         if not comprovante_consolidado:
-            return 0, 0
-        
-        # Atualizar com dados complementares
-        cpf = comprovante_consolidado.beneficiario.cpf
-        dados = dados_compl.obter_dados(cpf)
-        
-        # Atualizar nomes
-        if dados.get('nome_funcionario'):
-            comprovante_consolidado.beneficiario.nome = dados['nome_funcionario']
-        if dados.get('nome_empresa'):
-            comprovante_consolidado.fonte_pagadora.nome = dados['nome_empresa']
-        if dados.get('cnpj_empresa'):
-            comprovante_consolidado.fonte_pagadora.cnpj = dados['cnpj_empresa']
-        
-        # Atualizar nomes de dependentes
-        for dep in comprovante_consolidado.dependentes:
-            dep.nome = dados_compl.obter_nome_dependente(cpf, dep.cpf, dep.nome)
-        
-        # Atualizar nomes de operadoras
-        for plano in comprovante_consolidado.planos_saude:
-            plano.nome_operadora = dados_compl.obter_nome_entidade(
-                plano.cnpj_operadora, 'plano_saude', plano.nome_operadora
-            )
-            for dep_plano in plano.info_dep_sau:
-                dep_plano.nm_dep = dados_compl.obter_nome_dependente(
-                    cpf, dep_plano.cpf_dep, dep_plano.nm_dep
-                )
-        
-        # Atualizar nomes de previdência
-        for prev in comprovante_consolidado.previdencias_complementares:
-            prev.nome_entidade = dados_compl.obter_nome_entidade(
-                prev.cnpj, 'previdencia', getattr(prev, 'nome_entidade', '')
-            )
-        
-        # Definir ano
-        if not comprovante_consolidado.ano or comprovante_consolidado.ano == str(datetime.now().year):
-            comprovante_consolidado.ano = ano
-        
-        # Gerar PDF
-        cpf_formatado = ''.join(filter(str.isdigit, cpf))
-        if len(cpf_formatado) == 11:
-            cpf_mask = f"{cpf_formatado[:3]}_{cpf_formatado[3:6]}_{cpf_formatado[6:9]}_{cpf_formatado[9:]}"
-        else:
-            cpf_mask = cpf_formatado
+            return 0, 0, []
         
-        output_path = os.path.join(output_dir, f"irpf{ano}-{cpf_mask}.pdf")
-        gerador = PDFGenerator()
-        gerador.gerar_pdf(comprovante_consolidado, output_path)
-        
-        logger.info(f"PDF consolidado gerado: {output_path} ({len(xml_paths)} XMLs)")
-        return 1, 0
+        return _gerar_pdf_consolidado(comprovante_consolidado, len(xml_paths), output_dir, ano,
+                                      dados_compl, modo_paginacao, cache, hash_grupo)
         
     except Exception as e:
         logger.error(f"Erro ao processar XMLs: {e}")
-        return 0, 1
+        return 0, 1, []
+
+
+def processar_lote_grupos(args: Tuple[List[Tuple[str, List[FonteXML]]], str, str, Optional[str],
+                                      Optional[DadosComplementares], str,
+                                      Optional[CacheComprovantes]]) -> Tuple[int, int, List[PDFGerado]]:
+    """Processa vários grupos de CPF pequenos (pares CPF, XMLs) em uma única tarefa do pool"""
+    grupos, output_dir, ano, csv_path, dados_compl, modo_paginacao, cache = args
+    total_sucesso = 0
+    total_erros = 0
+    total_pdfs: List[PDFGerado] = []
+    for cpf, xml_paths in grupos:
+        sucesso, erros, pdfs = processar_xmls_agrupados(
+            (cpf, xml_paths, output_dir, ano, csv_path, dados_compl, modo_paginacao, cache)
+        )
+        total_sucesso += sucesso
+        total_erros += erros
+        total_pdfs.extend(pdfs)
+    return total_sucesso, total_erros, total_pdfs
+
+
+def renderizar_parciais(args: Tuple[List[Optional[ComprovanteRendimentos]], int, str, str, Optional[str],
+                                    Optional[DadosComplementares], str, Optional[CacheComprovantes],
+                                    Optional[str]]) -> Tuple[int, int, List[PDFGerado]]:
+    """Consolida as fatias de um grupo dividido (na ordem dos XMLs) e gera o PDF"""
+    parciais, total_xmls, output_dir, ano, csv_path, dados_compl, modo_paginacao, cache, hash_grupo = args
+    if dados_compl is None:
+        dados_compl = _dados_compl_do_worker()
+
+    try:
+        comprovante_consolidado = consolidar_comprovantes([p for p in parciais if p])
+        if not comprovante_consolidado:
+            return 0, 0, []
+        return _gerar_pdf_consolidado(comprovante_consolidado, total_xmls, output_dir, ano,
+                                      dados_compl, modo_paginacao, cache, hash_grupo)
+    except Exception as e:
+        logger.error(f"Erro ao processar XMLs: {e}")
+        return 0, 1, []
+
+
+def processar_lote_cnpj(args: Tuple[str, List[List[FonteXML]], str, str, Optional[str],
+                                    Optional[DadosComplementares], str, int]) -> Tuple[int, int, List[PDFGerado]]:
+    """Gera o PDF em lote de uma fonte pagadora, ou de uma parte dela (--pdf-por-cnpj)
+
+    Os grupos de CPF são consolidados um a um e entregues a gerar_pdf_lote
+    por um gerador: cada comprovante é desenhado no canvas assim que fica
+    pronto e descartado em seguida. Um CPF com erro é registrado e pulado.
+    `parte` (a partir de 1) numera o PDF quando a fonte pagadora tem mais
+    CPFs que --comprovantes-por-pdf; 0 quando ela cabe em um só.
+    """
+    cnpj, grupos, output_dir, ano, csv_path, dados_compl, modo_paginacao, parte = args
+    if dados_compl is None:
+        dados_compl = _dados_compl_do_worker()
+    erros = [0]
+    cpfs: List[str] = []
+
+    def comprovantes() -> Iterator[ComprovanteRendimentos]:
+        for xml_paths in grupos:
+            try:
+                comprovante = consolidar_parcial(xml_paths)
+                if comprovante:
+                    _completar_comprovante(comprovante, ano, dados_compl)
+            except Exception as e:
+                logger.error(f"Erro ao processar XMLs de {xml_paths[0]}: {e}")
+                erros[0] += 1
+                continue
+            if comprovante:
+                cpfs.append(''.join(filter(str.isdigit, comprovante.beneficiario.cpf)))
+                yield comprovante
+
+    # O PDF em lote vai para um temporário, nunca para um buffer: no diretório
+    # de saída ele é só renomeado; nas demais saídas o processo principal o
+    # copia em blocos para o ZIP/TAR, sem trafegar pelo pool
+    nome = caminho_relativo_pdf(_layout_worker, nome_arquivo_pdf_cnpj(ano, cnpj, parte=parte), cnpj=cnpj)
+    if _saida_worker == 'diretorio':
+        temporario = SaidaDiretorio(output_dir).temporario(nome)
+    else:
+        descritor, temporario = tempfile.mkstemp(prefix='s5002_', suffix='.pdf')
+        os.close(descritor)
+    try:
+        gerados = PDFGenerator(modo_paginacao, esqueleto_form=True).gerar_pdf_lote(comprovantes(), temporario)
+    except Exception as e:
+        logger.error(f"Erro ao gerar o PDF da fonte pagadora {cnpj or '(não informada)'}: {e}")
+        gerados = 0
+        erros[0] = len(grupos)
+
+    pdfs: List[PDFGerado] = []
+    if gerados:
+        pdf = _entregar_pdf(PDFGerado(nome, cnpj, cpfs, None, temporario), output_dir)
+        output_path = SaidaDiretorio(output_dir).caminho(nome) if pdf.arquivo is None else nome
+        logger.info(f"PDF da fonte pagadora gerado: {output_path} ({gerados} comprovante(s))")
+        pdfs.append(pdf)
+    elif os.path.exists(temporario):
+        os.remove(temporario)
+    return gerados, erros[0], pdfs
+
+
+# Limites do planejador de tarefas (pesos em bytes de XML)
+PESO_MAXIMO_TAREFA = 4 * 1024 * 1024
+GRUPOS_MAXIMO_LOTE = 64
+TAREFAS_POR_WORKER = 4
+
+
+def _peso_xml(xml_path: FonteXML) -> int:
+    if isinstance(xml_path, TrechoXML):
+        return xml_path.fim - xml_path.inicio
+    if isinstance(xml_path, MembroZip):
+        return xml_path.tamanho
+    try:
+        return os.path.getsize(xml_path)
+    except OSError:
+        return 0
+
+
+def planejar_tarefas(grupos_cpf: Dict[str, List[FonteXML]],
+                     workers: int) -> Tuple[List[List[str]], List[Tuple[str, List[List[FonteXML]]]]]:
+    """Distribui os grupos de CPF em tarefas de peso parecido
+
+    O peso de um grupo é a soma do tamanho dos seus XMLs. O peso-alvo por
+    tarefa é o total dividido por TAREFAS_POR_WORKER tarefas por worker (até
+    PESO_MAXIMO_TAREFA). Grupos leves são empacotados em lotes de até
+    GRUPOS_MAXIMO_LOTE CPFs; grupos acima do alvo com mais de um XML são
+    divididos em fatias consecutivas, parseadas em paralelo.
+
+    Retorna (lotes, divididos): cada lote é uma lista de CPFs, e cada item de
+    divididos é (cpf, fatias de XMLs).
+    """
+    pesos = {cpf: [_peso_xml(x) for x in xmls] for cpf, xmls in grupos_cpf.items()}
+    peso_total = sum(sum(p) for p in pesos.values())
+    alvo = max(1, min(PESO_MAXIMO_TAREFA, peso_total // max(1, workers * TAREFAS_POR_WORKER)))
+
+    lotes: List[List[str]] = []
+    divididos: List[Tuple[str, List[List[FonteXML]]]] = []
+    lote_atual: List[str] = []
+    peso_lote = 0
+
+    for cpf, xmls in grupos_cpf.items():
+        peso_grupo = sum(pesos[cpf])
+        if peso_grupo > alvo and len(xmls) > 1:
+            fatias = []
+            fatia: List[FonteXML] = []
+            peso_fatia = 0
+            for xml, peso in zip(xmls, pesos[cpf]):
+                fatia.append(xml)
+                peso_fatia += peso
+                if peso_fatia >= alvo:
+                    fatias.append(fatia)
+                    fatia, peso_fatia = [], 0
+            if fatia:
+                fatias.append(fatia)
+            divididos.append((cpf, fatias))
+            continue
+
+        if lote_atual and (peso_lote + peso_grupo > alvo or len(lote_atual) >= GRUPOS_MAXIMO_LOTE):
+            lotes.append(lote_atual)
+            lote_atual, peso_lote = [], 0
+        lote_atual.append(cpf)
+        peso_lote += peso_grupo
+
+    if lote_atual:
+        lotes.append(lote_atual)
+
+    return lotes, divididos
+
+
+def _submeter(executor: ProcessPoolExecutor, funcao: Callable, argumento: Any) -> Future:
+    """executor.submit que, com o pool quebrado, devolve um Future já com a exceção
+
+    Um worker morto (ex.: OOM) gera BrokenProcessPool também nas submissões
+    seguintes; assim a falha segue o mesmo caminho de uma tarefa que falhou e
+    é contada como erro, sem abortar a execução antes de fechar a saída.
+    """
+    try:
+        return executor.submit(funcao, argumento)
+    except Exception as e:
+        future: Future = Future()
+        future.set_exception(e)
+        return future
+
+
+def _processar_grupos(executor: ProcessPoolExecutor, grupos_cpf: Dict[str, List[FonteXML]],
+                      args: argparse.Namespace, cache: Optional[CacheComprovantes],
+                      dados_compl: DadosComplementares, saida: SaidaPDF) -> Tuple[int, int]:
+    """Submete os grupos de CPF ao executor conforme planejar_tarefas e soma os resultados
+
+    Os resultados são consumidos com as_completed, à medida que as tarefas
+    terminam. Grupos divididos têm as fatias parseadas em paralelo e, quando
+    todas concluem, uma tarefa final consolida e gera o PDF. Os dados
+    complementares já estão nos workers (inicializar_worker). Os PDFs
+    devolvidos pelos workers passam por `saida.receber`, que grava os bytes
+    (saídas zip, tar e stdout) e alimenta o manifesto.
+    """
+    total_sucesso = 0
+    total_erros = 0
+    total_grupos = len(grupos_cpf)
+    concluidos = 0
+    ultimo_progresso = time.perf_counter()
+
+    lotes, divididos = planejar_tarefas(grupos_cpf, args.workers)
+    logger.info(f"{total_grupos} CPF(s) em {len(lotes)} lote(s) e {len(divididos)} grupo(s) dividido(s)")
+
+    pendentes = {}
+    for lote in lotes:
+        future = _submeter(
+            executor, processar_lote_grupos,
+            ([(cpf, grupos_cpf[cpf]) for cpf in lote], args.output_dir, args.ano, args.csv, None, args.paginacao, cache)
+        )
+        pendentes[future] = ('lote', lote)
+
+    # Fatias de grupos divididos: cpf -> resultados parciais na ordem dos XMLs
+    parciais: Dict[str, List[Optional[ComprovanteRendimentos]]] = {}
+    faltando: Dict[str, int] = {}
+    hashes: Dict[str, Optional[str]] = {}
+    for cpf, fatias in divididos:
+        xmls_do_cpf = grupos_cpf[cpf]
+        hash_grupo = None
+        if cache is not None:
+            registro, hash_grupo = _verificar_cache(cpf, xmls_do_cpf, args.output_dir, args.ano, dados_compl,
+                                                    args.paginacao, cache, args.layout_saida)
+            if registro is not None:
+                saida.receber(registro)
+                total_sucesso += 1
+                concluidos += 1
+                continue
+        logger.info(f"CPF {cpf}: {len(xmls_do_cpf)} XMLs serão consolidados em {len(fatias)} fatias")
+        hashes[cpf] = hash_grupo
+        parciais[cpf] = [None] * len(fatias)
+        faltando[cpf] = len(fatias)
+        for i, fatia in enumerate(fatias):
+            pendentes[_submeter(executor, consolidar_parcial, fatia)] = ('fatia', (cpf, i))
+
+    # Tarefas finais são submetidas durante a coleta; repete até esvaziar
+    while pendentes:
+        lote_futures = list(pendentes)
+        for future in as_completed(lote_futures):
+            tipo, ref = pendentes.pop(future)
+            if tipo == 'fatia':
+                cpf, i = ref
+                if cpf not in faltando:
+                    continue  # Outra fatia do mesmo CPF já falhou
+                try:
+                    parciais[cpf][i] = future.result()
+                except Exception as e:
+                    logger.error(f"Erro ao processar XMLs do CPF {cpf}: {e}")
+                    del faltando[cpf]
+                    total_erros += 1
+                    concluidos += 1
+                    continue
+                faltando[cpf] -= 1
+                if faltando[cpf] == 0:
+                    del faltando[cpf]
+                    final = _submeter(
+                        executor, renderizar_parciais,
+                        (parciais.pop(cpf), len(grupos_cpf[cpf]), args.output_dir, args.ano, args.csv,
+                         None, args.paginacao, cache, hashes.pop(cpf))
+                    )
+                    pendentes[final] = ('final', [cpf])
+                continue
+
+            # Um worker morto (ex.: OOM) quebra o pool: o lote inteiro conta como erro
+            try:
+                sucesso, erros, pdfs = future.result()
+                for pdf in pdfs:
+                    saida.receber(pdf)
+            except Exception as e:
+                logger.error(f"Erro ao processar {len(ref)} CPF(s) ({', '.join(ref[:3])}"
+                             f"{', ...' if len(ref) > 3 else ''}): {e}")
+                sucesso, erros = 0, len(ref)
+            total_sucesso += sucesso
+            total_erros += erros
+            concluidos += len(ref)
+
+            agora = time.perf_counter()
+            if agora - ultimo_progresso >= 2.0 or concluidos == total_grupos:
+                ultimo_progresso = agora
+                logger.info(f"Progresso: {concluidos}/{total_grupos} CPF(s) "
+                            f"({100.0 * concluidos / max(1, total_grupos):.0f}%)")
+
+    return total_sucesso, total_erros
+
+
+def agrupar_por_cnpj(grupos_cpf: Dict[str, List[FonteXML]], indice: IndiceRetificacoes,
+                     dados_compl: DadosComplementares) -> Dict[str, List[List[FonteXML]]]:
+    """Grupos de CPF por fonte pagadora, para --pdf-por-cnpj
+
+    A fonte pagadora de um CPF é a do CSV de funcionários (cnpj_empresa) ou,
+    sem ela, o nrInsc lido na pré-varredura. Dentro de cada fonte os CPFs
+    seguem em ordem crescente.
+    """
+    por_cnpj: Dict[str, List[Tuple[str, List[FonteXML]]]] = {}
+    for cpf, fontes in grupos_cpf.items():
+        cnpj = dados_compl.obter_dados(cpf).get('cnpj_empresa') or indice.empregador(cpf)
+        por_cnpj.setdefault(''.join(filter(str.isdigit, cnpj)), []).append((cpf, fontes))
+    return {cnpj: [fontes for _, fontes in sorted(cpfs)] for cnpj, cpfs in por_cnpj.items()}
+
+
+def _processar_lotes_cnpj(executor: ProcessPoolExecutor, lotes_cnpj: Dict[str, List[List[FonteXML]]],
+                          args: argparse.Namespace, saida: SaidaPDF) -> Tuple[int, int]:
+    """Submete um processar_lote_cnpj por PDF em lote, dos mais pesados para os mais leves
+
+    Cada PDF é um canvas, então o paralelismo é entre PDFs: os maiores saem
+    primeiro para não ficarem sozinhos no fim da execução. Uma fonte
+    pagadora com mais de --comprovantes-por-pdf CPFs é dividida em partes,
+    cada uma um PDF e uma tarefa, o que limita a memória de cada canvas.
+    """
+    total_sucesso = 0
+    total_erros = 0
+    total_grupos = sum(len(grupos) for grupos in lotes_cnpj.values())
+    concluidos = 0
+
+    limite = args.comprovantes_por_pdf
+    partes: List[Tuple[str, int, List[List[FonteXML]]]] = []
+    for cnpj, grupos in lotes_cnpj.items():
+        if limite and len(grupos) > limite:
+            for inicio in range(0, len(grupos), limite):
+                partes.append((cnpj, inicio // limite + 1, grupos[inicio:inicio + limite]))
+        else:
+            partes.append((cnpj, 0, grupos))
+    logger.info(f"{total_grupos} CPF(s) em {len(partes)} PDF(s) de {len(lotes_cnpj)} fonte(s) pagadora(s)")
+
+    pesos = [sum(_peso_xml(x) for grupo in grupos for x in grupo) for _, _, grupos in partes]
+    pendentes = {}
+    for i in sorted(range(len(partes)), key=lambda i: -pesos[i]):
+        cnpj, parte, grupos = partes[i]
+        future = _submeter(
+            executor, processar_lote_cnpj,
+            (cnpj, grupos, args.output_dir, args.ano, args.csv, None, args.paginacao, parte)
+        )
+        pendentes[future] = partes[i]
+
+    for future in as_completed(pendentes):
+        cnpj, parte, grupos = pendentes[future]
+        try:
+            sucesso, erros, pdfs = future.result()
+            for pdf in pdfs:
+                saida.receber(pdf)
+        except Exception as e:
+            descricao = f" (parte {parte})" if parte else ''
+            logger.error(f"Erro ao processar a fonte pagadora {cnpj or '(não informada)'}{descricao}: {e}")
+            sucesso, erros = 0, len(grupos)
+        total_sucesso += sucesso
+        total_erros += erros
+        concluidos += len(grupos)
+        logger.info(f"Progresso: {concluidos}/{total_grupos} CPF(s) "
+                    f"({100.0 * concluidos / max(1, total_grupos):.0f}%)")
+
+    return total_sucesso, total_erros
+
+
+# Arquivos de entrada reconhecidos: XML, XML comprimido com gzip e pacotes ZIP
+EXTENSOES_ENTRADA = ('.xml', '.xml.gz', '.zip')
+
+
+def _estado_xmls(input_dir: str, recursivo: bool = False) -> Dict[str, Tuple[int, int]]:
+    """Estado (mtime_ns, tamanho) de cada arquivo de entrada (EXTENSOES_ENTRADA) do diretório
+
+    Listado com os.scandir; com recursivo=True desce também nos subdiretórios.
+    """
+    estado = {}
+    pendentes = [input_dir]
+    while pendentes:
+        try:
+            entradas = os.scandir(pendentes.pop())
+        except OSError as e:
+            logger.warning(f"Não foi possível listar {e.filename}: {e.strerror}")
+            continue
+        with entradas:
+            for entrada in entradas:
+                try:
+                    if entrada.is_dir():
+                        if recursivo:
+                            pendentes.append(entrada.path)
+                        continue
+                    if not entrada.name.lower().endswith(EXTENSOES_ENTRADA):
+                        continue
+                    st = entrada.stat()
+                except OSError:
+                    continue  # Removido entre a listagem e o stat
+                estado[entrada.path] = (st.st_mtime_ns, st.st_size)
+    return estado
+
+
+def expandir_pacotes(caminhos: Iterable[str]) -> List[ArquivoXML]:
+    """Arquivos de entrada com cada pacote ZIP substituído pelos seus membros .xml
+
+    Só o diretório central do ZIP é lido aqui; o conteúdo dos membros é
+    descomprimido em fluxo na pré-varredura e no parse (_abrir_arquivo).
+    """
+    arquivos: List[ArquivoXML] = []
+    for caminho in caminhos:
+        if not caminho.lower().endswith('.zip'):
+            arquivos.append(caminho)
+            continue
+        try:
+            with zipfile.ZipFile(caminho) as pacote:
+                arquivos.extend(MembroZip(caminho, info.filename, info.file_size) for info in pacote.infolist()
+                                if not info.is_dir() and info.filename.lower().endswith('.xml'))
+        except (OSError, zipfile.BadZipFile) as e:
+            logger.error(f"Erro ao abrir o pacote ZIP {caminho}: {e}")
+    return arquivos
+
+
+def monitorar_diretorio(executor: ProcessPoolExecutor, indice: IndiceRetificacoes,
+                        estado_inicial: Dict[str, Tuple[int, int]], args: argparse.Namespace,
+                        cache: Optional[CacheComprovantes], dados_compl: DadosComplementares, saida: SaidaPDF):
+    """Modo contínuo: reprocessa apenas os CPFs afetados por XMLs novos ou alterados
+
+    O diretório (com --recursivo, a árvore) é verificado por polling de
+    mtime/tamanho a cada args.intervalo segundos. Um arquivo só entra na fila
+    quando seu estado se repete entre duas verificações, para não ler XMLs
+    ainda em gravação. Os grupos afetados são reconsolidados e renderizados
+    novamente via processar_xmls_agrupados. O índice de retificações da
+    varredura inicial é mantido atualizado, de modo que uma retificação nova
+    substitui a versão anterior no seu grupo; um pacote ZIP alterado é
+    relido por inteiro.
+    """
+    conhecidos = dict(estado_inicial)
+    varredor = indexar_xml if args.indexar_lotes else varrer_xml
+    pendentes: Dict[str, Tuple[int, int]] = {}
+
+    logger.info(f"Monitorando {args.input_dir} a cada {args.intervalo:g}s (Ctrl+C para encerrar)")
+    try:
+        while True:
+            time.sleep(args.intervalo)
+            atual = _estado_xmls(args.input_dir, args.recursivo)
+
+            # Arquivos novos/alterados com estado estável desde a última verificação
+            prontos = [xml for xml, est in atual.items()
+                       if conhecidos.get(xml) != est and pendentes.get(xml) == est]
+            pendentes = {xml: est for xml, est in atual.items() if conhecidos.get(xml) != est}
+            removidos = [xml for xml in conhecidos if xml not in atual]
+
+            if not prontos and not removidos:
+                continue
+
+            afetados = set()
+            for xml in removidos:
+                del conhecidos[xml]
+                afetados |= indice.retirar_arquivo(xml)
+
+            # Um pacote ZIP alterado sai do índice inteiro e volta membro a membro
+            for xml in prontos:
+                conhecidos[xml] = atual[xml]
+                afetados |= indice.retirar_arquivo(xml)
+            for varredura in executor.map(varredor, expandir_pacotes(prontos)):
+                afetados |= indice.adicionar_varredura(varredura)
+            afetados |= indexar_descartados(indice, executor)
+
+            if args.pdf_por_cnpj:
+                # O PDF de cada fonte pagadora afetada é gerado de novo por inteiro
+                lotes_cnpj = agrupar_por_cnpj(indice.grupos(), indice, dados_compl)
+                cnpjs = {''.join(filter(str.isdigit, dados_compl.obter_dados(cpf).get('cnpj_empresa')
+                                        or indice.empregador(cpf))) for cpf in afetados}
+                lotes_afetados = {cnpj: lotes_cnpj[cnpj] for cnpj in sorted(cnpjs) if cnpj in lotes_cnpj}
+                logger.info(f"{len(prontos)} XML(s) novo(s)/alterado(s), {len(removidos)} removido(s): "
+                            f"reprocessando {len(lotes_afetados)} fonte(s) pagadora(s)")
+                sucesso, erros = _processar_lotes_cnpj(executor, lotes_afetados, args, saida)
+                saida.atualizar_manifesto()
+                logger.info(f"Reprocessamento concluído: {sucesso} sucesso, {erros} erros")
+                continue
+
+            grupos_afetados = {}
+            for cpf in sorted(afetados):
+                fontes = sorted(indice.fontes(cpf), key=_chave_fonte)
+                if fontes:
+                    grupos_afetados[cpf] = fontes
+                else:
+                    logger.warning(f"CPF {cpf} não possui mais XMLs; o PDF existente foi mantido")
+
+            logger.info(f"{len(prontos)} XML(s) novo(s)/alterado(s), {len(removidos)} removido(s): "
+                        f"reprocessando {len(grupos_afetados)} CPF(s)")
+            sucesso, erros = _processar_grupos(executor, grupos_afetados, args, cache, dados_compl, saida)
+            saida.atualizar_manifesto()
+            logger.info(f"Reprocessamento concluído: {sucesso} sucesso, {erros} erros")
+    except KeyboardInterrupt:
+        logger.info("Monitoramento encerrado")
+
 
 def main():
     """Função principal"""
     parser = argparse.ArgumentParser(
         description='Conversor S-5002 do e-Social para PDF - Versão Completa'
     )
-    parser.add_argument('input_dir', help='Diretório contendo os arquivos XML S-5002')
+    parser.add_argument('input_dir', help='Diretório contendo os arquivos XML S-5002 (.xml, .xml.gz ou pacotes .zip)')
     parser.add_argument('output_dir', help='Diretório para salvar os PDFs gerados')
     parser.add_argument('--ano', default=str(datetime.now().year - 1), 
                        help='Ano-calendário (padrão: ano anterior)')
@@ -2703,6 +4806,41 @@ def main():
     parser.add_argument('--csv-entidades', help='Arquivo CSV com dados de entidades (cnpj, tipo, nome, registro)')
     parser.add_argument('--workers', type=int, default=4, 
                        help='Número de workers paralelos (padrão: 4)')
+    parser.add_argument('--paginacao', choices=PDFGenerator.MODOS_PAGINACAO, default='layout',
+                       help='Modo de paginação: layout (medição em memória) ou xobject (total via form XObject)')
+    parser.add_argument('--cache', action='store_true',
+                       help='Não regenerar PDFs cujos XMLs, CSVs, ano e versão não mudaram (manifesto SQLite no diretório de saída)')
+    parser.add_argument('--watch', action='store_true',
+                       help='Após o processamento inicial, monitorar o diretório e converter apenas XMLs novos ou alterados')
+    parser.add_argument('--intervalo', type=float, default=5.0,
+                       help='Intervalo em segundos entre verificações do modo --watch (padrão: 5)')
+    parser.add_argument('--indexar-lotes', action='store_true',
+                       help='Indexa cada XML por evento (evtIrrfBenef) para repartir arquivos de lote entre os CPFs e workers')
+    parser.add_argument('--indice-csv', action='store_true',
+                       help='Consulta os CSVs por índices binários (<csv>.idx) via mmap, compilados quando ausentes ou desatualizados')
+    parser.add_argument('--parser-backend', choices=BACKENDS_PARSER, default='etree',
+                       help='Parser dos XMLs: etree (biblioteca padrão), lxml ou auto, que usa lxml '
+                            'quando instalado (padrão: etree; compare com benchmark_s5002.py)')
+    parser.add_argument('--pdf-por-cnpj', action='store_true',
+                       help='Gera um único PDF por fonte pagadora (irpf<ano>-cnpj-<cnpj>.pdf) com todos os '
+                            'comprovantes, paginação por comprovante e um marcador por CPF')
+    parser.add_argument('--comprovantes-por-pdf', type=int, default=500, metavar='N',
+                       help='Com --pdf-por-cnpj, divide a fonte pagadora em PDFs de até N comprovantes '
+                            '(irpf<ano>-cnpj-<cnpj>-parte-001.pdf, ...), limitando a memória por PDF; '
+                            '0 = sem limite (padrão: 500)')
+    parser.add_argument('--manter-versoes', action='store_true',
+                       help='Não deduplicar retificações: consolida todas as versões de um mesmo evento '
+                            '(CNPJ, CPF, perApur, recibo/Id) em vez de só a mais recente')
+    parser.add_argument('--recursivo', action='store_true',
+                        help='Procura XMLs (.xml, .xml.gz e .zip) também nos subdiretórios de input_dir')
+    parser.add_argument('--saida', choices=TIPOS_SAIDA, default='diretorio',
+                        help='Destino dos PDFs: diretorio (um arquivo por PDF, gravação atômica), zip (um ZIP '
+                             'por fonte pagadora), tar (irpf<ano>.tar) ou stdout (TAR na saída padrão; '
+                             'output_dir é ignorado) (padrão: diretorio)')
+    parser.add_argument('--layout-saida', choices=LAYOUTS_SAIDA, default='plano',
+                        help='Subdiretórios dos PDFs: plano (todos na raiz), cnpj (um por fonte pagadora), cpf '
+                             '(3 primeiros dígitos do CPF) ou cnpj-cpf; fora do plano grava também '
+                             'irpf<ano>-manifesto.csv (cpf, cnpj, pacote, arquivo) (padrão: plano)')
     
     args = parser.parse_args()
     
@@ -2710,54 +4848,86 @@ def main():
     if not os.path.isdir(args.input_dir):
         logger.error(f"Diretório de entrada não existe: {args.input_dir}")
         sys.exit(1)
+    if args.watch and args.saida != 'diretorio':
+        logger.error("--watch regrava PDFs individualmente e requer --saida diretorio")
+        sys.exit(1)
+    if args.comprovantes_por_pdf < 0:
+        logger.error("--comprovantes-por-pdf deve ser 0 (sem limite) ou um número positivo")
+        sys.exit(1)
     
-    os.makedirs(args.output_dir, exist_ok=True)
+    if args.saida != 'stdout':
+        os.makedirs(args.output_dir, exist_ok=True)
     
     # Carregar dados complementares
-    dados_compl = DadosComplementares(args.csv, args.csv_dependentes, args.csv_entidades)
+    classe_dados = DadosComplementaresIndexados if args.indice_csv else DadosComplementares
+    dados_compl = classe_dados(args.csv, args.csv_dependentes, args.csv_entidades)
+
+    # Manifesto de PDFs já gerados
+    cache = None
+    if args.cache and args.pdf_por_cnpj:
+        logger.warning("--cache é por CPF e não se aplica a --pdf-por-cnpj; ignorado")
+    elif args.cache and args.saida != 'diretorio':
+        logger.warning(f"--cache depende dos PDFs no diretório de saída e não se aplica a --saida {args.saida}; ignorado")
+    elif args.cache:
+        cache = CacheComprovantes(args.output_dir)
+        cache.preparar()
     
     # Listar arquivos XML
-    xml_files = list(Path(args.input_dir).glob('*.xml'))
+    estado_xmls = _estado_xmls(args.input_dir, args.recursivo)
+    xml_files = expandir_pacotes(estado_xmls)
     
-    if not xml_files:
+    if not xml_files and not args.watch:
         logger.warning(f"Nenhum arquivo XML encontrado em {args.input_dir}")
         sys.exit(0)
     
-    logger.info(f"Encontrados {len(xml_files)} arquivo(s) XML para processar")
+    membros_zip = sum(1 for xml in xml_files if isinstance(xml, MembroZip))
+    if membros_zip:
+        logger.info(f"Encontrados {len(xml_files)} arquivo(s) XML para processar ({membros_zip} em pacote(s) ZIP)")
+    else:
+        logger.info(f"Encontrados {len(xml_files)} arquivo(s) XML para processar")
     if args.csv:
         logger.info(f"CSV de funcionários: {args.csv}")
     if args.csv_dependentes:
         logger.info(f"CSV de dependentes: {args.csv_dependentes}")
     if args.csv_entidades:
         logger.info(f"CSV de entidades: {args.csv_entidades}")
-    logger.info(f"Processando com {args.workers} workers paralelos")
-    
-    # Agrupar XMLs por CPF
-    logger.info("Agrupando XMLs por CPF...")
-    grupos_cpf = agrupar_xmls_por_cpf(xml_files)
-    logger.info(f"Encontrados {len(grupos_cpf)} CPF(s) únicos")
-    
-    # Processar arquivos em paralelo (por CPF)
-    inicio = datetime.now()
-    total_sucesso = 0
-    total_erros = 0
+    backend_parser = resolver_backend_parser(args.parser_backend)
+    logger.info(f"Processando com {args.workers} workers paralelos (parser: {backend_parser})")
     
-    with ProcessPoolExecutor(max_workers=args.workers) as executor:
-        futures = []
-        for cpf, xmls_do_cpf in grupos_cpf.items():
-            if len(xmls_do_cpf) > 1:
-                logger.info(f"CPF {cpf}: {len(xmls_do_cpf)} XMLs serão consolidados")
-            future = executor.submit(
-                processar_xmls_agrupados,
-                (xmls_do_cpf, args.output_dir, args.ano, args.csv, dados_compl)
-            )
-            futures.append(future)
-        
-        # Aguardar conclusão
-        for future in futures:
-            sucesso, erros = future.result()
-            total_sucesso += sucesso
-            total_erros += erros
+    # Dados complementares entregues uma vez por worker, não a cada tarefa
+    saida = criar_saida(args.saida, args.output_dir, args.ano, args.layout_saida)
+    indice = IndiceRetificacoes(deduplicar=not args.manter_versoes)
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=inicializar_worker,
+                                 initargs=(dados_compl, backend_parser, args.saida, args.layout_saida)) as executor:
+            # Agrupar XMLs por CPF (pré-varredura distribuída entre os workers)
+            logger.info("Agrupando XMLs por CPF...")
+            chunksize = max(1, min(256, len(xml_files) // (args.workers * 8)))
+            grupos_cpf = agrupar_xmls_por_cpf(xml_files, executor, chunksize, args.indexar_lotes, indice)
+            logger.info(f"Encontrados {len(grupos_cpf)} CPF(s) únicos")
+
+            # Processar arquivos em paralelo (por CPF, ou por fonte pagadora com --pdf-por-cnpj)
+            inicio = datetime.now()
+            if args.pdf_por_cnpj:
+                lotes_cnpj = agrupar_por_cnpj(grupos_cpf, indice, dados_compl)
+                total_sucesso, total_erros = _processar_lotes_cnpj(executor, lotes_cnpj, args, saida)
+            else:
+                total_sucesso, total_erros = _processar_grupos(executor, grupos_cpf, args, cache, dados_compl, saida)
+            saida.fechar()
+            duracao = (datetime.now() - inicio).total_seconds()
+            if args.pdf_por_cnpj:
+                logger.info(f"Concluído em {duracao:.1f}s: {total_sucesso} comprovante(s) de {len(lotes_cnpj)} "
+                            f"fonte(s) pagadora(s), {total_erros} erro(s)")
+            else:
+                logger.info(f"Concluído em {duracao:.1f}s: {total_sucesso} PDF(s) gerado(s), {total_erros} erro(s)")
+
+            # Modo contínuo: converter apenas o que mudar daqui em diante
+            if args.watch:
+                monitorar_diretorio(executor, indice, estado_xmls, args, cache, dados_compl, saida)
+    finally:
+        # Cópias descomprimidas de lotes .gz/.zip indexados (--indexar-lotes)
+        indice.limpar()
+
 
 if __name__ == '__main__':
     main()
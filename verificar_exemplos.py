@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Verificações automáticas sobre os exemplos do repositório
+
+Roda sem gerar PDFs e termina com código 1 se alguma verificação falhar:
+- retificação: o par original + retificação de exemplos/retificacao (mesma
+  chave CNPJ, CPF, perApur, nrRecArqBase) consolida só a retificação por
+  padrão e as duas versões somadas com --manter-versoes, tanto na
+  pré-varredura por arquivo quanto com --indexar-lotes (arquivo de lote com
+  os dois eventos); um lote com o original e o evento de outro CPF,
+  retificado por um arquivo à parte, não perde o outro CPF
+- índice CSV: IndiceCSV compilado a partir de registros devolve os mesmos
+  registros em obter(), prefixo() e na iteração, e DadosComplementaresIndexados
+  responde como DadosComplementares para todos os CPFs e CNPJs de exemplos_csv
+
+Uso:
+    python verificar_exemplos.py
+"""
+
+import logging
+import sys
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from s5002_to_pdf import (
+    DadosComplementares,
+    DadosComplementaresIndexados,
+    IndiceCSV,
+    IndiceRetificacoes,
+    agrupar_xmls_por_cpf,
+    consolidar_parcial,
+)
+
+RAIZ = Path(__file__).resolve().parent
+RETIFICACAO = RAIZ / 'exemplos' / 'retificacao'
+CPF_RETIFICACAO = '12345678950'
+# Evento não relacionado no mesmo lote que o original
+CPF_OUTRO = '98765432100'
+XML_LOTE = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<eSocial xmlns="http://www.esocial.gov.br/schema/evt/evtIrrfBenef/v_S_01_02_00">\n{}\n</eSocial>\n')
+
+logger = logging.getLogger('verificar_exemplos')
+
+
+def _totais(xmls: List[Path], deduplicar: bool, indexar: bool,
+            cpf: str = CPF_RETIFICACAO) -> Optional[Tuple[Decimal, Decimal]]:
+    """(total de rendimentos, imposto retido) consolidados de um CPF"""
+    indice = IndiceRetificacoes(deduplicar=deduplicar)
+    try:
+        grupos = agrupar_xmls_por_cpf(xmls, indexar=indexar, indice=indice)
+        comprovante = consolidar_parcial(grupos.get(cpf, []))
+    finally:
+        indice.limpar()
+    if comprovante is None:
+        return None
+    rendimento = comprovante.rendimento_tributavel
+    return (Decimal(str(rendimento.total_rendimentos)).quantize(Decimal('0.01')),
+            Decimal(str(rendimento.imposto_retido)).quantize(Decimal('0.01')))
+
+
+def _evento(xml: Path) -> str:
+    """Trecho <evtIrrfBenef>...</evtIrrfBenef> de um XML de exemplo"""
+    texto = xml.read_text(encoding='utf-8')
+    return texto[texto.index('<evtIrrfBenef'):texto.index('</evtIrrfBenef>') + len('</evtIrrfBenef>')]
+
+
+def verificar_retificacao() -> List[str]:
+    """Totais do par original + retificação, com e sem deduplicação"""
+    falhas = []
+    original = RETIFICACAO / 'exemplo_11_original.xml'
+    retificacao = RETIFICACAO / 'exemplo_11_retificacao.xml'
+    esperados = {
+        True: (Decimal('5300.00'), Decimal('810.00')),    # só a retificação
+        False: (Decimal('10400.00'), Decimal('1575.00')),  # --manter-versoes: as duas versões
+    }
+
+    with tempfile.TemporaryDirectory(prefix='s5002_') as temporario:
+        # Os dois eventos num único arquivo de lote, para o caminho de --indexar-lotes
+        lote = Path(temporario) / 'lote_retificacao.xml'
+        lote.write_text(XML_LOTE.format('\n'.join(_evento(xml) for xml in (original, retificacao))), encoding='utf-8')
+
+        # O original num lote com o evento de outro CPF, que vem primeiro na
+        # listagem, e a retificação num arquivo à parte. Sem --indexar-lotes um
+        # lote com vários CPFs só é repartido quando a deduplicação o indexa,
+        # então --manter-versoes só é conferido com o lote indexado
+        outro = (_evento(original).replace(CPF_RETIFICACAO, CPF_OUTRO)
+                 .replace('0000000000123456789', '0000000000987654321').replace('00001"', '00002"'))
+        lote_original = Path(temporario) / 'a_lote_original.xml'
+        lote_original.write_text(XML_LOTE.format(_evento(original) + '\n' + outro), encoding='utf-8')
+
+        ambos = (True, False)
+        casos = [
+            ('arquivos separados', [original, retificacao], False, ambos),
+            ('arquivos separados, ordem inversa', [retificacao, original], False, ambos),
+            ('lote indexado', [lote], True, ambos),
+            ('original em lote', [lote_original, retificacao], False, (True,)),
+            ('original em lote indexado', [lote_original, retificacao], True, ambos),
+        ]
+        for descricao, xmls, indexar, modos in casos:
+            for deduplicar in modos:
+                modo = 'padrão' if deduplicar else '--manter-versoes'
+                obtido = _totais(xmls, deduplicar, indexar)
+                if obtido != esperados[deduplicar]:
+                    falhas.append(f"Retificação ({descricao}, {modo}): esperado {esperados[deduplicar]}, obtido {obtido}")
+                else:
+                    logger.info(f"Retificação ({descricao}, {modo}): {obtido[0]} / {obtido[1]}")
+
+                # O evento do outro CPF no lote não pode sumir junto com o original
+                if xmls[0] == lote_original:
+                    obtido = _totais(xmls, deduplicar, indexar, CPF_OUTRO)
+                    if obtido != (Decimal('5100.00'), Decimal('765.00')):
+                        falhas.append(f"Retificação ({descricao}, {modo}, CPF {CPF_OUTRO}): "
+                                      f"esperado 5100.00 / 765.00, obtido {obtido}")
+    return falhas
+
+
+def verificar_indice_csv() -> List[str]:
+    """Compilação e consulta de IndiceCSV, e DadosComplementaresIndexados contra DadosComplementares"""
+    falhas = []
+    registros = {
+        '12345678901': ('João da Silva Santos', 'Tech Solutions Ltda', '12345678000190'),
+        '12345678905': ('Maria Oliveira Costa', '', '12345678000190'),
+        '98765432100': ('José Ção', 'Indústria ABC S.A.', '98765432000110'),
+    }
+    dependentes = {
+        '111'.ljust(11) + '22233344455': ('Ana', '2010-05-01', '3'),
+        '111'.ljust(11) + '22233344466': ('Bruno', '2012-07-15', '3'),
+        '11122233344'.ljust(11) + '55566677788': ('Carla', '2015-01-20', '4'),
+    }
+
+    with tempfile.TemporaryDirectory(prefix='s5002_') as temporario:
+        caminho = str(Path(temporario) / 'funcionarios.idx')
+        IndiceCSV.compilar(caminho, registros, 3)
+        indice = IndiceCSV(caminho)
+        for chave, campos in registros.items():
+            if indice.obter(chave) != campos:
+                falhas.append(f"IndiceCSV.obter({chave}): esperado {campos}, obtido {indice.obter(chave)}")
+        for ausente in ('00000000000', '12345678902', '999999999999', ''):
+            if indice.obter(ausente) is not None:
+                falhas.append(f"IndiceCSV.obter({ausente!r}): esperado None, obtido {indice.obter(ausente)}")
+        if list(indice) != sorted(registros.items()):
+            falhas.append(f"IndiceCSV: iteração fora de ordem ou incompleta: {list(indice)}")
+
+        caminho = str(Path(temporario) / 'dependentes.idx')
+        IndiceCSV.compilar(caminho, dependentes, 3, 11)
+        indice = IndiceCSV(caminho)
+        obtidos = dict(indice.prefixo('111'))
+        esperados = {'22233344455': dependentes['111'.ljust(11) + '22233344455'],
+                     '22233344466': dependentes['111'.ljust(11) + '22233344466']}
+        if obtidos != esperados:
+            falhas.append(f"IndiceCSV.prefixo('111'): esperado {esperados}, obtido {obtidos}")
+        if dict(indice.prefixo('999')):
+            falhas.append("IndiceCSV.prefixo('999'): esperado vazio")
+
+        # Índices compilados a partir dos CSVs de exemplo, numa cópia para não deixar .idx no repositório
+        csvs = []
+        for nome in ('exemplos_2025/nomes_para_conversor.csv', 'exemplos_csv/exemplo_dependentes.csv',
+                     'exemplos_csv/exemplo_entidades.csv'):
+            copia = Path(temporario) / Path(nome).name
+            copia.write_bytes((RAIZ / nome).read_bytes())
+            csvs.append(str(copia))
+        em_memoria = DadosComplementares(*csvs)
+        indexados = DadosComplementaresIndexados(*csvs)
+
+        # assinatura() reúne funcionário, dependentes e a tabela de entidades de cada CPF
+        cpfs = set(em_memoria.funcionarios) | set(em_memoria.dependentes) | {'00000000000'}
+        for cpf in sorted(cpfs):
+            if indexados.assinatura(cpf) != em_memoria.assinatura(cpf):
+                falhas.append(f"DadosComplementaresIndexados.assinatura({cpf}) difere de DadosComplementares")
+            for cpf_dep in sorted(em_memoria.dependentes.get(cpf, {})):
+                nome = em_memoria.obter_nome_dependente(cpf, cpf_dep)
+                if indexados.obter_nome_dependente(cpf, cpf_dep) != nome:
+                    falhas.append(f"DadosComplementaresIndexados.obter_nome_dependente({cpf}, {cpf_dep}) "
+                                  f"difere de DadosComplementares ({nome})")
+        for cnpj, entidade in sorted(em_memoria.entidades.items()):
+            nome = em_memoria.obter_nome_entidade(cnpj, entidade['tipo'])
+            if indexados.obter_nome_entidade(cnpj, entidade['tipo']) != nome:
+                falhas.append(f"DadosComplementaresIndexados.obter_nome_entidade({cnpj}) "
+                              f"difere de DadosComplementares ({nome})")
+        if not em_memoria.funcionarios or not em_memoria.dependentes or not em_memoria.entidades:
+            falhas.append("CSVs de exemplo sem funcionários, dependentes ou entidades")
+        logger.info(f"Índice CSV: {len(registros)} registros, {len(cpfs)} CPF(s) e "
+                    f"{len(em_memoria.entidades)} entidade(s) de exemplo conferidos")
+    return falhas
+
+
+def main():
+    falhas = verificar_retificacao() + verificar_indice_csv()
+    for falha in falhas:
+        logger.error(falha)
+    if falhas:
+        sys.exit(1)
+    logger.info("Todas as verificações passaram")
+
+
+if __name__ == '__main__':
+    main()